@@ -4,20 +4,30 @@ Updated for LangChain 1.0+ compatibility
 """
 
 import os
+import sys
 import asyncio
 import nest_asyncio
+from collections import deque
+from pathlib import Path
 from typing import Any
 
+# Make the repo-level `common` package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.history import HistoryCompactor, build_summary_prompt
+from common.tool_cache import tool_cache_stats
+from common.tracing import Tracer, attach, detach, format_summary, summarize_spans
+
 # Allow nested event loops (needed for Jupyter/notebooks)
 nest_asyncio.apply()
 
-# Set the OpenAI API key as an environment variable
-os.environ["OPENAI_API_KEY"] = ""
+# Set the OpenAI API key as an environment variable (unless it is already set)
+if not os.getenv("OPENAI_API_KEY"):
+    os.environ["OPENAI_API_KEY"] = ""
 
 from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, SystemMessage
+from langchain_core.callbacks import BaseCallbackHandler
 
 # Try old API imports first (simpler)
 try:
@@ -38,6 +48,9 @@ except ImportError:
     USE_NEW_API = False
     print("New API not available")
 
+# Tools (memoized) and the system prompt are shared with fastapi_service/agent_api.py
+from agent_tools import SYSTEM_PROMPT, SimpleAgentExecutor, tools, usage_attributes
+
 # Simple format function for tool messages (for old API)
 def format_to_openai_tool_messages(intermediate_steps):
     """Format intermediate steps to OpenAI tool messages."""
@@ -62,157 +75,161 @@ def format_to_openai_tool_messages(intermediate_steps):
 # Initialize LLM
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 
-tool_usage_log = []
-
-def log_tool_usage(tool_name: str, input_data: Any):
-    """Logs the tool used and its input."""
-    tool_usage_log.append({"tool": tool_name, "input": input_data})
-
-@tool
-def get_word_length(word: str) -> int:
-    """Returns the length of a word."""
-    log_tool_usage("get_word_length", word)
-    return len(word)
-
-@tool
-def calculator(expression: str) -> str:
-    """Evaluates mathematical expression"""
-    log_tool_usage("calculator", expression)
-    try:
-        maths_result = eval(expression)
-        return str(maths_result)
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-tools = [get_word_length, calculator]
-
-# Create agent based on available API
-if USE_OLD_API:
-    # Use old AgentExecutor API (simplest)
-    llm_with_tools = llm.bind_tools(tools)
-    
-    prompt = ChatPromptTemplate.from_messages(
+# Keep chat history within a token budget; older turns become a rolling summary
+history_compactor = HistoryCompactor(budget_tokens=2000, keep_recent=4)
+# Raw messages kept for the compactor (as in the agent service's window); turns
+# that fall out of it are already covered by the rolling summary
+HISTORY_WINDOW = 40
+
+def to_message_dicts(messages):
+    """LangChain messages -> OpenAI-style dicts for the compactor."""
+    roles = {"human": "user", "ai": "assistant", "system": "system"}
+    return [{"role": roles.get(m.type, m.type), "content": m.content} for m in messages]
+
+def from_message_dicts(messages):
+    """OpenAI-style dicts -> LangChain messages for the agent."""
+    classes = {"user": HumanMessage, "assistant": AIMessage, "system": SystemMessage}
+    return [classes[m["role"]](content=m["content"]) for m in messages]
+
+def summarize_turns(previous_summary: str, turns: list) -> str:
+    """Fold older turns into the running summary."""
+    return llm.invoke(build_summary_prompt(previous_summary, turns)).content or previous_summary
+
+def compact_history(chat_history, state):
+    """Fit chat history to the token budget, reusing the summary in `state`."""
+    # The window drops old turns itself, so a missing fold marker means it slid past them
+    compacted = history_compactor.compact(to_message_dicts(chat_history), state, summarize_turns,
+                                          trimmed=True)
+    return from_message_dicts(compacted)
+
+# One span per question, agent step, LLM call and tool call. Spans are kept per
+# context (concurrent sessions do not mix) and appended to a JSONL file as they end.
+tracer = Tracer(path=os.getenv("AGENT_TRACE_FILE", "agent_traces.jsonl"))
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """LLM and tool spans for the AgentExecutor / LangGraph paths (they run their own loop)."""
+
+    # Run in the caller's context (not on an executor), so a tool span made
+    # current in on_tool_start is the current span while the tool runs and
+    # the memoized tools can record their cache status on it
+    run_inline = True
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.open_spans = {}
+        self.tool_tokens = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.open_spans[run_id] = tracer.start_span("llm", "llm", parent=self.parent)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self.open_spans.pop(run_id, None)
+        if span is not None:
+            generation = response.generations[0][0] if response.generations else None
+            tracer.end_span(span, **usage_attributes(getattr(generation, "message", None)))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self.open_spans.pop(run_id, None)
+        if span is not None:
+            tracer.end_span(span, status="error", error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name", "tool")
+        span = self.open_spans[run_id] = tracer.start_span(
+            name, "tool", parent=self.parent, input=input_str)
+        self.tool_tokens[run_id] = attach(span)
+
+    def _end_tool(self, run_id, **attributes):
+        token = self.tool_tokens.pop(run_id, None)
+        if token is not None:
+            detach(token)
+        span = self.open_spans.pop(run_id, None)
+        if span is not None:
+            tracer.end_span(span, **attributes)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, status="ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, status="error", error=str(error))
+
+
+# Agent executors, one per available LangChain API. `build_agent_executor` takes
+# the model as an argument so benchmarks can drive the same flows with a
+# recorded model (see benchmarks/agent_replay.py).
+
+class GraphAgentExecutor:
+    """Simple wrapper to make LangGraph (create_agent) work like AgentExecutor."""
+
+    def __init__(self, agent_graph):
+        self.agent_graph = agent_graph
+        self.verbose = True
+
+    def invoke(self, input_dict):
+        """Invoke the agent with input dictionary."""
+        messages = input_dict.get("chat_history", []) + [HumanMessage(content=input_dict.get("input", ""))]
+        result = self.agent_graph.invoke({"messages": messages})
+
+        return {"output": self._last_ai_content(result)}
+
+    async def ainvoke(self, input_dict, config=None):
+        """Async invoke; LangGraph's tool node runs one turn's tool calls concurrently."""
+        messages = input_dict.get("chat_history", []) + [HumanMessage(content=input_dict.get("input", ""))]
+        result = await self.agent_graph.ainvoke({"messages": messages}, config=config)
+        return {"output": self._last_ai_content(result)}
+
+    @staticmethod
+    def _last_ai_content(result):
+        # Extract the last AI message content
+        for msg in reversed(result.get("messages", [])):
+            if isinstance(msg, AIMessage):
+                return msg.content or ""
+        return ""
+
+
+def build_agent_prompt(system_prompt=SYSTEM_PROMPT):
+    """Prompt of the AgentExecutor flow (history, input, then the tool scratchpad)."""
+    return ChatPromptTemplate.from_messages(
         [
             (
                 "system",
-                "You are very powerful assistant, but bad at calculating lengths of words and mathematical expressions",
+                system_prompt,
             ),
             MessagesPlaceholder(variable_name="chat_history"),
             ("user", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ]
     )
-    
-    agent = (
-        {
-            "input": lambda x: x["input"],
-            "agent_scratchpad": lambda x: format_to_openai_tool_messages(x["intermediate_steps"]),
-            "chat_history": lambda x: x["chat_history"],
-        }
-        | prompt
-        | llm_with_tools
-        | OpenAIToolsAgentOutputParser()
-    )
-    
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-    
-elif USE_NEW_API:
-    # Use new create_agent API (LangGraph-based)
-    agent_graph = create_agent(
-        model=llm,
-        tools=tools,
-        system_prompt="You are very powerful assistant, but bad at calculating lengths of words and mathematical expressions"
-    )
-    
-    # Simple wrapper to make LangGraph work like AgentExecutor
-    class SimpleAgentExecutor:
-        def __init__(self, agent_graph):
-            self.agent_graph = agent_graph
-            self.verbose = True
-            
-        def invoke(self, input_dict):
-            """Invoke the agent with input dictionary."""
-            messages = input_dict.get("chat_history", []) + [HumanMessage(content=input_dict.get("input", ""))]
-            result = self.agent_graph.invoke({"messages": messages})
-            
-            # Extract the last AI message content
-            result_messages = result.get("messages", [])
-            output = ""
-            for msg in reversed(result_messages):
-                if isinstance(msg, AIMessage):
-                    output = msg.content or ""
-                    break
-            
-            return {"output": output}
-    
-    agent_executor = SimpleAgentExecutor(agent_graph)
-    
-else:
-    # Simple agent implementation without AgentExecutor - old API style
-    tools_dict = {tool.name: tool for tool in tools}
-    
-    class SimpleAgentExecutor:
-        def __init__(self, llm, tools, system_prompt):
-            self.llm = llm.bind_tools(tools)
-            self.tools = tools_dict
-            self.system_prompt = system_prompt
-            self.verbose = True
-            
-        def invoke(self, input_dict):
-            """Simple agent loop - similar to old API style."""
-            messages = list(input_dict.get("chat_history", []))
-            user_input = input_dict.get("input", "")
-            
-            # Build message list with system prompt
-            conversation_messages = [SystemMessage(content=self.system_prompt)]
-            conversation_messages.extend(messages)
-            conversation_messages.append(HumanMessage(content=user_input))
-            
-            max_iterations = 10
-            for _ in range(max_iterations):
-                # Get LLM response
-                response = self.llm.invoke(conversation_messages)
-                conversation_messages.append(response)
-                
-                # Check if there are tool calls
-                if not response.tool_calls:
-                    # No more tool calls, return the response
-                    return {"output": response.content or ""}
-                
-                # Execute tool calls
-                for tool_call in response.tool_calls:
-                    tool_name = tool_call["name"]
-                    tool_args = tool_call.get("args", {})
-                    
-                    if tool_name in self.tools:
-                        tool_result = self.tools[tool_name].invoke(tool_args)
-                        conversation_messages.append(ToolMessage(
-                            content=str(tool_result),
-                            tool_call_id=tool_call["id"]
-                        ))
-                    else:
-                        conversation_messages.append(ToolMessage(
-                            content=f"Tool {tool_name} not found",
-                            tool_call_id=tool_call["id"]
-                        ))
-            
-            # If we've exhausted iterations, return the last response
-            last_ai_msg = None
-            for msg in reversed(conversation_messages):
-                if isinstance(msg, AIMessage):
-                    last_ai_msg = msg
-                    break
-            return {"output": last_ai_msg.content if last_ai_msg else "Error: No response generated"}
-    
-    agent_executor = SimpleAgentExecutor(
-        llm=llm,
-        tools=tools,
-        system_prompt="You are very powerful assistant, but bad at calculating lengths of words and mathematical expressions"
-    )
 
 
+def build_agent_executor(llm, tools, system_prompt=SYSTEM_PROMPT, api=None):
+    """Agent for `llm` and `tools` on the given API ("old", "new" or "simple"; default: best available)."""
+    api = api or ("old" if USE_OLD_API else "new" if USE_NEW_API else "simple")
+    if api == "old":
+        # Use old AgentExecutor API (simplest)
+        llm_with_tools = llm.bind_tools(tools)
+        agent = (
+            {
+                "input": lambda x: x["input"],
+                "agent_scratchpad": lambda x: format_to_openai_tool_messages(x["intermediate_steps"]),
+                "chat_history": lambda x: x["chat_history"],
+            }
+            | build_agent_prompt(system_prompt)
+            | llm_with_tools
+            | OpenAIToolsAgentOutputParser()
+        )
+        return AgentExecutor(agent=agent, tools=tools, verbose=True)
+    if api == "new":
+        # Use new create_agent API (LangGraph-based)
+        return GraphAgentExecutor(create_agent(model=llm, tools=tools, system_prompt=system_prompt))
+    return SimpleAgentExecutor(llm=llm, tools=tools, system_prompt=system_prompt, tracer=tracer)
+
+
+agent_executor = build_agent_executor(llm, tools)
+
 async def main():
-    chat_history = []
+    chat_history = deque(maxlen=HISTORY_WINDOW)
+    history_state = history_compactor.state_for("repl")
     while True:
         print("Enter question or type exit to quit")
         input1 = input("User: ")
@@ -221,27 +238,35 @@ async def main():
             print("Exiting the chat.")
             break
 
-        # Clear tool usage log for this interaction
-        tool_usage_log.clear()
-        
-        # Invoke agent (synchronous call)
-        result = agent_executor.invoke({"input": input1, "chat_history": chat_history})
+        # One trace per question: history compaction, agent steps, LLM and tool calls
+        with tracer.span("question", "agent", input=input1) as root:
+            with tracer.span("compact history", "step"):
+                history = compact_history(chat_history, history_state)
+
+            # Invoke agent (async: independent tool calls of a turn run concurrently)
+            config = {"callbacks": [TraceCallbackHandler(root)]} if (USE_OLD_API or USE_NEW_API) else None
+            result = await agent_executor.ainvoke(
+                {"input": input1, "chat_history": history}, config=config)
 
         # Update chat history with user input and AI response
         chat_history.append(HumanMessage(content=input1))
         chat_history.append(AIMessage(content=result["output"]))
-        
-        # Keep chat history manageable (optional: limit to last N messages)
-        if len(chat_history) > 20:  # Keep last 10 exchanges
-            chat_history = chat_history[-20:]
-        
+
+        spans = tracer.spans(root.trace_id)
+        tool_spans = [s for s in spans if s["kind"] == "tool"]
         print("\nTools Used:")
-        if tool_usage_log:
-            for usage in tool_usage_log:
-                print(f"Tool: {usage['tool']}, Input: {usage['input']}")
+        if tool_spans:
+            for span in tool_spans:
+                print(f"Tool: {span['name']}, Input: {span['attributes'].get('input')}, "
+                      f"{span['duration_ms']:.1f} ms"
+                      + (" (cached)" if span["attributes"].get("cached") else ""))
+            for name, stats in tool_cache_stats().items():
+                print(f"Tool cache {name}: {stats['hits']} hits / {stats['misses']} misses "
+                      f"(hit rate {stats['hit_rate']:.0%})")
         else:
             print("No tools were used in this interaction.")
-            
+
+        print("\n" + format_summary(summarize_spans(spans)))
         print("\n\n Message:\n", result["output"])
 
 if __name__ == "__main__":
@@ -0,0 +1,177 @@
+"""
+Tools and the tool-calling loop shared by the single agent REPL
+(Langchain_SingleAgent.py) and the agent service (fastapi_service/agent_api.py).
+
+Tool results are memoized per tool (canonical arguments -> result). Set
+TOOL_CACHE_DB to a SQLite path to share results between agent workers.
+
+`SimpleAgentExecutor.steps` is the one agent loop: it yields an event per
+model call and tool result, so the REPL (`ainvoke`) and the service's
+streaming endpoint run exactly the same steps.
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, ContextManager, List, Optional, Tuple
+
+# Make the repo-level `common` package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.safe_eval import SafeEvaluator  # noqa: E402
+from common.tool_cache import memoize_tool  # noqa: E402
+from common.tool_runner import ToolRunner  # noqa: E402
+from common.tracing import Span, Tracer, activate, current_span  # noqa: E402
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage  # noqa: E402
+from langchain_core.tools import tool  # noqa: E402
+
+SYSTEM_PROMPT = ("You are very powerful assistant, but bad at calculating lengths of words "
+                 "and mathematical expressions")
+
+TOOL_CACHE_DB = os.getenv("TOOL_CACHE_DB") or None
+
+
+def usage_attributes(message) -> dict:
+    """Token usage of one AI message, as span attributes."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    return {"input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0)}
+
+
+def openai_usage(message) -> Optional[dict]:
+    """LangChain `usage_metadata` in OpenAI `usage` shape (for metrics and responses)."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    details = usage.get("input_token_details") or {}
+    return {"prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "prompt_tokens_details": {"cached_tokens": details.get("cache_read", 0)}}
+
+
+def log_tool_usage(tool_name: str, input_data: Any, cached: bool = False):
+    """Records the tool input and whether the result came from the tool cache on its span."""
+    span = current_span()
+    if span is not None and span.kind == "tool":
+        span.set(input=input_data, cached=cached)
+
+
+@tool
+@memoize_tool(ttl=24 * 3600, max_entries=1024, disk_path=TOOL_CACHE_DB, on_call=log_tool_usage)
+def get_word_length(word: str) -> int:
+    """Returns the length of a word."""
+    return len(word)
+
+
+# Whitelisted arithmetic only (no eval); compiled forms and results are cached,
+# so arithmetic repeated across a large question set is computed once
+safe_evaluator = SafeEvaluator()
+
+
+@tool
+@memoize_tool(ttl=24 * 3600, max_entries=4096, disk_path=TOOL_CACHE_DB, on_call=log_tool_usage)
+def calculator(expression: str = "", expressions: Optional[List[str]] = None) -> str:
+    """Evaluates mathematical expressions: numbers, + - * / // % **, parentheses,
+    sqrt, log, exp, sin, cos, tan, abs, round, min, max, floor, ceil, factorial, pi, e.
+    Pass several independent expressions in `expressions` to evaluate them in one call."""
+    if expressions:
+        results = safe_evaluator.evaluate_many(expressions)
+        return "\n".join(f"{expr} = {result}" for expr, result in zip(expressions, results))
+    return safe_evaluator.evaluate(expression)
+
+
+tools = [get_word_length, calculator]
+
+
+# ----------------------------
+# Agent loop
+# ----------------------------
+
+Event = Tuple[str, dict]
+
+
+class SimpleAgentExecutor:
+    """Simple agent implementation without AgentExecutor - old API style."""
+
+    def __init__(self, llm, tools, system_prompt, max_workers=8, tool_timeout=30.0,
+                 max_iterations: int = 10, tracer: Optional[Tracer] = None,
+                 tool_runner: Optional[ToolRunner] = None,
+                 upstream: Optional[Callable[[], ContextManager]] = None):
+        self.llm = llm.bind_tools(tools)
+        self.model = getattr(llm, "model_name", None)
+        # Runs the tool calls of one turn concurrently: async tools on the
+        # event loop, sync tools on a bounded thread pool, each with a timeout
+        self.tool_runner = tool_runner or ToolRunner(tools, max_workers=max_workers,
+                                                     timeout=tool_timeout)
+        self.system_prompt = system_prompt
+        self.max_iterations = max_iterations
+        self.tracer = tracer or Tracer()
+        # Wraps every model call, e.g. to time it for the service's metrics
+        self.upstream = upstream or contextlib.nullcontext
+        self.verbose = True
+
+    async def steps(self, messages: List, max_iterations: Optional[int] = None,
+                    parent: Optional[Span] = None) -> AsyncIterator[Event]:
+        """
+        Run the tool-calling loop over `messages`, yielding an `llm` event per
+        model call, a `tool` event per tool result and a final `done` event.
+
+        Spans go under `parent` (default: the current span) and are only made
+        current between yields, never while the consumer runs.
+        """
+        max_iterations = max_iterations or self.max_iterations
+        conversation = list(messages)
+        for step in range(1, max_iterations + 1):
+            step_span = self.tracer.start_span(f"step {step}", "step", parent=parent)
+            try:
+                started = time.perf_counter()
+                with activate(step_span), self.tracer.span("llm", "llm", model=self.model) as llm_span:
+                    with self.upstream():
+                        response = await self.llm.ainvoke(conversation)
+                    llm_span.set(tool_calls=len(response.tool_calls), **usage_attributes(response))
+                conversation.append(response)
+                yield "llm", {
+                    "step": step,
+                    "content": response.content or "",
+                    "tool_calls": [{"name": c["name"], "args": c["args"], "id": c.get("id")}
+                                   for c in response.tool_calls],
+                    "usage": openai_usage(response),
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                }
+                if not response.tool_calls:
+                    yield "done", {"output": response.content or "", "steps": step}
+                    return
+
+                # This step's tool calls run concurrently (one span each); results come
+                # back in call order, so the tool messages line up with `tool_calls`
+                with activate(step_span):
+                    results = await self.tool_runner.run(response.tool_calls)
+                for result in results:
+                    conversation.append(ToolMessage(content=result.content,
+                                                    tool_call_id=result.call_id))
+                    yield "tool", {"step": step, "name": result.name, "id": result.call_id,
+                                   "status": result.status, "content": result.content,
+                                   "elapsed_ms": round(result.elapsed * 1000, 1)}
+            finally:
+                self.tracer.end_span(step_span)
+
+        # Out of iterations: answer with the last thing the model said
+        last = next((m for m in reversed(conversation) if isinstance(m, AIMessage)), None)
+        yield "done", {"output": last.content if last is not None else "Error: No response generated",
+                       "steps": max_iterations, "truncated": True}
+
+    def invoke(self, input_dict):
+        """Blocking wrapper around `ainvoke` (nest_asyncio allows it inside a running loop)."""
+        return asyncio.run(self.ainvoke(input_dict))
+
+    async def ainvoke(self, input_dict, config=None):
+        """Run `steps` to the end for one question and return its answer."""
+        conversation_messages = [SystemMessage(content=self.system_prompt)]
+        conversation_messages.extend(input_dict.get("chat_history", []))
+        conversation_messages.append(HumanMessage(content=input_dict.get("input", "")))
+        async for event, data in self.steps(conversation_messages):
+            if event == "done":
+                return {"output": data["output"]}
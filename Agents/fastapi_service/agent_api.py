@@ -0,0 +1,333 @@
+"""
+Multi-session agent service.
+
+The tool-calling agent from Langchain_SingleAgent.py behind FastAPI, built
+like chat-applications/fastapi_service/chat_api.py:
+
+- server-side sessions (memory or SQLite); clients send only the new turn,
+  and history is compacted to a token budget with a rolling summary
+- the agent loop is `SimpleAgentExecutor.steps` from agent_tools.py, the same
+  loop the REPL runs: LLM calls go through one pooled client, and the tool
+  calls of a step run concurrently (`common.tool_runner`)
+- a session runs one turn at a time and the worker runs at most
+  AGENT_MAX_CONCURRENCY turns; extra requests get 429 / 503 (`common.limits`)
+- `/messages/stream` sends each step as it happens (SSE `llm` and `tool`
+  events, then `done`); each turn is traced (`common.tracing`)
+
+Run with: uvicorn agent_api:app --port 8001
+"""
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, List, Optional, Tuple
+from contextlib import AsyncExitStack, asynccontextmanager
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Make the repo-level `common` package and the shared agent tools importable
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.history import HistoryCompactor, build_summary_prompt  # noqa: E402
+from common.http_client import OpenAIClientManager  # noqa: E402
+from common.limits import ConcurrencyLimiter, LimiterBusy  # noqa: E402
+from common.metrics import MetricsMiddleware, ServiceMetrics  # noqa: E402
+from common.prompt_layout import usage_summary  # noqa: E402
+from common.sessions import SessionNotFound, make_session_store  # noqa: E402
+from common.tool_cache import tool_cache_stats  # noqa: E402
+from common.tool_runner import ToolRunner  # noqa: E402
+from common.tracing import Tracer, activate, summarize_spans  # noqa: E402
+
+from agent_tools import SYSTEM_PROMPT, SimpleAgentExecutor, tools  # noqa: E402
+
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+# Load environment variables
+load_dotenv()
+
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gpt-4o-mini")
+
+# One pooled async client per worker, opened and closed by the app lifespan;
+# the LangChain model shares its connection pool
+client_manager = OpenAIClientManager(asynchronous=True)
+client = None
+agent = None
+
+
+def init_openai_client():
+    api_key = os.getenv("OPENAI_API_KEY", "")
+    if not api_key:
+        raise ValueError("Please set your OPENAI_API_KEY in a .env file")
+    return api_key
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, agent
+    async with client_manager.lifespan(init_openai_client()) as opened:
+        client = opened
+        llm = ChatOpenAI(model=AGENT_MODEL, temperature=0, api_key=opened.api_key,
+                         base_url=str(opened.base_url),
+                         http_async_client=client_manager.http,
+                         timeout=client_manager.timeout("agent_llm"))
+        agent = SimpleAgentExecutor(
+            llm, tools, SYSTEM_PROMPT, tracer=tracer, tool_runner=tool_runner,
+            upstream=lambda: metrics.upstream("agent_llm", AGENT_MODEL))
+        yield
+        client = agent = None
+    tool_runner.close()
+    tracer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Latency histograms, token counters and in-flight gauges for /metrics
+metrics = ServiceMetrics("agent")
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# Server-side sessions: "memory" (LRU, default) or "sqlite" (local file)
+SESSION_STORE = os.getenv("AGENT_SESSION_STORE", "memory")
+SESSION_DB = os.getenv("AGENT_SESSION_DB", "agent_sessions.db")
+# How many recent turns (besides the system prompt) are sent upstream
+HISTORY_WINDOW = int(os.getenv("AGENT_HISTORY_WINDOW", "40"))
+
+sessions = make_session_store(
+    SESSION_STORE, **({"path": SESSION_DB} if SESSION_STORE == "sqlite" else {}))
+
+# Prompt token budget: older turns are folded into a rolling summary
+TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET", "2000"))
+SUMMARY_MODEL = os.getenv("AGENT_SUMMARY_MODEL", "gpt-4o-mini")
+compactor = HistoryCompactor(
+    budget_tokens=TOKEN_BUDGET,
+    keep_recent=int(os.getenv("AGENT_KEEP_RECENT", "4")))
+
+# A session runs AGENT_SESSION_CONCURRENCY turns at a time (its history is
+# shared); the worker runs at most AGENT_MAX_CONCURRENCY, queueing the rest
+# for up to AGENT_QUEUE_TIMEOUT seconds
+limiter = ConcurrencyLimiter(
+    max_concurrent=int(os.getenv("AGENT_MAX_CONCURRENCY", "32")),
+    per_session=int(os.getenv("AGENT_SESSION_CONCURRENCY", "1")),
+    queue_timeout=float(os.getenv("AGENT_QUEUE_TIMEOUT", "10")))
+
+# Upper bound on the LLM / tool steps a client may ask for in one turn
+MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "25"))
+
+# Tool calls of one step run concurrently; sync tools share a bounded pool
+tool_runner = ToolRunner(tools, max_workers=int(os.getenv("AGENT_TOOL_WORKERS", "16")),
+                         timeout=float(os.getenv("AGENT_TOOL_TIMEOUT", "30")))
+
+# One trace per turn; set AGENT_TRACE_FILE to also append spans to a JSONL file
+tracer = Tracer(path=os.getenv("AGENT_TRACE_FILE") or None)
+
+Event = Tuple[str, dict]
+
+
+class CreateSessionRequest(BaseModel):
+    system_prompt: Optional[str] = SYSTEM_PROMPT
+
+
+class AgentTurnRequest(BaseModel):
+    message: str
+    max_iterations: int = Field(10, ge=1, le=MAX_ITERATIONS)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events: AsyncIterator[str],
+                 background: Optional[BackgroundTask] = None) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
+
+def busy_status(error: LimiterBusy) -> int:
+    """429 when this session already has a turn running, 503 when the worker is full."""
+    return 429 if error.scope == "session" else 503
+
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+async def summarize_turns(previous_summary: str, turns: List[dict]) -> str:
+    """Fold older turns into the running summary (used by the compactor)."""
+    with metrics.upstream("summary", SUMMARY_MODEL):
+        response = await client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=build_summary_prompt(previous_summary, turns),  # type: ignore
+            temperature=0,
+            timeout=client_manager.timeout("summary")
+        )
+    metrics.record_usage(SUMMARY_MODEL, response.usage)
+    return response.choices[0].message.content or previous_summary
+
+
+def require_session(session_id: str) -> None:
+    try:
+        sessions.history(session_id, 1)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+def record_turn(session_id: str, message: str, reply: str) -> None:
+    """Append the user turn and the final answer (tool traffic is not stored)."""
+    sessions.append(session_id, {"role": "user", "content": message})
+    sessions.append(session_id, {"role": "assistant", "content": reply})
+
+
+async def run_turn(session_id: str, request: AgentTurnRequest) -> AsyncIterator[Event]:
+    """
+    One agent turn; the caller must hold the session's limiter slot.
+
+    The history window is read once the session slot is held, and the turn is
+    stored only if the agent finishes. `done` carries the trace summary.
+    """
+    started = time.perf_counter()
+    root = tracer.start_span("turn", "agent", session_id=session_id, input=request.message)
+    done = None
+    try:
+        with activate(root), tracer.span("compact history", "step"):
+            history = sessions.window(session_id, HISTORY_WINDOW)
+            messages = await compactor.acompact(
+                history + [{"role": "user", "content": request.message}],
+                compactor.state_for(session_id), summarize_turns, trimmed=True)
+        async for event, data in agent.steps(messages, request.max_iterations, parent=root):
+            if event == "llm":
+                metrics.record_usage(AGENT_MODEL, data["usage"])
+                data["usage"] = usage_summary(data["usage"])
+            if event == "done":
+                done = data
+            else:
+                yield event, data
+    except BaseException as e:
+        root.set(status="error", error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        tracer.end_span(root)
+    record_turn(session_id, request.message, done["output"])
+    done["total_ms"] = elapsed_ms(started)
+    done["trace"] = summarize_spans(tracer.spans(root.trace_id))
+    yield "done", done
+
+
+async def turn_events(session_id: str, request: AgentTurnRequest) -> AsyncIterator[Event]:
+    """`run_turn` under the session / server limits (raises `LimiterBusy`)."""
+    async with limiter.slot(session_id):
+        async for event, data in run_turn(session_id, request):
+            yield event, data
+
+
+@app.get("/")
+async def read_root():
+    return {"message": "Agent API is running"}
+
+
+@app.get("/pool/stats")
+async def pool_stats():
+    """Upstream connection pool usage for this worker."""
+    return client_manager.stats()
+
+
+@app.get("/limits/stats")
+async def limits_stats():
+    """Running / queued turns and rejections by scope for this worker."""
+    return limiter.stats()
+
+
+@app.get("/tools/stats")
+async def tools_stats():
+    """Hit rates of the memoized tools."""
+    return tool_cache_stats()
+
+
+@app.get("/metrics")
+async def metrics_endpoint(format: str = "prometheus"):
+    """Prometheus text by default; `?format=json` adds p50/p95/p99 estimates."""
+    if format == "json":
+        return metrics.registry.snapshot()
+    return PlainTextResponse(metrics.registry.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+
+# ----------------------------
+# Sessions: clients send only the new turn
+# ----------------------------
+
+@app.post("/sessions")
+def create_session(request: CreateSessionRequest):
+    return {"session_id": sessions.create(request.system_prompt)}
+
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str, last_n: Optional[int] = None):
+    try:
+        return {"session_id": session_id, "messages": sessions.history(session_id, last_n)}
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    sessions.delete(session_id)
+    compactor.drop_state(session_id)
+    return {"deleted": session_id}
+
+
+@app.post("/sessions/{session_id}/messages")
+async def session_turn(session_id: str, request: AgentTurnRequest):
+    """Run one turn; the response lists the intermediate steps it took."""
+    require_session(session_id)
+    steps, done = [], {}
+    try:
+        async for event, data in turn_events(session_id, request):
+            if event == "done":
+                done = data
+            else:
+                steps.append({"event": event, **data})
+    except LimiterBusy as e:
+        raise HTTPException(status_code=busy_status(e), detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"response": done.pop("output"), "intermediate_steps": steps, **done}
+
+
+@app.post("/sessions/{session_id}/messages/stream")
+async def session_turn_stream(session_id: str, request: AgentTurnRequest):
+    """
+    Stream the turn as Server-Sent Events: `llm` (model output and tool calls),
+    `tool` (each result), then `done`, or `error`. The limiter slot is taken
+    before the response starts, so a busy session or worker gets a real 429 /
+    503. A client disconnect cancels the turn and frees its slot.
+    """
+    require_session(session_id)
+    slot = AsyncExitStack()
+    try:
+        await slot.enter_async_context(limiter.slot(session_id))
+    except LimiterBusy as e:
+        raise HTTPException(status_code=busy_status(e), detail=str(e))
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in run_turn(session_id, request):
+                yield sse_event(event, data)
+        except Exception as e:
+            # Headers are already sent, so errors travel in-band
+            yield sse_event("error", {"detail": str(e), "status": 500})
+        finally:
+            await slot.aclose()
+
+    # Also release from a background task, in case the stream never started
+    # (closing the stack twice is a no-op)
+    return sse_response(events(), background=BackgroundTask(slot.aclose))
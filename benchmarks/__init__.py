@@ -0,0 +1 @@
+"""Local load-testing tools: an OpenAI-compatible mock server and a load generator."""
@@ -0,0 +1,439 @@
+"""
+Record / replay harness for offline agent benchmarks.
+
+Live model calls make the agent loop in Agents/Langchain_SingleAgent.py
+impossible to profile: seconds of model latency (and its variance) hide the
+milliseconds our own orchestration spends per step. This module:
+
+- `record`: runs a question set through the agent with the real model and
+  writes every LLM request / response and tool input / output, with their
+  latencies, to a JSON cassette
+- `replay`: runs the same flows offline from the cassette, at full speed or
+  with the recorded latencies scaled by `--latency-scale`
+- the replay report splits each turn's wall time into model time, tool time
+  and orchestration overhead (everything else), per turn and per step, and
+  micro-benchmarks the per-step pieces: prompt formatting,
+  `format_to_openai_tool_messages`, output parsing and request serialization
+
+Any executor from `build_agent_executor` can be driven (`--api simple`,
+`old` for AgentExecutor, `new` for LangGraph's create_agent); a cassette
+recorded with one API replays only on the same API, because the requests
+differ.
+
+    python -m benchmarks.agent_replay record --cassette results/agent.json --api simple
+    python -m benchmarks.agent_replay replay --cassette results/agent.json --repeat 20
+    python -m benchmarks.agent_replay replay --cassette results/agent.json --latency-scale 1 --out results/agent_replay.json
+
+Requests are matched by a hash of their messages (type, content, tool calls;
+not message ids or metadata) and tool schemas; identical requests replay
+their recorded responses in order. The harness's own lookups count as model
+/ tool time, so the overhead figures are the agent's alone.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (AIMessage, BaseMessage, HumanMessage, convert_to_openai_messages,
+                                     message_to_dict, messages_from_dict)
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from benchmarks.loadgen import git_commit, summarize_values
+from common.cache import cache_key
+from common.metrics import BusyTime
+
+AGENTS_DIR = Path(__file__).resolve().parents[1] / "Agents"
+
+QUESTIONS = [
+    "How many letters are in the word 'orchestration'?",
+    "What is 17 * 23 + sqrt(144)?",
+    "Which is longer, 'latency' or 'throughput', and by how many letters?",
+    "Compute 2 ** 20 and the length of the word 'benchmark'.",
+]
+
+
+class CassetteMiss(KeyError):
+    """Raised on replay when a request was never recorded."""
+
+
+# ----------------------------
+# Cassette
+# ----------------------------
+
+def canonical_messages(messages: List[BaseMessage]) -> List[dict]:
+    """What identifies a request: message types, contents and tool calls (no ids or metadata)."""
+    canonical = []
+    for m in messages:
+        entry = {"type": m.type, "content": m.content}
+        if getattr(m, "tool_calls", None):
+            entry["tool_calls"] = [[c["name"], c["args"], c.get("id")] for c in m.tool_calls]
+        if getattr(m, "tool_call_id", None):
+            entry["tool_call_id"] = m.tool_call_id
+        canonical.append(entry)
+    return canonical
+
+
+class Cassette:
+    """Recorded LLM and tool interactions, keyed by request hash, in one JSON file."""
+
+    def __init__(self, path: str, meta: Optional[dict] = None):
+        self.path = path
+        self.meta = meta or {}
+        self.entries: Dict[str, Dict[str, List[dict]]] = {"llm": {}, "tool": {}}
+        self._cursors: Dict[Tuple[str, str], int] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        cassette = cls(path, data.get("meta"))
+        cassette.entries = {"llm": data.get("llm", {}), "tool": data.get("tool", {})}
+        return cassette
+
+    def save(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "meta": self.meta, **self.entries}, f, indent=1, default=str)
+
+    def add(self, kind: str, key: str, request: Any, response: Any, latency: float) -> None:
+        self.entries[kind].setdefault(key, []).append(
+            {"request": request, "response": response, "latency": round(latency, 6)})
+
+    def take(self, kind: str, key: str) -> dict:
+        """Next recorded entry for `key`; the last one repeats once they run out."""
+        recorded = self.entries[kind].get(key)
+        if not recorded:
+            raise CassetteMiss(f"no recorded {kind} response for request {key[:12]}; "
+                               f"re-record the cassette (same --api and questions)")
+        index = self._cursors.get((kind, key), 0)
+        self._cursors[(kind, key)] = index + 1
+        return recorded[min(index, len(recorded) - 1)]
+
+    def rewind(self) -> None:
+        self._cursors.clear()
+
+
+class Timings:
+    """Time spent waiting on the model and on tools during one run."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.external = BusyTime()          # model or tool in flight (overlaps counted once)
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
+        self.tool_seconds = 0.0
+        self.tool_calls = 0
+
+    def __enter__(self) -> "Timings":
+        self.external.enter(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.external.exit(time.perf_counter())
+
+
+# ----------------------------
+# Recording / replaying model and tools
+# ----------------------------
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model that records `inner`'s responses, or replays them from the cassette."""
+
+    cassette: Any
+    mode: str = "replay"                  # "record" or "replay"
+    inner: Any = None                     # the real model (record mode)
+    latency_scale: float = 0.0            # replay: sleep recorded latency * scale
+    timings: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _request(self, messages: List[BaseMessage], kwargs: dict) -> Tuple[str, List[dict]]:
+        canonical = canonical_messages(messages)
+        tools = [t.get("function", t).get("name") for t in kwargs.get("tools") or []]
+        return cache_key("llm", canonical, kwargs.get("tools")), canonical + [{"tools": tools}]
+
+    def _result(self, message: AIMessage, elapsed: float) -> ChatResult:
+        self.timings.llm_seconds += elapsed
+        self.timings.llm_calls += 1
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        with self.timings:
+            key, request = self._request(messages, kwargs)
+            if self.mode == "record":
+                message = self.inner.bind(**kwargs).invoke(messages, stop=stop)
+                self.cassette.add("llm", key, request, message_to_dict(message),
+                                  time.perf_counter() - started)
+            else:
+                entry = self.cassette.take("llm", key)
+                message = messages_from_dict([entry["response"]])[0]
+                if self.latency_scale:
+                    time.sleep(entry["latency"] * self.latency_scale)
+        return self._result(message, time.perf_counter() - started)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        with self.timings:
+            key, request = self._request(messages, kwargs)
+            if self.mode == "record":
+                message = await self.inner.bind(**kwargs).ainvoke(messages, stop=stop)
+                self.cassette.add("llm", key, request, message_to_dict(message),
+                                  time.perf_counter() - started)
+            else:
+                entry = self.cassette.take("llm", key)
+                message = messages_from_dict([entry["response"]])[0]
+                if self.latency_scale:
+                    await asyncio.sleep(entry["latency"] * self.latency_scale)
+        return self._result(message, time.perf_counter() - started)
+
+
+def cassette_tool(original: Any, cassette: Cassette, mode: str, latency_scale: float,
+                  timings: Timings) -> StructuredTool:
+    """`original` with its calls recorded to / replayed from the cassette."""
+    def account(started: float) -> None:
+        timings.tool_seconds += time.perf_counter() - started
+        timings.tool_calls += 1
+
+    def run(**kwargs):
+        started = time.perf_counter()
+        with timings:
+            key = cache_key("tool", original.name, kwargs)
+            if mode == "record":
+                output = original.invoke(kwargs)
+                cassette.add("tool", key, kwargs, output, time.perf_counter() - started)
+            else:
+                entry = cassette.take("tool", key)
+                output = entry["response"]
+                if latency_scale:
+                    time.sleep(entry["latency"] * latency_scale)
+        account(started)
+        return output
+
+    async def arun(**kwargs):
+        started = time.perf_counter()
+        with timings:
+            key = cache_key("tool", original.name, kwargs)
+            if mode == "record":
+                output = await original.ainvoke(kwargs)
+                cassette.add("tool", key, kwargs, output, time.perf_counter() - started)
+            else:
+                entry = cassette.take("tool", key)
+                output = entry["response"]
+                if latency_scale:
+                    await asyncio.sleep(entry["latency"] * latency_scale)
+        account(started)
+        return output
+
+    return StructuredTool.from_function(func=run, coroutine=arun, name=original.name,
+                                        description=original.description,
+                                        args_schema=original.args_schema)
+
+
+# ----------------------------
+# Running the agent
+# ----------------------------
+
+def load_agent():
+    """Import the agent script (its executors, prompt and tools) without writing traces."""
+    os.environ.setdefault("AGENT_TRACE_FILE", "")
+    sys.path.append(str(AGENTS_DIR))
+    import Langchain_SingleAgent as agent_module
+    return agent_module
+
+
+async def run_questions(agent_module: Any, cassette: Cassette, mode: str, api: Optional[str],
+                        questions: List[str], inner: Any = None,
+                        latency_scale: float = 0.0) -> List[Dict[str, Any]]:
+    """One pass over `questions` (one conversation); per-turn wall / model / tool time."""
+    cassette.rewind()
+    timings = Timings()
+    model = CassetteChatModel(cassette=cassette, mode=mode, inner=inner,
+                              latency_scale=latency_scale, timings=timings)
+    tools = [cassette_tool(t, cassette, mode, latency_scale, timings) for t in agent_module.tools]
+    executor = agent_module.build_agent_executor(model, tools, api=api)
+    if hasattr(executor, "verbose"):
+        executor.verbose = False
+
+    turns, history = [], []
+    for question in questions:
+        timings.reset()
+        started = time.perf_counter()
+        result = await executor.ainvoke({"input": question, "chat_history": history})
+        wall = time.perf_counter() - started
+
+        history = history + [HumanMessage(content=question), AIMessage(content=result["output"])]
+        overhead = wall - timings.external.seconds
+        turns.append({
+            "question": question,
+            "wall_s": wall,
+            "llm_s": timings.llm_seconds, "llm_calls": timings.llm_calls,
+            "tool_s": timings.tool_seconds, "tool_calls": timings.tool_calls,
+            "overhead_s": overhead,
+            "overhead_per_step_s": overhead / max(timings.llm_calls, 1),
+        })
+    if hasattr(executor, "tool_runner"):
+        executor.tool_runner.close()
+    return turns
+
+
+# ----------------------------
+# Per-step micro-benchmarks
+# ----------------------------
+
+def _per_call_us(fn: Callable[[], Any]) -> float:
+    number, seconds = timeit.Timer(fn).autorange()
+    return round(seconds / number * 1e6, 2)
+
+
+def micro_benchmarks(agent_module: Any, cassette: Cassette) -> Dict[str, float]:
+    """Cost of each orchestration piece per step (µs), on the largest recorded request."""
+    recorded = [entry for entries in cassette.entries["llm"].values() for entry in entries]
+    if not recorded:
+        return {}
+    responses = [messages_from_dict([e["response"]])[0] for e in recorded]
+    steps = [(m, "42") for m in responses if m.tool_calls]
+    scratchpad = agent_module.format_to_openai_tool_messages(steps)
+    history = [HumanMessage(content=q) for q in cassette.meta.get("questions", [])[:-1]]
+    prompt = agent_module.build_agent_prompt()
+    messages = prompt.format_messages(input="question", chat_history=history,
+                                      agent_scratchpad=scratchpad)
+    step_message = next((m for m in responses if m.tool_calls), responses[-1])
+
+    try:
+        from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
+        parser, parser_name = OpenAIToolsAgentOutputParser(), "parse (OpenAIToolsAgentOutputParser)"
+    except ImportError:
+        from langchain_core.output_parsers.openai_tools import JsonOutputToolsParser
+        parser, parser_name = JsonOutputToolsParser(), "parse (JsonOutputToolsParser)"
+
+    return {
+        "format_to_openai_tool_messages": _per_call_us(
+            lambda: agent_module.format_to_openai_tool_messages(steps)),
+        "format prompt messages": _per_call_us(
+            lambda: prompt.format_messages(input="question", chat_history=history,
+                                           agent_scratchpad=scratchpad)),
+        parser_name: _per_call_us(lambda: parser.invoke(step_message)),
+        "serialize request (convert_to_openai_messages)": _per_call_us(
+            lambda: convert_to_openai_messages(messages)),
+        "tool schemas (convert_to_openai_tool)": _per_call_us(
+            lambda: [convert_to_openai_tool(t) for t in agent_module.tools]),
+        "request hash (canonical messages)": _per_call_us(
+            lambda: cache_key("llm", canonical_messages(messages))),
+    }
+
+
+def report(turns: List[Dict[str, Any]], micro: Dict[str, float], settings: dict) -> Dict[str, Any]:
+    def total(key: str) -> float:
+        return sum(t[key] for t in turns)
+    steps = total("llm_calls")
+    return {
+        "settings": settings,
+        "git_commit": git_commit(),
+        "turns": len(turns),
+        "steps": steps,
+        "wall": summarize_values([t["wall_s"] for t in turns]),
+        "overhead_per_turn": summarize_values([t["overhead_s"] for t in turns]),
+        "overhead_per_step": summarize_values([t["overhead_per_step_s"] for t in turns]),
+        "share": {
+            "llm": round(total("llm_s") / total("wall_s"), 4) if turns else None,
+            "tool": round(total("tool_s") / total("wall_s"), 4) if turns else None,
+            "overhead": round(total("overhead_s") / total("wall_s"), 4) if turns else None,
+        },
+        "micro_us": micro,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"{result['turns']} turns, {result['steps']} steps "
+          f"(api={result['settings']['api']}, latency scale {result['settings']['latency_scale']})")
+    for name in ("wall", "overhead_per_turn", "overhead_per_step"):
+        s = result[name]
+        print(f"  {name:<20} mean {s['mean_ms']} ms  p50 {s['p50_ms']} ms  p95 {s['p95_ms']} ms")
+    share = result["share"]
+    print(f"  share of wall time: llm {share['llm']:.1%}, tools {share['tool']:.1%}, "
+          f"orchestration {share['overhead']:.1%}")
+    print("  per-step pieces (µs per call):")
+    for name, us in result["micro_us"].items():
+        print(f"    {name:<48}{us:>10.2f}")
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Record / replay agent runs and measure orchestration overhead.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Run questions with the real model and write a cassette")
+    rec.add_argument("--cassette", required=True)
+    rec.add_argument("--api", choices=("simple", "old", "new"))
+    rec.add_argument("--model", default="gpt-4o-mini")
+    rec.add_argument("--questions", help="Text file, one question per line (default: built-in set)")
+
+    rep = sub.add_parser("replay", help="Replay a cassette offline and report overhead")
+    rep.add_argument("--cassette", required=True)
+    rep.add_argument("--latency-scale", type=float, default=0.0,
+                     help="Sleep recorded latency * scale per call (0 = full speed)")
+    rep.add_argument("--repeat", type=int, default=10, help="Passes over the question set")
+    rep.add_argument("--warmup", type=int, default=1)
+    rep.add_argument("--out", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    agent_module = load_agent()
+
+    if args.command == "record":
+        questions = QUESTIONS
+        if args.questions:
+            with open(args.questions, encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        cassette = Cassette(args.cassette, meta={"api": args.api, "model": args.model,
+                                                 "questions": questions,
+                                                 "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        inner = agent_module.ChatOpenAI(model=args.model, temperature=0)
+        turns = asyncio.run(run_questions(agent_module, cassette, "record", args.api,
+                                          questions, inner=inner))
+        cassette.save()
+        print(f"Recorded {len(turns)} turns, {sum(t['llm_calls'] for t in turns)} LLM calls, "
+              f"{sum(t['tool_calls'] for t in turns)} tool calls -> {args.cassette}")
+        return
+
+    cassette = Cassette.load(args.cassette)
+    api, questions = cassette.meta.get("api"), cassette.meta.get("questions", QUESTIONS)
+
+    async def passes() -> List[Dict[str, Any]]:
+        for _ in range(args.warmup):
+            await run_questions(agent_module, cassette, "replay", api, questions,
+                                latency_scale=args.latency_scale)
+        turns = []
+        for _ in range(args.repeat):
+            turns += await run_questions(agent_module, cassette, "replay", api, questions,
+                                         latency_scale=args.latency_scale)
+        return turns
+
+    turns = asyncio.run(passes())
+    result = report(turns, micro_benchmarks(agent_module, cassette),
+                    {"cassette": args.cassette, "api": api or "default",
+                     "latency_scale": args.latency_scale, "repeat": args.repeat})
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Asyncio load generator for the chat and summarizer services.
+
+Two modes:
+- closed loop (`--concurrency N`): N workers send requests back to back
+- open loop (`--qps R`): requests start on a fixed schedule whether or not
+  earlier ones finished; latency is measured from the scheduled start, so a
+  stalled server shows up in the percentiles instead of hiding in fewer samples
+
+Targets:
+    chat          POST /chat
+    chat_stream   POST /chat/stream        (TTFT = first `delta` frame)
+    summarize     POST /summarize          (cache bypassed unless --allow-cache)
+
+Each run writes one JSON file (settings, git commit, throughput, latency and
+TTFT p50/p95/p99, error counts, and the service's /metrics snapshot when
+available). Compare two runs with `compare`:
+
+    python -m benchmarks.loadgen run chat_stream --url http://127.0.0.1:8000 \\
+        --concurrency 16 --duration 30 --out results/chat_stream.json
+    python -m benchmarks.loadgen compare results/before.json results/after.json
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+TARGETS = {
+    "chat": "/chat",
+    "chat_stream": "/chat/stream",
+    "summarize": "/summarize",
+}
+
+
+@dataclass
+class LoadSettings:
+    target: str = "chat"
+    url: str = "http://127.0.0.1:8000"
+    concurrency: Optional[int] = 8
+    qps: Optional[float] = None
+    duration: float = 30.0
+    requests: Optional[int] = None     # stop after this many (overrides duration)
+    warmup: int = 0                    # requests sent first and left out of the results
+    prompt_words: int = 50
+    max_tokens: int = 200
+    unique: bool = True                # vary prompts so caches / coalescing do not skew results
+    allow_cache: bool = False
+    timeout: float = 120.0
+
+
+@dataclass
+class Sample:
+    latency: float
+    ttft: Optional[float]
+    status: str                        # "ok", an HTTP status code, or an exception name
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile of `values` (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_values(values: List[float]) -> Dict[str, Optional[float]]:
+    """Count, mean, p50/p95/p99 and max, in milliseconds."""
+    def ms(v: Optional[float]) -> Optional[float]:
+        return round(v * 1000, 2) if v is not None else None
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)) if values else None,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(max(values)) if values else None,
+    }
+
+
+def build_payload(settings: LoadSettings, index: int) -> dict:
+    words = ("please answer briefly about performance testing of language model services "
+             "with realistic prompts").split()
+    text = " ".join(words[i % len(words)] for i in range(settings.prompt_words))
+    if settings.unique:
+        text = f"[request {index}] {text}"
+    if settings.target == "summarize":
+        return {"text": text, "max_words": settings.max_tokens // 2,
+                "cache": "auto" if settings.allow_cache else "bypass"}
+    return {"messages": [{"role": "system", "content": "You are a helpful assistant."},
+                         {"role": "user", "content": text}],
+            "max_tokens": settings.max_tokens}
+
+
+async def send_one(client: httpx.AsyncClient, settings: LoadSettings, index: int,
+                   scheduled: float) -> Sample:
+    """Send one request; latency and TTFT are measured from `scheduled`."""
+    path = TARGETS[settings.target]
+    payload = build_payload(settings, index)
+    ttft = None
+    try:
+        if settings.target == "chat_stream":
+            async with client.stream("POST", path, json=payload) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    return Sample(time.perf_counter() - scheduled, None, str(response.status_code))
+                status = "ok"
+                async for line in response.aiter_lines():
+                    if ttft is None and line.startswith("event: delta"):
+                        ttft = time.perf_counter() - scheduled
+                    elif line.startswith("event: error"):
+                        status = "stream_error"
+            return Sample(time.perf_counter() - scheduled, ttft, status)
+        response = await client.post(path, json=payload)
+        status = "ok" if response.status_code == 200 else str(response.status_code)
+        return Sample(time.perf_counter() - scheduled, None, status)
+    except Exception as e:
+        return Sample(time.perf_counter() - scheduled, ttft, type(e).__name__)
+
+
+class LoadGenerator:
+    def __init__(self, settings: LoadSettings):
+        if settings.target not in TARGETS:
+            raise ValueError(f"target must be one of {sorted(TARGETS)}")
+        if not settings.concurrency and not settings.qps:
+            raise ValueError("set either concurrency or qps")
+        self.settings = settings
+        self.samples: List[Sample] = []
+
+    def _more(self, sent: int, deadline: float) -> bool:
+        if self.settings.requests is not None:
+            return sent < self.settings.requests
+        return time.perf_counter() < deadline
+
+    async def _closed_loop(self, client: httpx.AsyncClient, deadline: float) -> None:
+        sent = 0
+
+        async def worker() -> None:
+            nonlocal sent
+            while self._more(sent, deadline):
+                index = sent
+                sent += 1
+                self.samples.append(await send_one(client, self.settings, index,
+                                                   time.perf_counter()))
+
+        await asyncio.gather(*(worker() for _ in range(self.settings.concurrency)))
+
+    async def _open_loop(self, client: httpx.AsyncClient, deadline: float) -> None:
+        interval = 1.0 / self.settings.qps
+        start = time.perf_counter()
+        tasks = []
+        sent = 0
+        while self._more(sent, deadline):
+            scheduled = start + sent * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send_one(client, self.settings, sent, scheduled)))
+            sent += 1
+        self.samples.extend(await asyncio.gather(*tasks))
+
+    async def run(self) -> Dict[str, Any]:
+        s = self.settings
+        # Enough connections that the client is never the bottleneck
+        connections = s.concurrency or max(16, int(s.qps * s.timeout))
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        async with httpx.AsyncClient(base_url=s.url, timeout=s.timeout, limits=limits) as client:
+            for i in range(s.warmup):
+                await send_one(client, s, -1 - i, time.perf_counter())
+            started = time.perf_counter()
+            deadline = started + s.duration
+            if s.qps:
+                await self._open_loop(client, deadline)
+            else:
+                await self._closed_loop(client, deadline)
+            elapsed = time.perf_counter() - started
+            server_metrics = await fetch_metrics(client)
+        return self.report(elapsed, server_metrics)
+
+    def report(self, elapsed: float, server_metrics: Optional[dict]) -> Dict[str, Any]:
+        ok = [x for x in self.samples if x.status == "ok"]
+        errors: Dict[str, int] = {}
+        for x in self.samples:
+            if x.status != "ok":
+                errors[x.status] = errors.get(x.status, 0) + 1
+        return {
+            "settings": asdict(self.settings),
+            "git_commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "elapsed_s": round(elapsed, 3),
+            "requests": len(self.samples),
+            "ok": len(ok),
+            "errors": errors,
+            "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+            "latency": summarize_values([x.latency for x in ok]),
+            "ttft": summarize_values([x.ttft for x in ok if x.ttft is not None]),
+            "server_metrics": server_metrics,
+        }
+
+
+async def fetch_metrics(client: httpx.AsyncClient) -> Optional[dict]:
+    """The service's own /metrics snapshot, if it has one."""
+    try:
+        response = await client.get("/metrics", params={"format": "json"})
+        return response.json() if response.status_code == 200 else None
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ----------------------------
+# Comparing runs
+# ----------------------------
+
+def compare(before: dict, after: dict) -> List[Tuple[str, Any, Any, Optional[float]]]:
+    """(metric, before, after, % change) rows for the headline numbers."""
+    rows = []
+    for section, keys in (("latency", ("p50_ms", "p95_ms", "p99_ms")),
+                          ("ttft", ("p50_ms", "p95_ms", "p99_ms"))):
+        for key in keys:
+            a, b = before[section].get(key), after[section].get(key)
+            change = round((b - a) / a * 100, 1) if a and b is not None else None
+            rows.append((f"{section}.{key}", a, b, change))
+    a, b = before["throughput_rps"], after["throughput_rps"]
+    rows.append(("throughput_rps", a, b, round((b - a) / a * 100, 1) if a and b is not None else None))
+    return rows
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load-test the chat / summarizer services.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run a load test and write a JSON report")
+    run.add_argument("target", choices=sorted(TARGETS))
+    run.add_argument("--url", default=LoadSettings.url)
+    mode = run.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, help="Closed loop with N workers (default 8)")
+    mode.add_argument("--qps", type=float, help="Open loop at a fixed request rate")
+    run.add_argument("--duration", type=float, default=LoadSettings.duration)
+    run.add_argument("--requests", type=int, help="Stop after N requests instead of --duration")
+    run.add_argument("--warmup", type=int, default=0)
+    run.add_argument("--prompt-words", type=int, default=LoadSettings.prompt_words)
+    run.add_argument("--max-tokens", type=int, default=LoadSettings.max_tokens)
+    run.add_argument("--same-prompt", action="store_true",
+                     help="Send identical prompts (exercises caches / coalescing)")
+    run.add_argument("--allow-cache", action="store_true")
+    run.add_argument("--timeout", type=float, default=LoadSettings.timeout)
+    run.add_argument("--out", help="Write the JSON report here (default: stdout only)")
+
+    cmp = sub.add_parser("compare", help="Compare two JSON reports")
+    cmp.add_argument("before")
+    cmp.add_argument("after")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.before) as f1, open(args.after) as f2:
+            before, after = json.load(f1), json.load(f2)
+        print(f"{'metric':<18}{'before':>12}{'after':>12}{'change':>10}")
+        for name, a, b, change in compare(before, after):
+            shown = f"{change:+.1f}%" if change is not None else "-"
+            print(f"{name:<18}{str(a):>12}{str(b):>12}{shown:>10}")
+        return
+
+    settings = LoadSettings(
+        target=args.target, url=args.url,
+        concurrency=None if args.qps else (args.concurrency or 8), qps=args.qps,
+        duration=args.duration, requests=args.requests, warmup=args.warmup,
+        prompt_words=args.prompt_words, max_tokens=args.max_tokens,
+        unique=not args.same_prompt, allow_cache=args.allow_cache, timeout=args.timeout,
+    )
+    report = asyncio.run(LoadGenerator(settings).run())
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    headline = {k: report[k] for k in ("requests", "ok", "errors", "throughput_rps")}
+    headline["latency"] = report["latency"]
+    headline["ttft"] = report["ttft"]
+    json.dump(headline, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Local OpenAI-compatible stand-in for benchmarking without API quota.
+
+Serves the endpoints the sample apps use:
+
+    POST /v1/chat/completions   (plain and `stream=True`, with `usage`)
+    POST /v1/embeddings         (deterministic vectors per input text)
+    GET  /v1/models
+
+Latency is drawn from configurable distributions, streamed tokens are paced
+at a fixed rate in chunks of a fixed size, and a share of requests can fail
+with chosen status codes. Repeated prompt prefixes report `cached_tokens`
+like the real prompt cache (1024-token minimum, 128-token steps).
+
+Point a service at it with OPENAI_BASE_URL:
+
+    python -m benchmarks.mock_openai --port 9000 --ttft lognormal:300,0.5 --tokens-per-sec 80
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=mock uvicorn chat_api:app
+
+Distribution specs: `fixed:MS`, `uniform:LO,HI`, `normal:MEAN,SD`,
+`lognormal:MEDIAN,SIGMA` (all in milliseconds).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from common.history import count_tokens
+
+WORDS = ("the model returns a short synthetic answer so that load tests measure "
+         "the service rather than the provider and every run stays cheap").split()
+
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """Turn a spec like `lognormal:300,0.5` into a sampler returning seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"unknown distribution {spec!r}")
+
+
+@dataclass
+class MockSettings:
+    ttft: str = "lognormal:250,0.4"          # time until the first token / full headers
+    tokens_per_sec: float = 100.0            # generation speed after the first token
+    chunk_tokens: int = 1                    # tokens per streamed chunk
+    completion_tokens: int = 60              # reply length (capped by max_tokens)
+    embedding_latency: str = "lognormal:40,0.3"
+    embedding_dims: int = 1536
+    error_rate: float = 0.0                  # share of requests that fail
+    error_codes: List[int] = field(default_factory=lambda: [429, 500, 503])
+    cache_min_tokens: int = 1024             # prompt-cache rules of the real API
+    cache_block_tokens: int = 128
+    seed: Optional[int] = None
+
+
+class PrefixCache:
+    """Remembers prompt prefixes to report `cached_tokens` on repeats."""
+
+    def __init__(self, settings: MockSettings, max_entries: int = 10000):
+        self.settings = settings
+        self.max_entries = max_entries
+        self.seen: "OrderedDict[str, int]" = OrderedDict()
+
+    def cached_tokens(self, messages: List[dict], model: str) -> Tuple[int, int]:
+        """Return (prompt tokens, cached tokens) for one request."""
+        s = self.settings
+        total = 0
+        cached = 0
+        digest = hashlib.sha1()
+        for message in messages:
+            content = message.get("content") or ""
+            if not isinstance(content, str):
+                content = json.dumps(content)
+            total += count_tokens(content, model) + 4
+            digest.update(json.dumps([message.get("role"), content]).encode())
+            key = digest.hexdigest()
+            # Longest previously seen prefix counts as cached
+            if key in self.seen:
+                cached = total
+                self.seen.move_to_end(key)
+            else:
+                self.seen[key] = total
+                if len(self.seen) > self.max_entries:
+                    self.seen.popitem(last=False)
+        if cached < s.cache_min_tokens:
+            cached = 0
+        cached -= cached % s.cache_block_tokens
+        return total, cached
+
+
+def create_app(settings: Optional[MockSettings] = None) -> FastAPI:
+    s = settings or MockSettings()
+    if s.seed is not None:
+        random.seed(s.seed)
+    ttft = parse_distribution(s.ttft)
+    embedding_latency = parse_distribution(s.embedding_latency)
+    prefix_cache = PrefixCache(s)
+    stats: Dict[str, int] = {"chat": 0, "stream": 0, "embeddings": 0, "errors": 0}
+    app = FastAPI(title="Mock OpenAI API")
+
+    def injected_error() -> Optional[JSONResponse]:
+        if s.error_rate and random.random() < s.error_rate:
+            stats["errors"] += 1
+            code = random.choice(s.error_codes)
+            return JSONResponse(status_code=code, content={"error": {
+                "message": f"mock injected error {code}", "type": "mock_error", "code": code}})
+        return None
+
+    def completion_words(max_tokens: Optional[int]) -> List[str]:
+        n = min(s.completion_tokens, max_tokens or s.completion_tokens)
+        return [WORDS[i % len(WORDS)] for i in range(max(1, n))]
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [
+            {"id": "gpt-4o-mini", "object": "model", "owned_by": "mock"},
+            {"id": "text-embedding-3-small", "object": "model", "owned_by": "mock"},
+        ]}
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        error = injected_error()
+        if error is not None:
+            await asyncio.sleep(ttft())
+            return error
+
+        model = body.get("model", "gpt-4o-mini")
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+        words = completion_words(max_tokens)
+        prompt_tokens, cached = prefix_cache.cached_tokens(body.get("messages", []), model)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+        completion_id = "chatcmpl-" + uuid.uuid4().hex[:24]
+        created = int(time.time())
+        per_token = 1.0 / s.tokens_per_sec if s.tokens_per_sec > 0 else 0.0
+
+        if not body.get("stream"):
+            stats["chat"] += 1
+            # Non-streaming replies arrive once the whole completion is generated
+            await asyncio.sleep(ttft() + per_token * len(words))
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage,
+            }
+
+        stats["stream"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def frame(choices: list, extra: Optional[dict] = None) -> str:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk",
+                     "created": created, "model": model, "choices": choices, **(extra or {})}
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def events():
+            await asyncio.sleep(ttft())
+            yield frame([{"index": 0, "delta": {"role": "assistant", "content": ""},
+                          "finish_reason": None}])
+            step = max(1, s.chunk_tokens)
+            for i in range(0, len(words), step):
+                if i:
+                    await asyncio.sleep(per_token * step)
+                text = (" " if i else "") + " ".join(words[i:i + step])
+                yield frame([{"index": 0, "delta": {"content": text}, "finish_reason": None}])
+            yield frame([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield frame([], {"usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        error = injected_error()
+        await asyncio.sleep(embedding_latency())
+        if error is not None:
+            return error
+        stats["embeddings"] += 1
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = int(body.get("dimensions") or s.embedding_dims)
+        model = body.get("model", "text-embedding-3-small")
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dims)}
+                for i, text in enumerate(inputs)]
+        tokens = sum(count_tokens(str(text), model) for text in inputs)
+        return {"object": "list", "data": data, "model": model,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return app
+
+
+def fake_embedding(text: str, dims: int) -> List[float]:
+    """Deterministic unit vector seeded by the text (same text -> same vector)."""
+    seed = struct.unpack("<Q", hashlib.sha256(text.encode("utf-8")).digest()[:8])[0]
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dims)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", default=MockSettings.ttft,
+                        help="Time to first token, e.g. lognormal:250,0.4 (ms)")
+    parser.add_argument("--tokens-per-sec", type=float, default=MockSettings.tokens_per_sec)
+    parser.add_argument("--chunk-tokens", type=int, default=MockSettings.chunk_tokens,
+                        help="Tokens per streamed chunk")
+    parser.add_argument("--completion-tokens", type=int, default=MockSettings.completion_tokens)
+    parser.add_argument("--embedding-latency", default=MockSettings.embedding_latency)
+    parser.add_argument("--embedding-dims", type=int, default=MockSettings.embedding_dims)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="429,500,503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    settings = MockSettings(
+        ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, chunk_tokens=args.chunk_tokens,
+        completion_tokens=args.completion_tokens, embedding_latency=args.embedding_latency,
+        embedding_dims=args.embedding_dims, error_rate=args.error_rate,
+        error_codes=[int(c) for c in args.error_codes.split(",") if c],
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
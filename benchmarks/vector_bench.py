@@ -0,0 +1,283 @@
+"""
+Vector search benchmark: `common.vector_index` against Milvus Lite.
+
+Builds the same synthetic corpus in each engine, then measures, each phase
+in a fresh process:
+
+- build: create the collection and insert in chunks of `--chunk` rows (plus
+  IVF training for `numpy-ivf`)
+- cold start: open the client on the existing data and answer a first query
+  (fresh process, but the OS page cache is warm: dropping it needs root)
+- query latency: single-vector searches (p50/p95/p99) and batched searches
+  (`--batch` vectors per call, reported per query)
+- memory: resident set size of the process and its children (Milvus Lite
+  runs a separate server process) after the queries
+- recall@limit against an exact NumPy search
+
+The corpus is clustered (random centres plus noise), like real embeddings,
+so IVF recall figures are meaningful; queries are perturbed corpus rows.
+
+    python -m benchmarks.vector_bench run --rows 100000 --dim 1536 --out results/vectors.json
+    python -m benchmarks.vector_bench run --engines numpy,numpy-ivf --nlist 256 --nprobe 8,16,32
+
+Milvus Lite is skipped when pymilvus is not installed (`pip install pymilvus`).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.loadgen import git_commit, summarize_values
+from common.vector_index import NumpyVectorClient
+
+try:
+    from pymilvus import MilvusClient
+    HAVE_PYMILVUS = True
+except ImportError:
+    HAVE_PYMILVUS = False
+
+ENGINES = ("numpy", "numpy-ivf", "milvus")
+COLLECTION = "bench"
+
+
+# ----------------------------
+# Data
+# ----------------------------
+
+def make_corpus(rows: int, dim: int, queries: int, clusters: int, seed: int) -> tuple:
+    """Clustered unit vectors and queries near random corpus rows."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    corpus = centres[rng.integers(clusters, size=rows)] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = rng.choice(rows, size=queries, replace=False)
+    query = corpus[picks] + (0.3 / np.sqrt(dim)) * rng.normal(size=(queries, dim)).astype(np.float32)
+    query /= np.linalg.norm(query, axis=1, keepdims=True)
+    return corpus, query
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[List[int]]:
+    scores = queries @ corpus.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [sorted(row.tolist()) for row in top]
+
+
+# ----------------------------
+# Engines
+# ----------------------------
+
+def open_client(engine: str, workdir: str) -> Any:
+    if engine == "milvus":
+        if not HAVE_PYMILVUS:
+            raise RuntimeError("pymilvus is not installed")
+        return MilvusClient(uri=os.path.join(workdir, "milvus_lite.db"))
+    return NumpyVectorClient(os.path.join(workdir, engine))
+
+
+def rss_mb() -> float:
+    """Resident memory of this process and its descendants (Linux /proc), in MB."""
+    def children(pid: int) -> List[int]:
+        found = []
+        for task in Path(f"/proc/{pid}/task").glob("*"):
+            try:
+                found += [int(c) for c in (task / "children").read_text().split()]
+            except OSError:
+                pass
+        return found
+
+    total, pending = 0, [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        try:
+            total += int(Path(f"/proc/{pid}/statm").read_text().split()[1])
+        except OSError:
+            continue
+        pending += children(pid)
+    return round(total * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+
+
+def build(engine: str, workdir: str, data: str, chunk: int, nlist: int) -> Dict[str, Any]:
+    corpus = np.load(os.path.join(data, "corpus.npy"), mmap_mode="r")
+    started = time.perf_counter()
+    client = open_client(engine, workdir)
+    if client.has_collection(COLLECTION):
+        client.drop_collection(COLLECTION)
+    client.create_collection(COLLECTION, dimension=corpus.shape[1], metric_type="COSINE",
+                             consistency_level="Strong")
+    for start in range(0, len(corpus), chunk):
+        block = np.asarray(corpus[start:start + chunk])
+        client.insert(collection_name=COLLECTION,
+                      data=[{"id": start + i, "vector": v.tolist(), "text": f"row {start + i}"}
+                            for i, v in enumerate(block)])
+    inserted = time.perf_counter() - started
+    if engine == "numpy-ivf":
+        client.build_ivf(COLLECTION, nlist=nlist)
+    result = {"insert_s": round(inserted, 3), "build_s": round(time.perf_counter() - started, 3)}
+    client.close()
+    return result
+
+
+def query(engine: str, workdir: str, data: str, limit: int, batch: int, nprobe: int) -> Dict[str, Any]:
+    queries = np.load(os.path.join(data, "queries.npy"))
+    rss_before = rss_mb()
+    params = {"metric_type": "COSINE", "params": {"nprobe": nprobe} if nprobe else {}}
+
+    def search(vectors: np.ndarray) -> List[List[dict]]:
+        return client.search(collection_name=COLLECTION, data=vectors.tolist(), limit=limit,
+                             search_params=params, output_fields=["text"])
+
+    started = time.perf_counter()
+    client = open_client(engine, workdir)
+    if engine == "milvus":
+        client.load_collection(COLLECTION)
+    search(queries[:1])
+    cold_start = time.perf_counter() - started
+
+    single, found = [], []
+    for vector in queries:
+        t0 = time.perf_counter()
+        hits = search(vector[None, :])[0]
+        single.append(time.perf_counter() - t0)
+        found.append(sorted(hit["id"] for hit in hits))
+    batched = []
+    for start in range(0, len(queries), batch):
+        part = queries[start:start + batch]
+        t0 = time.perf_counter()
+        search(part)
+        batched.append((time.perf_counter() - t0) / len(part))
+    result = {"cold_start_s": round(cold_start, 3), "single": summarize_values(single),
+              "batched_per_query": summarize_values(batched), "found": found,
+              "rss_mb": rss_mb(), "rss_delta_mb": round(rss_mb() - rss_before, 1)}
+    client.close()
+    return result
+
+
+def worker(args: argparse.Namespace) -> None:
+    if args.phase == "build":
+        result = build(args.engine, args.workdir, args.data, args.chunk, args.nlist)
+    else:
+        result = query(args.engine, args.workdir, args.data, args.limit, args.batch, args.nprobe)
+    print(json.dumps(result))
+
+
+def in_subprocess(*argv: str) -> Dict[str, Any]:
+    """Run one phase in a fresh interpreter and return its JSON result."""
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.vector_bench", "worker", *argv],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "worker failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ----------------------------
+# Runner
+# ----------------------------
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    engines = [e for e in args.engines.split(",") if e]
+    if "milvus" in engines and not HAVE_PYMILVUS:
+        print("pymilvus is not installed; skipping Milvus Lite", file=sys.stderr)
+        engines.remove("milvus")
+    nprobes = [int(n) for n in args.nprobe.split(",")]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="vector_bench_")
+    data = os.path.join(workdir, "data")
+    os.makedirs(data, exist_ok=True)
+    corpus, queries = make_corpus(args.rows, args.dim, args.queries, args.clusters, args.seed)
+    np.save(os.path.join(data, "corpus.npy"), corpus)
+    np.save(os.path.join(data, "queries.npy"), queries)
+    truth = exact_top_k(corpus, queries, args.limit)
+    del corpus
+
+    common = ["--workdir", workdir, "--data", data]
+    results: Dict[str, Any] = {}
+    try:
+        for engine in engines:
+            built = in_subprocess("build", "--engine", engine, *common,
+                                  "--chunk", str(args.chunk), "--nlist", str(args.nlist))
+            for nprobe in (nprobes if engine == "numpy-ivf" else [0]):
+                name = f"{engine}[nprobe={nprobe}]" if engine == "numpy-ivf" else engine
+                queried = in_subprocess("query", "--engine", engine, *common,
+                                        "--limit", str(args.limit), "--batch", str(args.batch),
+                                        "--nprobe", str(nprobe))
+                found = queried.pop("found")
+                recall = np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+                results[name] = {**built, **queried, f"recall@{args.limit}": round(float(recall), 4)}
+                print(f"  {name} done", file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "settings": {k: getattr(args, k) for k in ("rows", "dim", "queries", "clusters", "limit",
+                                                   "batch", "chunk", "nlist", "nprobe", "seed")},
+        "git_commit": git_commit(),
+        "engines": results,
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    s = result["settings"]
+    recall = f"recall@{s['limit']}"
+    print(f"{s['rows']} rows x {s['dim']} dims, {s['queries']} queries, top-{s['limit']}")
+    print(f"  {'engine':<22}{'build s':>9}{'cold s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'batch ms/q':>12}{'RSS MB':>9}{'recall':>8}")
+    for name, r in result["engines"].items():
+        print(f"  {name:<22}{r['build_s']:>9}{r['cold_start_s']:>9}{r['single']['p50_ms']:>9}"
+              f"{r['single']['p95_ms']:>9}{r['batched_per_query']['mean_ms']:>12}{r['rss_mb']:>9}"
+              f"{r[recall]:>8}")
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare the NumPy vector index with Milvus Lite.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bench = sub.add_parser("run", help="Build, query and compare the engines")
+    bench.add_argument("--engines", default=",".join(ENGINES))
+    bench.add_argument("--rows", type=int, default=100_000)
+    bench.add_argument("--dim", type=int, default=1536)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--clusters", type=int, default=200)
+    bench.add_argument("--limit", type=int, default=3, help="Top-k per query (the notebooks use 3)")
+    bench.add_argument("--batch", type=int, default=32)
+    bench.add_argument("--chunk", type=int, default=1000, help="Rows per insert call")
+    bench.add_argument("--nlist", type=int, default=256)
+    bench.add_argument("--nprobe", default="8,32", help="Comma-separated nprobe values for numpy-ivf")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--workdir", help="Keep the collections here (default: a temp dir, removed)")
+    bench.add_argument("--out", help="Write the JSON report here")
+
+    work = sub.add_parser("worker", help=argparse.SUPPRESS)
+    work.add_argument("phase", choices=("build", "query"))
+    work.add_argument("--engine", choices=ENGINES, required=True)
+    work.add_argument("--workdir", required=True)
+    work.add_argument("--data", required=True)
+    work.add_argument("--chunk", type=int, default=1000)
+    work.add_argument("--nlist", type=int, default=256)
+    work.add_argument("--limit", type=int, default=3)
+    work.add_argument("--batch", type=int, default=32)
+    work.add_argument("--nprobe", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        worker(args)
+        return
+    result = run(args)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    print_report(result)
+
+
+if __name__ == "__main__":
+    main()
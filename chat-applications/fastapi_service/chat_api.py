@@ -1,24 +1,75 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
-from openai import OpenAI
+from typing import AsyncIterator, Callable, List, Optional, Union
+from contextlib import asynccontextmanager
+import json
 import os
+import sys
+import time
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Make the repo-level `common` package importable however the app is launched
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.cache import cache_key  # noqa: E402
+from common.history import HistoryCompactor, build_summary_prompt  # noqa: E402
+from common.http_client import OpenAIClientManager  # noqa: E402
+from common.metrics import MetricsMiddleware, ServiceMetrics  # noqa: E402
+from common.prompt_layout import usage_summary  # noqa: E402
+from common.sessions import SessionNotFound, make_session_store  # noqa: E402
+from common.singleflight import AsyncSingleFlight  # noqa: E402
+
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+# One pooled async client per worker, opened and closed by the app lifespan
+client_manager = OpenAIClientManager(asynchronous=True)
+client = None
 
 
 def init_openai_client():
-    api_key = ""
+    api_key = os.getenv("OPENAI_API_KEY", "")
     if not api_key:
         raise ValueError("Please set your OPENAI_API_KEY in a .env file")
-    return OpenAI(api_key=api_key)
+    return api_key
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    async with client_manager.lifespan(init_openai_client()) as opened:
+        # Async client so an in-flight completion never blocks the event loop
+        client = opened
+        yield
+        client = None
+
 
+app = FastAPI(lifespan=lifespan)
 
-client = init_openai_client()
+# Latency / TTFT histograms, token counters and in-flight gauges for /metrics
+metrics = ServiceMetrics("chat")
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# Server-side sessions: "memory" (LRU, default) or "sqlite" (local file)
+SESSION_STORE = os.getenv("CHAT_SESSION_STORE", "memory")
+SESSION_DB = os.getenv("CHAT_SESSION_DB", "chat_sessions.db")
+# How many recent turns (besides the system prompt) are sent upstream
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "40"))
+
+sessions = make_session_store(
+    SESSION_STORE, **({"path": SESSION_DB} if SESSION_STORE == "sqlite" else {}))
+
+# Prompt token budget: older turns are folded into a rolling summary
+TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "3000"))
+SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gpt-4o-mini")
+compactor = HistoryCompactor(
+    budget_tokens=TOKEN_BUDGET,
+    keep_recent=int(os.getenv("CHAT_KEEP_RECENT", "4")))
+
+# Identical concurrent requests share one upstream call (or one stream)
+coalescer = AsyncSingleFlight(enabled=os.getenv("CHAT_COALESCE", "1") == "1")
 
 
 class Message(BaseModel):
@@ -28,33 +79,282 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[Message]
+    # Client-chosen id that lets the server keep a rolling summary across calls
+    conversation_id: Optional[str] = None
+    model: str = "gpt-4o-mini"
+    max_tokens: int = 500
+    temperature: float = 0.5
+
+
+class CreateSessionRequest(BaseModel):
+    system_prompt: Optional[str] = "You are a helpful assistant."
+
+
+class SessionTurnRequest(BaseModel):
+    message: Message
     model: str = "gpt-4o-mini"
     max_tokens: int = 500
     temperature: float = 0.5
 
 
+def to_openai_messages(messages: List[Message]) -> List[dict]:
+    """Convert Pydantic models to dict format for OpenAI."""
+    return [{"role": msg.role, "content": msg.content} for msg in messages]
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def conversation_key(request: ChatRequest) -> Optional[str]:
+    """Compaction key for a stateless conversation; None when the client sent no id."""
+    return f"chat:{request.conversation_id}" if request.conversation_id else None
+
+
+async def summarize_turns(previous_summary: str, turns: List[dict]) -> str:
+    """Fold older turns into the running summary (used by the compactor)."""
+    with metrics.upstream("summary", SUMMARY_MODEL):
+        response = await client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=build_summary_prompt(previous_summary, turns),  # type: ignore
+            temperature=0,
+            timeout=client_manager.timeout("summary")
+        )
+    metrics.record_usage(SUMMARY_MODEL, response.usage)
+    return response.choices[0].message.content or previous_summary
+
+
+async def fit_to_budget(messages: List[dict], key: Optional[str],
+                        trimmed: bool = False) -> List[dict]:
+    """
+    Compact history to TOKEN_BUDGET, reusing the summary for `key` (fresh state if None).
+
+    `trimmed` marks a server-owned session window, whose front may have slid
+    past the turns the summary covers.
+    """
+    state = compactor.state_for(key) if key is not None else None
+    return await compactor.acompact(messages, state, summarize_turns, trimmed=trimmed)
+
+
+async def complete(messages: List[dict], model: str, max_tokens: int,
+                   temperature: float) -> dict:
+    """Run one non-streaming completion; returns the text and prompt-cache usage."""
+    async def call() -> dict:
+        with metrics.upstream("chat", model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,  # type: ignore
+                max_completion_tokens=max_tokens,
+                temperature=temperature,
+                timeout=client_manager.timeout("chat")
+            )
+        metrics.record_usage(model, response.usage)
+        return {"content": response.choices[0].message.content,
+                "usage": usage_summary(response.usage)}
+
+    key = cache_key("complete", messages, model, max_tokens, temperature)
+    return await coalescer.do(key, call)
+
+
+async def upstream_deltas(messages: List[dict], model: str, max_tokens: int,
+                          temperature: float) -> AsyncIterator[Union[str, dict]]:
+    """
+    Text deltas of one streamed completion, then a `{"usage": ...}` item.
+    Closing this closes the upstream.
+    """
+    with metrics.upstream("chat_stream", model):
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,  # type: ignore
+            max_completion_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            # The last chunk then carries token usage (with no choices)
+            stream_options={"include_usage": True},
+            timeout=client_manager.timeout("chat_stream")
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    metrics.record_usage(model, chunk.usage)
+                    yield {"usage": usage_summary(chunk.usage)}
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+async def stream_events(messages: List[dict], model: str, max_tokens: int,
+                        temperature: float,
+                        on_done: Optional[Callable[[str], None]] = None) -> AsyncIterator[str]:
+    """
+    Forward completion deltas as SSE frames.
+
+    Emits `delta` frames as tokens arrive, a single `ttft` frame when the
+    first token lands, and a closing `done` frame with timings and
+    prompt-cache usage. Identical
+    concurrent requests share one upstream stream. If every client listening
+    to it disconnects, the upstream stream is closed so the provider stops
+    generating.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    usage = None
+    parts: List[str] = []
+    key = cache_key("stream", messages, model, max_tokens, temperature)
+    deltas = coalescer.stream(
+        key, lambda: upstream_deltas(messages, model, max_tokens, temperature))
+    try:
+        async for delta in deltas:
+            if isinstance(delta, dict):
+                usage = delta["usage"]
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                metrics.observe_ttft("chat_stream", model, first_token_at - start)
+                yield sse_event("ttft", {"ttft_ms": round((first_token_at - start) * 1000, 1)})
+            parts.append(delta)
+            yield sse_event("delta", {"content": delta})
+
+        if on_done is not None:
+            on_done("".join(parts))
+        end = time.perf_counter()
+        yield sse_event("done", {
+            "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+            "total_ms": round((end - start) * 1000, 1),
+            "usage": usage,
+        })
+    except Exception as e:
+        # Headers are already sent, so errors travel in-band
+        yield sse_event("error", {"detail": str(e)})
+    finally:
+        # Leave the shared stream now so a lone listener's disconnect stops the upstream
+        await deltas.aclose()
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/")
 async def read_root():
     return {"message": "ChatBot API is running"}
 
 
+@app.get("/pool/stats")
+async def pool_stats():
+    """Upstream connection pool usage for this worker."""
+    return client_manager.stats()
+
+
+@app.get("/coalesce/stats")
+async def coalesce_stats():
+    """How many upstream calls were saved by sharing identical in-flight requests."""
+    return coalescer.stats.as_dict()
+
+
+@app.get("/metrics")
+async def metrics_endpoint(format: str = "prometheus"):
+    """Prometheus text by default; `?format=json` adds p50/p95/p99 estimates."""
+    if format == "json":
+        return metrics.registry.snapshot()
+    return PlainTextResponse(metrics.registry.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+
+async def chat_reply(request: ChatRequest) -> dict:
+    """Body of a /chat response (shared with the offline batch runner)."""
+    messages = to_openai_messages(request.messages)
+    messages = await fit_to_budget(messages, conversation_key(request))
+    result = await complete(
+        messages, request.model, request.max_tokens, request.temperature)
+    return {"response": result["content"], "usage": result["usage"]}
+
+
 @app.post("/chat")
 async def chat_completion(request: ChatRequest):
     try:
-        # Convert Pydantic models to dict format for OpenAI
-        print(request.messages)
-        messages_dict = [{"role": msg.role, "content": msg.content}
-                         for msg in request.messages]
-
-        response = client.chat.completions.create(
-            model=request.model,
-            messages=messages_dict,  # type: ignore
-            max_completion_tokens=request.max_tokens,
-            temperature=request.temperature
-        )
+        return await chat_reply(request)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        assistant_message = response.choices[0].message.content
-        return {"response": assistant_message}
 
+@app.post("/chat/stream")
+async def chat_completion_stream(request: ChatRequest):
+    """Stream the assistant reply as Server-Sent Events."""
+    messages = to_openai_messages(request.messages)
+    try:
+        messages = await fit_to_budget(messages, conversation_key(request))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return sse_response(stream_events(
+        messages, request.model, request.max_tokens, request.temperature))
+
+
+# ----------------------------
+# Sessions: clients send only the new turn
+# ----------------------------
+
+async def session_window(session_id: str, message: Message) -> List[dict]:
+    """Stored history window plus the incoming turn, fitted to the token budget."""
+    try:
+        history = sessions.window(session_id, HISTORY_WINDOW)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        return await fit_to_budget(history + to_openai_messages([message]), session_id,
+                                   trimmed=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def record_turn(session_id: str, message: Message, reply: str) -> None:
+    """Append the user turn and the assistant reply once the call succeeded."""
+    sessions.append(session_id, {"role": message.role, "content": message.content})
+    sessions.append(session_id, {"role": "assistant", "content": reply})
+
+
+@app.post("/sessions")
+def create_session(request: CreateSessionRequest):
+    return {"session_id": sessions.create(request.system_prompt)}
+
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str, last_n: Optional[int] = None):
+    try:
+        return {"session_id": session_id, "messages": sessions.history(session_id, last_n)}
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    sessions.delete(session_id)
+    compactor.drop_state(session_id)
+    return {"deleted": session_id}
+
+
+@app.post("/sessions/{session_id}/messages")
+async def session_turn(session_id: str, request: SessionTurnRequest):
+    messages = await session_window(session_id, request.message)
+    try:
+        result = await complete(messages, request.model, request.max_tokens, request.temperature)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    record_turn(session_id, request.message, result["content"])
+    return {"response": result["content"], "usage": result["usage"]}
+
+
+@app.post("/sessions/{session_id}/messages/stream")
+async def session_turn_stream(session_id: str, request: SessionTurnRequest):
+    """Streaming variant; the turn is stored only if the stream completes."""
+    messages = await session_window(session_id, request.message)
+    return sse_response(stream_events(
+        messages, request.model, request.max_tokens, request.temperature,
+        on_done=lambda reply: record_turn(session_id, request.message, reply)))
@@ -1,8 +1,16 @@
 import streamlit as st
 from openai import OpenAI
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Make the repo-level `common` package importable however the app is launched
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.prompt_layout import format_usage, usage_summary  # noqa: E402
+from common.stream_render import StreamRenderer  # noqa: E402
+
 # Load environment variables
 load_dotenv()
 
@@ -98,19 +106,23 @@ if prompt := st.chat_input("What would you like to know?"):
                     messages=st.session_state.messages,  # type: ignore
                     max_completion_tokens=max_tokens,
                     temperature=temperature,
-                    stream=True
+                    stream=True,
+                    # The last chunk reports tokens, including prompt-cache hits
+                    stream_options={"include_usage": True}
                 )
 
-                # Stream the response
-                message_placeholder = st.empty()
-                full_response = ""
+                # Stream the response (throttled; finished paragraphs are rendered once)
+                renderer = StreamRenderer(st.container())
 
+                usage = None
                 for chunk in response:
-                    if chunk.choices[0].delta.content is not None:
-                        full_response += chunk.choices[0].delta.content
-                        message_placeholder.markdown(full_response + "▌")
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        renderer.write(chunk.choices[0].delta.content)
+                    if chunk.usage is not None:
+                        usage = usage_summary(chunk.usage)
 
-                message_placeholder.markdown(full_response)
+                full_response = renderer.close()
+                st.caption(format_usage(usage))
 
                 # Add assistant response to chat history
                 st.session_state.messages.append(
@@ -2,13 +2,19 @@
 # Multimodal Chat: text + per-message PDF/image attachments via a popover next to the chat bar
 
 import os
-import base64
-from typing import List
+import sys
+from pathlib import Path
 
 import streamlit as st
 from dotenv import load_dotenv
 from openai import OpenAI
-import PyPDF2  # pip install PyPDF2
+
+# Make the repo-level `common` package importable however the app is launched
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.attachments import make_image_preprocessor, make_pdf_extractor  # noqa: E402
+from common.prompt_layout import PromptLayout, format_usage, usage_summary  # noqa: E402
+from common.stream_render import StreamRenderer  # noqa: E402
 
 # ----------------------------
 # Setup
@@ -16,49 +22,62 @@ import PyPDF2  # pip install PyPDF2
 load_dotenv()
 st.set_page_config(page_title="Multimodal Chat (PDF + Image)", page_icon="🤖", layout="centered")
 
-OPENAI_API_KEY = ""
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 if not OPENAI_API_KEY:
     st.error("Missing OPENAI_API_KEY in your .env file")
     st.stop()
 
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+SYSTEM_PROMPT = "You are a helpful assistant. If the user uploads files, use them as context."
+
+# Static system prompt first, then pinned PDFs, then the history, then the new
+# turn: every request repeats the previous one's prefix, so the provider's
+# prompt cache can serve it
+LAYOUT = PromptLayout(system=SYSTEM_PROMPT)
+
 # ----------------------------
 # Helpers
 # ----------------------------
-def extract_text_from_pdf(uploaded_pdf) -> str:
-    """Extract text from the first few pages of a PDF and soft-cap length."""
+@st.cache_resource
+def get_pdf_extractor():
+    """One extractor per process: shared text cache (memory + disk) and process pool."""
+    return make_pdf_extractor(disk_path="pdf_text_cache.db")
+
+def extract_text_from_pdf(uploaded_pdf, question: str = "") -> dict:
+    """
+    Extract PDF text within the token budget set in the sidebar.
+    Text is cached by file content, so re-attaching the same PDF is instant.
+    """
     try:
-        reader = PyPDF2.PdfReader(uploaded_pdf)
-        pages = min(len(reader.pages), 8)  # cap pages to avoid giant prompts
-        chunks: List[str] = []
-        for i in range(pages):
-            text = reader.pages[i].extract_text() or ""
-            chunks.append(text)
-        doc = "\n".join(chunks).strip()
-        # soft cap by characters (token-based capping would be even better)
-        return (doc[:8000] + "\n...[truncated]") if len(doc) > 8000 else doc
+        return get_pdf_extractor().build_context(
+            uploaded_pdf.getvalue(),
+            max_tokens=pdf_token_budget,
+            strategy=pdf_strategy,
+            question=question,
+        )
     except Exception as e:
-        return f"[PDF extraction error: {e}]"
-
-def file_to_data_url(file) -> str:
-    """Convert an uploaded image file to a base64 data URL for OpenAI image input."""
-    data = file.read()
-    name = (getattr(file, "name", "") or "").lower()
-    mime = "image/png"
-    if name.endswith(".jpg") or name.endswith(".jpeg"):
-        mime = "image/jpeg"
-    elif name.endswith(".png"):
-        mime = "image/png"
-    b64 = base64.b64encode(data).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+        return {"text": f"[PDF extraction error: {e}]", "pages_used": [], "total_pages": 0,
+                "cached": False, "tokens": 0}
+
+@st.cache_resource
+def get_image_preprocessor():
+    """One preprocessor per process; its data-URL cache is shared across sessions."""
+    return make_image_preprocessor()
+
+def file_to_data_url(file) -> dict:
+    """
+    Downscale, strip metadata and re-encode an uploaded image, then base64 it.
+    Returns the data URL, the detail level and bytes / vision tokens saved.
+    """
+    return get_image_preprocessor().process(file.getvalue(), detail=image_detail)
 
 # ----------------------------
 # Session State
 # ----------------------------
 if "messages" not in st.session_state:
     st.session_state.messages = [
-        {"role": "system", "content": "You are a helpful assistant. If the user uploads files, use them as context."},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "assistant", "content": "Hi! Ask anything and use 📎 to attach a PDF or an image to your message."}
     ]
 
@@ -66,6 +85,11 @@ if "messages" not in st.session_state:
 if "composer_files" not in st.session_state:
     st.session_state.composer_files = {"pdf": None, "image": None}
 
+# PDF texts pinned to the conversation as reference documents, one per file
+# name (title -> text); insertion order is the order they are sent in
+if "pinned_docs" not in st.session_state:
+    st.session_state.pinned_docs = {}
+
 # ----------------------------
 # Sidebar
 # ----------------------------
@@ -75,12 +99,29 @@ with st.sidebar:
     temperature = st.slider("Temperature", 0.0, 1.0, 0.3, 0.1)
     max_tokens = st.slider("Max tokens", 128, 4096, 768, 64)
     st.divider()
+    st.subheader("PDF attachments")
+    pdf_token_budget = st.slider("PDF token budget", 500, 16000, 4000, 500)
+    pdf_strategy = st.radio(
+        "Pages to include",
+        ["first", "relevant"],
+        format_func=lambda s: "First pages" if s == "first" else "Most relevant to my question",
+        horizontal=True,
+    )
+    st.subheader("Image attachments")
+    image_detail = st.radio(
+        "Image detail",
+        ["auto", "high", "low"],
+        help="low = 85 tokens at 512px; high keeps small print legible (e.g. receipts)",
+        horizontal=True,
+    )
+    st.divider()
     if st.button("Clear Chat", type="secondary", use_container_width=True):
         st.session_state.messages = [
-            {"role": "system", "content": "You are a helpful assistant. If the user uploads files, use them as context."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "assistant", "content": "Chat cleared. Ask a question and attach a PDF or image if you like."}
         ]
         st.session_state.composer_files = {"pdf": None, "image": None}
+        st.session_state.pinned_docs = {}
         st.rerun()
 
 # ----------------------------
@@ -118,18 +159,25 @@ if "user_input" in st.session_state and st.session_state.user_input:
     if user_text.strip():
         ai_content_parts.append({"type": "text", "text": user_text.strip()})
 
-    # If PDF attached, extract text now and add as a text part (but don't display the text)
+    # If PDF attached, extract text now and pin it to the conversation: it is sent
+    # ahead of the history on every later turn, so those turns hit the prompt cache
     pdf = st.session_state.composer_files["pdf"]
+    pdf_info = None
     if pdf is not None:
-        pdf_text = extract_text_from_pdf(pdf)
-        if pdf_text:
-            ai_content_parts.append({"type": "text", "text": f"[PDF content]\n{pdf_text}"})
+        pdf_info = extract_text_from_pdf(pdf, question=user_text)
+        if pdf_info["text"]:
+            # Re-attaching a file (or new "relevant" pages for a new question)
+            # replaces its pin in place instead of adding another copy
+            st.session_state.pinned_docs[pdf.name] = pdf_info["text"]
+            ai_content_parts.append({"type": "text", "text": f"[Attached PDF: {pdf.name}]"})
 
     # If image attached, convert to data URL and add as image part for AI
     img = st.session_state.composer_files["image"]
+    img_info = None
     if img is not None:
-        data_url = file_to_data_url(img)
-        ai_content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
+        img_info = file_to_data_url(img)
+        ai_content_parts.append({"type": "image_url", "image_url": {
+            "url": img_info["data_url"], "detail": img_info["detail"]}})
 
     if not ai_content_parts:
         st.warning("Please type a message or attach a file.")
@@ -151,35 +199,50 @@ if "user_input" in st.session_state and st.session_state.user_input:
             st.markdown(user_text)
             
             # Show attachment indicators
-            if pdf is not None:
-                st.caption("📄 PDF attached")
-            if img is not None:
-                st.caption("🖼️ Image attached")
+            if pdf_info is not None:
+                pages = pdf_info["pages_used"]
+                st.caption(
+                    f"📄 PDF attached — {len(pages)}/{pdf_info['total_pages']} pages, "
+                    f"~{pdf_info['tokens']} tokens"
+                    + (" (cached)" if pdf_info["cached"] else "")
+                )
+            if img_info is not None:
+                caption = (f"🖼️ Image attached — {img_info['bytes'] / 1024:.0f} KB "
+                           f"(saved {max(0, img_info['bytes_saved']) / 1024:.0f} KB")
+                if img_info["tokens_saved"]:
+                    caption += f", ~{img_info['tokens_saved']} vision tokens"
+                st.caption(caption + f", detail: {img_info['detail']})")
 
         # Generate AI response using the full content for AI processing
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    # Create temporary messages with full content for AI
-                    temp_messages = st.session_state.messages.copy()
-                    temp_messages[-1] = {"role": "user", "content": ai_content_parts}
-                    
+                    # Full content for the AI: pinned PDFs, earlier turns, then this turn
+                    temp_messages = LAYOUT.build(
+                        ai_content_parts,
+                        history=st.session_state.messages[:-1],
+                        documents=list(st.session_state.pinned_docs.items()),
+                    )
+
                     response = client.chat.completions.create(
                         model=model,
                         messages=temp_messages,
                         temperature=temperature,
                         max_tokens=max_tokens,
-                        stream=True
+                        stream=True,
+                        stream_options={"include_usage": True}
                     )
 
-                    placeholder = st.empty()
-                    full = ""
+                    renderer = StreamRenderer(st.container())
+                    usage = None
                     for chunk in response:
-                        delta = chunk.choices[0].delta
+                        delta = chunk.choices[0].delta if chunk.choices else None
                         if delta and getattr(delta, "content", None):
-                            full += delta.content
-                            placeholder.markdown(full + "▌")
-                    placeholder.markdown(full)
+                            renderer.write(delta.content)
+                        if chunk.usage is not None:
+                            usage = usage_summary(chunk.usage)
+                    full = renderer.close()
+                    st.caption(format_usage(usage))
 
                     st.session_state.messages.append({"role": "assistant", "content": full})
                 except Exception as e:
@@ -1,6 +1,15 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import sys
+from pathlib import Path
+
+# Make the repo-level `common` package importable however the app is launched
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.prompt_layout import format_usage  # noqa: E402
+from common.stream_render import StreamRenderer  # noqa: E402
 
 # Set up the page configuration
 st.set_page_config(
@@ -11,15 +20,58 @@ st.set_page_config(
 
 # FastAPI backend URL
 API_BASE_URL = "http://localhost:8000"
+SYSTEM_PROMPT = "You are a helpful assistant."
+# (connect, read) timeouts in seconds; when streaming, the read timeout is the
+# longest allowed gap between two chunks, not the whole answer
+TIMEOUT = (5, 60)
+
+
+@st.cache_resource
+def get_http_session():
+    """One pooled HTTP session per Streamlit process (keep-alive across turns)."""
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=20)
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    return http
+
+
+http = get_http_session()
+
+
+def create_backend_session():
+    """Ask the backend for a new conversation; it keeps the history from now on."""
+    response = http.post(
+        f"{API_BASE_URL}/sessions",
+        json={"system_prompt": SYSTEM_PROMPT},
+        timeout=TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()["session_id"]
+
+
+def read_sse(response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: ") and event is not None:
+            yield event, json.loads(line[len("data: "):])
+            event = None
 
-# Initialize session state for chat history
+
+# Initialize session state for chat history (kept locally only for display)
 if "messages" not in st.session_state:
     st.session_state.messages = [
-        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "assistant",
             "content": "Hello! I'm your AI assistant. How can I help you today?"}
     ]
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = None
+
 # App title
 st.title("🤖 ChatBot with FastAPI Backend")
 
@@ -49,8 +101,15 @@ with st.sidebar:
     )
 
     if st.button("Clear Chat History"):
+        if st.session_state.session_id:
+            try:
+                http.delete(
+                    f"{API_BASE_URL}/sessions/{st.session_state.session_id}", timeout=TIMEOUT)
+            except requests.exceptions.RequestException:
+                pass
+        st.session_state.session_id = None
         st.session_state.messages = [
-            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "assistant",
                 "content": "Hello! I'm your AI assistant. How can I help you today?"}
         ]
@@ -72,42 +131,81 @@ if prompt := st.chat_input("What would you like to know?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Generate and display assistant response
+    # Generate and display the assistant response as it streams in
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                # Prepare request data for FastAPI
-                request_data = {
-                    "messages": st.session_state.messages,
-                    "model": model,
-                    "max_tokens": max_tokens,
-                    "temperature": temperature
-                }
-
-                # Call FastAPI backend
-                response = requests.post(
-                    f"{API_BASE_URL}/chat",
-                    json=request_data,
-                    headers={"Content-Type": "application/json"}
-                )
-
-                if response.status_code == 200:
-                    response_data = response.json()
-                    assistant_response = response_data["response"]
-
-                    # Display the response
-                    st.markdown(assistant_response)
-
-                    # Add assistant response to chat history
+        placeholder = st.empty()
+        # Clicking Stop reruns the script, which interrupts the loop below;
+        # closing the response then makes the backend cancel the generation
+        stop_area = st.empty()
+        stop_area.button("⏹ Stop", key="stop_generation")
+        parts = []
+        response = None
+        finished = False
+        usage = None
+        try:
+            if st.session_state.session_id is None:
+                st.session_state.session_id = create_backend_session()
+
+            # Send only the new turn; the backend owns the history
+            request_data = {
+                "message": {"role": "user", "content": prompt},
+                "model": model,
+                "max_tokens": max_tokens,
+                "temperature": temperature
+            }
+
+            placeholder.markdown("_Thinking..._")
+            response = http.post(
+                f"{API_BASE_URL}/sessions/{st.session_state.session_id}/messages/stream",
+                json=request_data,
+                stream=True,
+                timeout=TIMEOUT
+            )
+
+            if response.status_code == 404:
+                # Session evicted or backend restarted: start a fresh one
+                st.session_state.session_id = None
+                placeholder.empty()
+                st.error("Your session expired on the server. Please resend your message.")
+            elif response.status_code != 200:
+                placeholder.empty()
+                st.error(f"API Error: {response.status_code} - {response.text}")
+            else:
+                renderer = StreamRenderer(placeholder.container())
+                for event, data in read_sse(response):
+                    if event == "delta":
+                        parts.append(data["content"])
+                        renderer.write(data["content"])
+                    elif event == "error":
+                        st.error(f"The model call failed: {data['detail']}")
+                        break
+                    elif event == "done":
+                        finished = True
+                        usage = data.get("usage")
+
+                assistant_response = renderer.close()
+                if finished:
+                    st.caption(format_usage(usage))
                     st.session_state.messages.append(
                         {"role": "assistant", "content": assistant_response}
                     )
-                else:
-                    st.error(
-                        f"API Error: {response.status_code} - {response.text}")
-
-            except requests.exceptions.ConnectionError:
-                st.error(
-                    "Could not connect to the FastAPI backend. Make sure it's running on http://localhost:8000")
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+
+        except requests.exceptions.ConnectionError:
+            placeholder.empty()
+            st.error(
+                "Could not connect to the FastAPI backend. Make sure it's running on http://localhost:8000")
+        except requests.exceptions.Timeout:
+            placeholder.empty()
+            st.error("The backend took too long to respond. Please try again.")
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+        finally:
+            if response is not None:
+                response.close()
+            if parts and not finished:
+                # Stopped or cut off: keep the partial text on screen only
+                # (the backend stores a turn only when its stream completes)
+                st.session_state.messages.append(
+                    {"role": "assistant", "content": "".join(parts) + " _(stopped)_"}
+                )
+            stop_area.empty()
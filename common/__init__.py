@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the sample apps (chat, summarizer, agents, RAG).
+
+The apps live in folders that are not Python packages, so each entry script
+adds the repo root to `sys.path` before importing from here.
+"""
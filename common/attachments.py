@@ -0,0 +1,336 @@
+"""
+Attachment processing for the chat apps (PDFs and images).
+
+PDFs:
+- Extracted page texts are cached by the SHA-256 of the file bytes, in memory
+  and on disk, so attaching the same PDF again (in a rerun, another browser
+  session or after a restart) does not re-parse it
+- Large PDFs are split into page ranges and parsed on a process pool
+- The text sent to the model is capped by tokens, not characters
+- Pages are taken in order ("first") or ranked against the user's question
+  ("relevant") so the budget is spent on the pages that matter
+
+Images:
+- Downscaled to the resolution the vision model actually uses for the chosen
+  detail level, EXIF-rotated, stripped of metadata and re-encoded as JPEG
+- The resulting data URL is cached by content hash + settings
+- Each result reports bytes and estimated vision tokens saved
+
+Documents:
+- `iter_document_text` reads an uploaded TXT, Markdown or PDF file piece by
+  piece (lines or pages) for incremental summarization
+"""
+
+import base64
+import hashlib
+import io
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from common.cache import make_cache
+from common.history import count_tokens, truncate_tokens
+
+# Optional dependency: PyPDF2 (as used by the sample apps), or its successor pypdf
+try:
+    from PyPDF2 import PdfReader
+    HAS_PDF = True
+except ImportError:
+    try:
+        from pypdf import PdfReader
+        HAS_PDF = True
+    except ImportError:
+        HAS_PDF = False
+
+# Optional dependency: Pillow for image preprocessing (without it images pass through)
+try:
+    from PIL import Image, ImageOps
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+_WORD = re.compile(r"[a-z0-9]{2,}")
+STRATEGIES = ("first", "relevant")
+
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _extract_range(data: bytes, start: int, end: int) -> List[str]:
+    """Text of pages [start, end); top-level so process-pool workers can import it."""
+    reader = PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _terms(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def rank_pages(pages: List[str], question: str) -> List[int]:
+    """Page indices ordered by BM25 relevance to `question` (ties keep page order)."""
+    query = set(_terms(question))
+    if not query:
+        return list(range(len(pages)))
+    docs = [Counter(_terms(p)) for p in pages]
+    lengths = [sum(d.values()) for d in docs]
+    avg_len = (sum(lengths) / len(lengths)) or 1.0
+    n = len(docs)
+    k1, b = 1.2, 0.75
+    idf = {}
+    for term in query:
+        df = sum(1 for d in docs if term in d)
+        idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    scores = []
+    for i, doc in enumerate(docs):
+        score = 0.0
+        for term in query:
+            tf = doc.get(term, 0)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[i] / avg_len))
+        scores.append(score)
+    return sorted(range(n), key=lambda i: (-scores[i], i))
+
+
+class PDFExtractor:
+    """Extracts, caches and budgets PDF text for one process (share it across sessions)."""
+
+    def __init__(self, cache=None, max_workers: Optional[int] = None,
+                 parallel_min_pages: int = 16, model: str = "gpt-4o-mini"):
+        self.cache = cache
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.parallel_min_pages = parallel_min_pages
+        self.model = model
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def extract_pages(self, data: bytes) -> Tuple[List[str], bool]:
+        """Return (text per page, served from cache)."""
+        if not HAS_PDF:
+            raise RuntimeError("PDF support needs PyPDF2 (pip install PyPDF2)")
+        key = "pdf:" + file_digest(data)
+        if self.cache is not None:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit, True
+
+        total = len(PdfReader(io.BytesIO(data)).pages)
+        if total < self.parallel_min_pages or self.max_workers <= 1:
+            pages = _extract_range(data, 0, total)
+        else:
+            # A few ranges per worker keeps them busy when page sizes differ
+            step = max(1, math.ceil(total / (self.max_workers * 2)))
+            ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+            futures = [self._executor().submit(_extract_range, data, s, e) for s, e in ranges]
+            pages = [text for future in futures for text in future.result()]
+
+        if self.cache is not None:
+            self.cache.set(key, pages)
+        return pages, False
+
+    def select(self, pages: List[str], max_tokens: int, strategy: str = "first",
+               question: str = "") -> Tuple[str, List[int]]:
+        """Fit pages into `max_tokens`; returns the text and the 1-based pages used."""
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}")
+        order = rank_pages(pages, question) if strategy == "relevant" else range(len(pages))
+        chosen: Dict[int, str] = {}
+        used = 0
+        for i in order:
+            text = pages[i].strip()
+            if not text:
+                continue
+            block = f"[Page {i + 1}]\n{text}"
+            cost = count_tokens(block, self.model)
+            if used + cost > max_tokens:
+                remaining = max_tokens - used
+                if remaining > 50:
+                    chosen[i] = truncate_tokens(block, remaining, self.model) + "\n...[truncated]"
+                break
+            chosen[i] = block
+            used += cost
+        # Always present the chosen pages in document order
+        used_pages = sorted(chosen)
+        return "\n\n".join(chosen[i] for i in used_pages), [i + 1 for i in used_pages]
+
+    def build_context(self, data: bytes, max_tokens: int = 3000, strategy: str = "first",
+                      question: str = "") -> Dict:
+        """Extract (cached) and select pages; returns text plus bookkeeping for the UI."""
+        pages, cached = self.extract_pages(data)
+        text, used = self.select(pages, max_tokens, strategy, question)
+        return {"text": text, "pages_used": used, "total_pages": len(pages),
+                "cached": cached, "tokens": count_tokens(text, self.model) if text else 0}
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def make_pdf_extractor(disk_path: Optional[str] = "pdf_text_cache.db",
+                       max_entries: int = 64, ttl: float = 30 * 24 * 3600,
+                       **kwargs) -> PDFExtractor:
+    """Extractor with a two-tier (memory + SQLite) text cache."""
+    return PDFExtractor(make_cache(max_entries=max_entries, ttl=ttl, disk_path=disk_path), **kwargs)
+
+
+# ----------------------------
+# Images
+# ----------------------------
+
+IMAGE_DETAILS = ("auto", "low", "high")
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+# Vision token accounting of gpt-4o-class models: a base cost plus 512px tiles
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+
+
+def vision_tokens(width: int, height: int, detail: str) -> int:
+    """Estimated prompt tokens for one image at `detail` ("low" or "high")."""
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    width, height = high_detail_size(width, height)
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * tiles
+
+
+def high_detail_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the API rescales to in high detail: fit 2048x2048, then shortest side 768."""
+    scale = min(1.0, 2048 / max(width, height))
+    if min(width, height) * scale > 768:
+        scale = 768 / min(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def target_size(width: int, height: int, detail: str) -> Tuple[int, int]:
+    """Largest size that still adds information at `detail` (never upscales)."""
+    if detail == "low":
+        scale = min(1.0, 512 / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    return high_detail_size(width, height)
+
+
+def _has_metadata(image) -> bool:
+    return any(key in image.info for key in ("exif", "xmp", "XML:com.adobe.xmp", "comment")) \
+        or bool(getattr(image, "text", None))
+
+
+class ImagePreprocessor:
+    """Shrinks uploaded images before they are base64-encoded and sent upstream."""
+
+    def __init__(self, cache=None, quality: int = 85):
+        self.cache = cache
+        self.quality = quality
+
+    def process(self, data: bytes, detail: str = "auto") -> Dict:
+        """Return the data URL plus size / token bookkeeping for one image."""
+        if detail not in IMAGE_DETAILS:
+            raise ValueError(f"detail must be one of {IMAGE_DETAILS}")
+        if not HAS_PIL:
+            return self._passthrough(data, detail)
+        key = f"img:{file_digest(data)}:{detail}:{self.quality}"
+        if self.cache is not None:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return {**hit, "cached": True}
+        result = self._process(data, detail)
+        if self.cache is not None:
+            self.cache.set(key, result)
+        return {**result, "cached": False}
+
+    @staticmethod
+    def _passthrough(data: bytes, detail: str) -> Dict:
+        """Without Pillow: send the original bytes (mime type sniffed from the header)."""
+        mime = "image/png" if data.startswith(b"\x89PNG") else \
+            "image/webp" if data[8:12] == b"WEBP" else \
+            "image/gif" if data.startswith(b"GIF8") else "image/jpeg"
+        return {"data_url": f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}",
+                "detail": detail, "original_bytes": len(data), "bytes": len(data),
+                "bytes_saved": 0, "tokens_before": None, "tokens_after": None,
+                "tokens_saved": 0, "cached": False}
+
+    def _process(self, data: bytes, detail: str) -> Dict:
+        image = Image.open(io.BytesIO(data))
+        original_format = image.format
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        if detail == "auto":
+            # Small images lose nothing at low detail; larger ones (receipts,
+            # documents) need high detail to stay legible
+            detail = "low" if max(width, height) <= 512 else "high"
+        # What the API would have charged for the raw upload
+        tokens_before = vision_tokens(width, height, "high" if max(width, height) > 512 else "low")
+
+        new_size = target_size(width, height, detail)
+        if new_size != (width, height):
+            image = image.resize(new_size, Image.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            # Flatten transparency onto white; JPEG has no alpha channel
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        out = io.BytesIO()
+        # Saving without exif/icc arguments drops the metadata
+        image.save(out, "JPEG", quality=self.quality, optimize=True, progressive=True)
+        payload, mime = out.getvalue(), "image/jpeg"
+
+        # Already small and clean: keep the original bytes if they are smaller
+        if (new_size == (width, height) and len(data) <= len(payload)
+                and original_format in MIME_TYPES
+                and not _has_metadata(Image.open(io.BytesIO(data)))):
+            payload, mime = data, MIME_TYPES[original_format]
+
+        tokens_after = vision_tokens(*new_size, detail)
+        return {
+            "data_url": f"data:{mime};base64,{base64.b64encode(payload).decode('ascii')}",
+            "detail": detail,
+            "original_size": [width, height],
+            "size": list(new_size),
+            "original_bytes": len(data),
+            "bytes": len(payload),
+            "bytes_saved": len(data) - len(payload),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+        }
+
+
+def make_image_preprocessor(max_entries: int = 64, **kwargs) -> ImagePreprocessor:
+    """Preprocessor with an in-memory data-URL cache (data URLs are large; no disk tier)."""
+    return ImagePreprocessor(make_cache(max_entries=max_entries), **kwargs)
+
+
+# ----------------------------
+# Documents
+# ----------------------------
+
+DOCUMENT_TYPES = ("txt", "md", "markdown", "pdf")
+
+
+def iter_document_text(name: str, stream: BinaryIO) -> Iterator[str]:
+    """
+    Text of an uploaded document, piece by piece: lines of a TXT / Markdown
+    file, or pages of a PDF (each followed by a blank line, so a page break
+    also ends a paragraph). Nothing is decoded ahead of the consumer.
+    """
+    stream.seek(0)
+    if name.lower().endswith(".pdf"):
+        if not HAS_PDF:
+            raise RuntimeError("PDF support needs PyPDF2 (pip install PyPDF2)")
+        for page in PdfReader(stream).pages:
+            yield (page.extract_text() or "") + "\n\n"
+        return
+    text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    try:
+        yield from text
+    finally:
+        # Leave the caller's stream open
+        text.detach()
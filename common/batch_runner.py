@@ -0,0 +1,275 @@
+"""
+Offline JSONL batch runner for the chat and summarizer services.
+
+Each input line is one request, in the same shape the services accept online:
+
+    {"custom_id": "r1", "url": "/chat", "body": {"messages": [...]}}
+    {"custom_id": "r2", "url": "/summarize", "body": {"text": "...", "max_words": 50}}
+
+(`kind: "chat" | "summarize"` may be used instead of `url`, and `id` instead
+of `custom_id`.) Bodies are validated with the services' own request models
+and executed through the same code paths as the HTTP handlers.
+
+Requests run with bounded asyncio concurrency and retry transient upstream
+errors with exponential backoff. Results are appended to the output JSONL as
+they finish, either in input order or in completion order. The output file is
+also the checkpoint: re-running with the same arguments skips lines that
+already have an "ok" result, so a killed run resumes where it stopped and
+lines that failed (rate limits, network errors) are tried again. A retried
+line appends a new result; the last one for a line is current.
+
+Usage:
+    python -m common.batch_runner requests.jsonl results.jsonl --concurrency 32
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SERVICE_FILES = {
+    "chat": REPO_ROOT / "chat-applications" / "fastapi_service" / "chat_api.py",
+    "summarize": REPO_ROOT / "text-generation-apps" / "fastapi_service" / "summarizer_api.py",
+}
+URL_KINDS = {"/chat": "chat", "/summarize": "summarize"}
+
+def load_service(kind: str):
+    """Import a service module by file path (the app folders are not packages)."""
+    path = SERVICE_FILES[kind]
+    if path.stem not in sys.modules:
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[path.stem] = module
+        spec.loader.exec_module(module)
+    return sys.modules[path.stem]
+
+
+class ServiceHost:
+    """Loads services on first use and runs their FastAPI lifespan (pooled clients)."""
+
+    def __init__(self):
+        self._stack = AsyncExitStack()
+        self._started: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, kind: str):
+        if kind not in self._started:
+            async with self._lock:
+                if kind not in self._started:
+                    service = load_service(kind)
+                    await self._stack.enter_async_context(
+                        service.app.router.lifespan_context(service.app))
+                    self._started[kind] = service
+        return self._started[kind]
+
+    async def __aenter__(self) -> "ServiceHost":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._stack.aclose()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Rate limits, timeouts, connection drops and 5xx are worth retrying."""
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def parse_row(line_no: int, row: dict) -> Tuple[str, str, dict]:
+    """Return (id, kind, body) for one input row."""
+    kind = row.get("kind") or URL_KINDS.get(row.get("url", ""))
+    body = row.get("body", row.get("payload"))
+    if body is None:
+        body = {k: v for k, v in row.items() if k not in ("id", "custom_id", "kind", "url")}
+    if kind is None:
+        kind = "chat" if "messages" in body else "summarize" if "text" in body else None
+    if kind not in SERVICE_FILES:
+        raise ValueError(f"cannot tell whether line {line_no} is a chat or summarize request")
+    return str(row.get("custom_id", row.get("id", line_no))), kind, body
+
+
+async def execute(service, kind: str, body: dict) -> dict:
+    """Validate `body` with the service's model and run the handler's own code path."""
+    if kind == "chat":
+        return await service.chat_reply(service.ChatRequest.model_validate(body))
+    request = service.SummarizeRequest.model_validate(body)
+    # The summarizer handler is synchronous; run it on the worker thread pool
+    return await asyncio.to_thread(service.summarize, request)
+
+
+class BatchRunner:
+    def __init__(self, concurrency: int = 16, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 order: str = "input", progress_every: int = 100):
+        if order not in ("input", "completion"):
+            raise ValueError("order must be 'input' or 'completion'")
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.order = order
+        self.progress_every = progress_every
+        self.counts = {"ok": 0, "error": 0, "skipped": 0, "retries": 0}
+
+    # ----------------------------
+    # Checkpoint / resume
+    # ----------------------------
+
+    @staticmethod
+    def completed_lines(output_path: str) -> Set[int]:
+        """Line numbers that already have an "ok" result; drops a torn final line."""
+        if not os.path.exists(output_path):
+            return set()
+        done: Set[int] = set()
+        with open(output_path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                f.truncate(end)
+        for raw in data[:end].splitlines():
+            if raw.strip():
+                row = json.loads(raw)
+                # Errors are retried on resume; a later "ok" for the line wins
+                if row.get("status") == "ok":
+                    done.add(row["line"])
+        return done
+
+    # ----------------------------
+    # Execution
+    # ----------------------------
+
+    async def run_one(self, line_no: int, raw: str) -> dict:
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"line": line_no, "id": None, "kind": None}
+        attempts = 0
+        try:
+            request_id, kind, body = parse_row(line_no, json.loads(raw))
+            result.update(id=request_id, kind=kind)
+            while True:
+                attempts += 1
+                try:
+                    response = await execute(await self.host.get(kind), kind, body)
+                    result.update(status="ok", response=response)
+                    break
+                except Exception as e:
+                    if attempts > self.max_retries or not is_retryable(e):
+                        raise
+                    self.counts["retries"] += 1
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        except Exception as e:
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+        result.update(attempts=attempts,
+                      latency_ms=round((time.perf_counter() - started) * 1000, 1))
+        return result
+
+    async def read_input(self, input_path: str, done: Set[int]) -> AsyncIterator[Tuple[int, str]]:
+        """Stream (line number, raw line) pairs, skipping blanks and finished lines."""
+        with open(input_path, "r", encoding="utf-8") as f:
+            for line_no, raw in enumerate(f, start=1):
+                if not raw.strip():
+                    continue
+                if line_no in done:
+                    self.counts["skipped"] += 1
+                    continue
+                yield line_no, raw
+
+    async def run(self, input_path: str, output_path: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency))
+
+        done = self.completed_lines(output_path)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        # Reorder buffer for input-order output (bounded by the window below)
+        pending: Dict[int, dict] = {}
+        dispatched: deque = deque()
+        window = asyncio.Semaphore(self.concurrency * 8)
+        write_lock = asyncio.Lock()
+        started = time.perf_counter()
+
+        async with AsyncExitStack() as stack:
+            self.host = await stack.enter_async_context(ServiceHost())
+            out = stack.enter_context(open(output_path, "a", encoding="utf-8"))
+
+            def write(result: dict) -> None:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                self.counts[result["status"]] += 1
+                finished = self.counts["ok"] + self.counts["error"]
+                if self.progress_every and finished % self.progress_every == 0:
+                    rate = finished / (time.perf_counter() - started)
+                    print(f"[batch] {finished} done ({rate:.1f}/s), "
+                          f"{self.counts['error']} errors, {self.counts['retries']} retries",
+                          file=sys.stderr)
+
+            async def emit(result: dict) -> None:
+                async with write_lock:
+                    if self.order == "completion":
+                        write(result)
+                        window.release()
+                        return
+                    pending[result["line"]] = result
+                    # Flush the contiguous run of finished lines in input order
+                    while dispatched and dispatched[0] in pending:
+                        write(pending.pop(dispatched.popleft()))
+                        window.release()
+
+            async def worker() -> None:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    await emit(await self.run_one(*item))
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                async for line_no, raw in self.read_input(input_path, done):
+                    await window.acquire()
+                    dispatched.append(line_no)
+                    await queue.put((line_no, raw))
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for w in workers:
+                    w.cancel()
+
+        self.counts["elapsed_s"] = round(time.perf_counter() - started, 2)
+        return self.counts
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run chat/summarize requests from a JSONL file.")
+    parser.add_argument("input", help="Input JSONL, one request per line")
+    parser.add_argument("output", help="Output JSONL (also used to resume)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--order", choices=["input", "completion"], default="input")
+    parser.add_argument("--progress-every", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(concurrency=args.concurrency, max_retries=args.max_retries,
+                         order=args.order, progress_every=args.progress_every)
+    counts = asyncio.run(runner.run(args.input, args.output))
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
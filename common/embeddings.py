@@ -0,0 +1,236 @@
+"""
+Batched, cached embedding and chunked vector-store ingestion.
+
+Embedding one chunk per request costs one HTTP round trip per chunk, and
+building every row in memory before a single insert holds the whole corpus
+(vectors included) at once. Here:
+
+- `Embedder.embed(texts)` sends inputs in batches (by count and by size) and
+  runs several batches concurrently on a small thread pool; duplicate texts
+  in a call are embedded once and results come back in input order
+- vectors are cached on disk (SQLite, float32 blobs) by model and SHA-256 of
+  the text, so re-running ingestion over unchanged text makes no API calls
+- `ingest(...)` streams records through the embedder and inserts them into
+  Milvus (or anything with a compatible `insert`) in fixed-size chunks, so
+  memory stays bounded by one chunk
+
+    embedder = Embedder(openai_client, model="text-embedding-3-small",
+                        cache=EmbeddingCache("embedding_cache.db"))
+    stats = ingest(milvus_client, "my_rag_collection",
+                   ({"id": i, "text": line} for i, line in enumerate(text_lines)), embedder)
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+Vector = List[float]
+
+
+def text_hash(text: str) -> str:
+    """Cache identity of an input: SHA-256 of the exact text (embeddings are whitespace-sensitive)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Vectors on disk by (model, text hash), stored as float32 blobs in SQLite."""
+
+    def __init__(self, path: str = "embedding_cache.db"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            )
+            """
+        )
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, Vector]:
+        found: Dict[str, Vector] = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                part = list(hashes[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? "
+                    f"AND hash IN ({','.join('?' * len(part))})", [model, *part]).fetchall()
+                for h, blob in rows:
+                    found[h] = array("f", blob).tolist()
+            self.hits += len(found)
+            self.misses += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Vector]) -> None:
+        rows = [(model, h, array("f", v).tobytes()) for h, v in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self)}
+
+
+@dataclass
+class EmbedStats:
+    texts: int = 0
+    unique: int = 0
+    cache_hits: int = 0
+    embedded: int = 0
+    requests: int = 0
+    seconds: float = 0.0
+
+
+class Embedder:
+    def __init__(self, client: Any, model: str = "text-embedding-3-small",
+                 cache: Optional[EmbeddingCache] = None, batch_size: int = 256,
+                 max_batch_chars: int = 200_000, max_concurrency: int = 4,
+                 dimensions: Optional[int] = None):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size            # the API accepts up to 2048 inputs
+        self.max_batch_chars = max_batch_chars  # ~50k tokens, well under the per-request cap
+        self.dimensions = dimensions
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self.stats = EmbedStats()
+
+    @property
+    def cache_model(self) -> str:
+        """Cache namespace: the model, plus the output size when it is shortened."""
+        return f"{self.model}@{self.dimensions}" if self.dimensions else self.model
+
+    def _batches(self, texts: List[str]) -> Iterator[List[str]]:
+        batch: List[str] = []
+        chars = 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                yield batch
+                batch, chars = [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            yield batch
+
+    def _request(self, batch: List[str]) -> List[Vector]:
+        kwargs = {"dimensions": self.dimensions} if self.dimensions else {}
+        response = self.client.embeddings.create(input=batch, model=self.model, **kwargs)
+        # `index` gives each vector's position in the batch
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def embed(self, texts: Sequence[str]) -> List[Vector]:
+        """Vectors for `texts`, in order; cached ones are not requested again."""
+        started = time.perf_counter()
+        hashes = [text_hash(t) for t in texts]
+        unique = dict(zip(hashes, texts))
+        vectors = self.cache.get_many(self.cache_model, list(unique)) if self.cache is not None else {}
+        missing = [h for h in unique if h not in vectors]
+
+        if missing:
+            batches = list(self._batches([unique[h] for h in missing]))
+            fresh: Dict[str, Vector] = {}
+            position = 0
+            for batch, result in zip(batches, self.pool.map(self._request, batches)):
+                for vector in result:
+                    fresh[missing[position]] = vector
+                    position += 1
+            if self.cache is not None:
+                self.cache.put_many(self.cache_model, fresh)
+            vectors.update(fresh)
+            self.stats.requests += len(batches)
+
+        self.stats.texts += len(texts)
+        self.stats.unique += len(unique)
+        self.stats.cache_hits += len(unique) - len(missing)
+        self.stats.embedded += len(missing)
+        self.stats.seconds += time.perf_counter() - started
+        return [vectors[h] for h in hashes]
+
+    def embed_one(self, text: str) -> Vector:
+        return self.embed([text])[0]
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+
+
+# ----------------------------
+# Ingestion
+# ----------------------------
+
+@dataclass
+class IngestStats:
+    records: int = 0
+    inserted: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self, embedder: Optional[Embedder] = None) -> Dict[str, Any]:
+        stats = asdict(self)
+        if embedder is not None:
+            stats["embedding"] = asdict(embedder.stats)
+        return stats
+
+
+def iter_chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    chunk: List[dict] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest(vector_client: Any, collection_name: str, records: Iterable[dict], embedder: Embedder,
+           text_field: str = "text", vector_field: str = "vector", chunk_size: int = 512,
+           skip_empty: bool = True, upsert: bool = False) -> IngestStats:
+    """
+    Embed `records` (dicts with a `text_field`) and insert them chunk by chunk.
+
+    Each chunk is embedded (batched, concurrent, cached) and then inserted, so
+    only one chunk of rows is in memory at a time. `skip_empty` drops records
+    whose text is blank (e.g. the piece before a file's first "# " heading).
+    """
+    started = time.perf_counter()
+    stats = IngestStats()
+    write = vector_client.upsert if upsert else vector_client.insert
+    if skip_empty:
+        records = (r for r in records if r[text_field].strip())
+    for chunk in iter_chunks(records, chunk_size):
+        vectors = embedder.embed([r[text_field] for r in chunk])
+        rows = [{**r, vector_field: v} for r, v in zip(chunk, vectors)]
+        result = write(collection_name=collection_name, data=rows)
+        stats.records += len(chunk)
+        stats.inserted += _write_count(result, len(rows), upsert)
+        stats.chunks += 1
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def _write_count(result: Any, default: int, upsert: bool) -> int:
+    """Rows written, from a MilvusClient insert / upsert result when it reports one."""
+    if isinstance(result, dict):
+        return result.get("upsert_count" if upsert else "insert_count", default)
+    return default
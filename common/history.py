@@ -0,0 +1,229 @@
+"""
+Token-budget aware history compaction.
+
+Keeps the system prompt and the most recent turns verbatim and folds older
+turns into a rolling summary. The summary is updated incrementally: each call
+only summarizes the turns that fell out of the window since the last fold,
+and folds down to a low watermark so it does not re-run on every request.
+
+Works on OpenAI-style message dicts ({"role": ..., "content": ...}); callers
+with other message types convert at the edge.
+"""
+
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# Optional dependency: exact token counts with tiktoken, estimate without it
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+# Per-message framing overhead used by OpenAI chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+Summarizer = Callable[[str, List[dict]], str]
+AsyncSummarizer = Callable[[str, List[dict]], Awaitable[str]]
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str):
+    """Encoder per model, built once per process (None -> estimate)."""
+    if not HAS_TIKTOKEN:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # BPE files are downloaded on first use; offline hosts fall back
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Token count of a string; memoized so replayed history is counted once."""
+    encoder = get_encoder(model)
+    if encoder is None:
+        return max(1, len(text) // 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """Cut `text` to at most `max_tokens` tokens (about 4 chars per token without tiktoken)."""
+    if max_tokens <= 0:
+        return ""
+    encoder = get_encoder(model)
+    if encoder is None:
+        return text[:max_tokens * 4]
+    tokens = encoder.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens])
+
+
+def message_text(message: dict) -> str:
+    """Text of a message; multimodal content keeps only its text parts."""
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "\n".join(p.get("text", "") for p in content if p.get("type") == "text")
+    return content
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-4o-mini") -> int:
+    return sum(count_tokens(message_text(m), model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def build_summary_prompt(previous_summary: str, messages: List[dict],
+                         max_words: int = 200) -> List[dict]:
+    """Prompt that folds `messages` into `previous_summary`."""
+    transcript = "\n".join(f"{m['role']}: {message_text(m)}" for m in messages)
+    return [
+        {"role": "system", "content": (
+            "You maintain a running summary of a conversation. Update the summary "
+            "with the new turns, keeping facts, names, numbers, decisions and open "
+            f"questions. Reply with the updated summary only, in at most {max_words} words.")},
+        {"role": "user", "content": (
+            f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}")},
+    ]
+
+
+def _fingerprint(message: dict) -> str:
+    return hashlib.sha1(f"{message['role']}\x00{message_text(message)}".encode()).hexdigest()
+
+
+@dataclass
+class CompactionState:
+    """Rolling summary of one conversation plus a marker of what it covers."""
+    summary: str = ""
+    folded: int = 0
+    last_folded: Optional[str] = None
+
+
+class HistoryCompactor:
+    """
+    Fit a conversation into `budget_tokens`.
+
+    - Leading system messages are always kept.
+    - At least `keep_recent` most recent messages are kept verbatim.
+    - When over budget, older turns are folded into the summary until the
+      verbatim tail fits in `low_watermark * budget_tokens`.
+    - Without a summarizer, older turns are simply dropped.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, keep_recent: int = 4,
+                 model: str = "gpt-4o-mini", low_watermark: float = 0.6,
+                 max_states: int = 10000):
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent
+        self.model = model
+        self.low_watermark = low_watermark
+        self.max_states = max_states
+        self._states: "OrderedDict[str, CompactionState]" = OrderedDict()
+
+    def state_for(self, key: str) -> CompactionState:
+        """Per-conversation state, LRU-bounded."""
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = CompactionState()
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+        return state
+
+    def drop_state(self, key: str) -> None:
+        self._states.pop(key, None)
+
+    def _unfolded_start(self, rest: List[dict], state: CompactionState,
+                        trimmed: bool) -> Optional[int]:
+        """Index in `rest` of the first turn not yet covered by the summary (None if unknown)."""
+        if state.last_folded is None:
+            return 0
+        # Usual case: history only grew since the last fold
+        expected = state.folded - 1
+        if 0 <= expected < len(rest) and _fingerprint(rest[expected]) == state.last_folded:
+            return expected + 1
+        # History was trimmed at the front: look for the marker further back
+        for i in range(min(expected, len(rest) - 1), -1, -1):
+            if _fingerprint(rest[i]) == state.last_folded:
+                return i + 1
+        # Marker not in this history. A server-owned window (`trimmed`) slid past
+        # it, so everything left is newer than the summary; a client-supplied
+        # history cannot be shown to belong to the summary at all
+        return 0 if trimmed else None
+
+    def _plan(self, messages: List[dict], state: CompactionState, trimmed: bool = False
+              ) -> Tuple[List[dict], List[dict], List[dict]]:
+        """Split into (system, turns to fold now, verbatim tail)."""
+        n_system = 0
+        while n_system < len(messages) and messages[n_system]["role"] == "system":
+            n_system += 1
+        system, rest = messages[:n_system], messages[n_system:]
+        start = self._unfolded_start(rest, state, trimmed)
+        if start is None:
+            # Never replay a summary whose marker this history does not contain
+            state.summary, state.folded, state.last_folded = "", 0, None
+            start = 0
+        pending = rest[start:]
+
+        fixed = count_message_tokens(system, self.model)
+        if state.summary:
+            fixed += count_tokens(state.summary, self.model) + MESSAGE_OVERHEAD_TOKENS
+        if fixed + count_message_tokens(pending, self.model) <= self.budget_tokens:
+            return system, [], pending
+
+        # Over budget: keep the newest turns that fit under the low watermark
+        target = max(0, int(self.budget_tokens * self.low_watermark) - fixed)
+        keep, used = 0, 0
+        for message in reversed(pending):
+            cost = count_message_tokens([message], self.model)
+            if keep >= self.keep_recent and used + cost > target:
+                break
+            keep += 1
+            used += cost
+        cut = len(pending) - keep
+        return system, pending[:cut], pending[cut:]
+
+    def _assemble(self, system: List[dict], state: CompactionState,
+                  tail: List[dict]) -> List[dict]:
+        summary = [{"role": "system", "content": SUMMARY_PREFIX + state.summary}] if state.summary else []
+        return system + summary + tail
+
+    def _advance(self, rest_len: int, tail_len: int, folded: List[dict],
+                 state: CompactionState) -> None:
+        state.folded = rest_len - tail_len
+        state.last_folded = _fingerprint(folded[-1])
+
+    def compact(self, messages: List[dict], state: Optional[CompactionState] = None,
+                summarize: Optional[Summarizer] = None, trimmed: bool = False) -> List[dict]:
+        """
+        Compact with a blocking summarizer (or none, to just truncate).
+
+        Pass `trimmed=True` when `messages` is a window over a history the
+        caller owns (e.g. a session store), so turns missing from its front
+        were trimmed by the caller and the summary still applies.
+        """
+        state = state if state is not None else CompactionState()
+        system, to_fold, tail = self._plan(messages, state, trimmed)
+        if to_fold:
+            if summarize is not None:
+                state.summary = summarize(state.summary, to_fold)
+            self._advance(len(messages) - len(system), len(tail), to_fold, state)
+        return self._assemble(system, state, tail)
+
+    async def acompact(self, messages: List[dict], state: Optional[CompactionState] = None,
+                       summarize: Optional[AsyncSummarizer] = None,
+                       trimmed: bool = False) -> List[dict]:
+        """Same as `compact`, with an async summarizer."""
+        state = state if state is not None else CompactionState()
+        system, to_fold, tail = self._plan(messages, state, trimmed)
+        if to_fold:
+            if summarize is not None:
+                state.summary = await summarize(state.summary, to_fold)
+            self._advance(len(messages) - len(system), len(tail), to_fold, state)
+        return self._assemble(system, state, tail)
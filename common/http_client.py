@@ -0,0 +1,236 @@
+"""
+Pooled OpenAI clients for the FastAPI services.
+
+One `OpenAIClientManager` per process owns an httpx connection pool (max
+connections, keep-alive, optional HTTP/2) and the OpenAI client built on top of
+it. Services open it in their FastAPI lifespan, optionally pre-open a few
+connections so the first requests do not pay TCP/TLS setup, and close it on
+shutdown. Per-endpoint timeouts and pool statistics come from the same object.
+
+Settings are read from the environment:
+
+    OPENAI_MAX_CONNECTIONS      (default 100)
+    OPENAI_MAX_KEEPALIVE        (default 20)
+    OPENAI_KEEPALIVE_EXPIRY     seconds (default 30)
+    OPENAI_HTTP2                1/0 (default 0, needs the `h2` package)
+    OPENAI_CONNECT_TIMEOUT      seconds (default 5)
+    OPENAI_TIMEOUT              default read timeout in seconds (default 60)
+    OPENAI_ENDPOINT_TIMEOUTS    e.g. "chat=60,chat_stream=300,summarize=120"
+    OPENAI_WARMUP_CONNECTIONS   connections to pre-open at startup (default 2)
+"""
+
+import asyncio
+import os
+import threading
+import warnings
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+@dataclass
+class HTTPClientSettings:
+    max_connections: int = 100
+    max_keepalive: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 5.0
+    default_timeout: float = 60.0
+    timeouts: Dict[str, float] = field(default_factory=dict)
+    warmup_connections: int = 2
+
+    @classmethod
+    def from_env(cls) -> "HTTPClientSettings":
+        timeouts = {}
+        for item in os.getenv("OPENAI_ENDPOINT_TIMEOUTS", "").split(","):
+            if "=" in item:
+                name, seconds = item.split("=", 1)
+                timeouts[name.strip()] = float(seconds)
+        return cls(
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=_env_float("OPENAI_KEEPALIVE_EXPIRY", 30.0),
+            http2=os.getenv("OPENAI_HTTP2", "0") == "1",
+            connect_timeout=_env_float("OPENAI_CONNECT_TIMEOUT", 5.0),
+            default_timeout=_env_float("OPENAI_TIMEOUT", 60.0),
+            timeouts=timeouts,
+            warmup_connections=int(os.getenv("OPENAI_WARMUP_CONNECTIONS", "2")),
+        )
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, manager: "OpenAIClientManager", **kwargs):
+        super().__init__(**kwargs)
+        self.manager = manager
+
+    def handle_request(self, request):
+        self.manager._started()
+        try:
+            return super().handle_request(request)
+        except Exception:
+            self.manager._failed()
+            raise
+        finally:
+            self.manager._finished()
+
+
+class _CountingAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, manager: "OpenAIClientManager", **kwargs):
+        super().__init__(**kwargs)
+        self.manager = manager
+
+    async def handle_async_request(self, request):
+        self.manager._started()
+        try:
+            return await super().handle_async_request(request)
+        except Exception:
+            self.manager._failed()
+            raise
+        finally:
+            self.manager._finished()
+
+
+class OpenAIClientManager:
+    """Builds, warms up, measures and closes one pooled OpenAI client."""
+
+    def __init__(self, settings: Optional[HTTPClientSettings] = None, asynchronous: bool = True):
+        self.settings = settings or HTTPClientSettings.from_env()
+        self.asynchronous = asynchronous
+        self.client = None
+        self._http = None
+        self._transport = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._in_flight = 0
+        self._errors = 0
+
+    # ----------------------------
+    # Lifecycle
+    # ----------------------------
+
+    def open(self, api_key: Optional[str] = None, **client_kwargs):
+        """Create the pooled client (idempotent)."""
+        if self.client is not None:
+            return self.client
+        s = self.settings
+        http2 = s.http2 and HAS_HTTP2
+        if s.http2 and not HAS_HTTP2:
+            warnings.warn("OPENAI_HTTP2=1 but the `h2` package is missing; using HTTP/1.1")
+        pool_kwargs = dict(
+            limits=httpx.Limits(max_connections=s.max_connections,
+                                max_keepalive_connections=s.max_keepalive,
+                                keepalive_expiry=s.keepalive_expiry),
+            http2=http2,
+        )
+        if self.asynchronous:
+            self._transport = _CountingAsyncTransport(self, **pool_kwargs)
+            self._http = httpx.AsyncClient(transport=self._transport, timeout=self.timeout())
+            self.client = AsyncOpenAI(api_key=api_key, http_client=self._http, **client_kwargs)
+        else:
+            self._transport = _CountingTransport(self, **pool_kwargs)
+            self._http = httpx.Client(transport=self._transport, timeout=self.timeout())
+            self.client = OpenAI(api_key=api_key, http_client=self._http, **client_kwargs)
+        return self.client
+
+    @property
+    def http(self):
+        """The pooled httpx client, for SDKs that take one (e.g. `ChatOpenAI(http_async_client=...)`)."""
+        return self._http
+
+    async def warm_up(self) -> int:
+        """Pre-open connections with cheap concurrent GETs; returns how many succeeded."""
+        n = self.settings.warmup_connections
+        if self.client is None or n <= 0:
+            return 0
+        url = str(self.client.base_url).rstrip("/") + "/models"
+        headers = {"Authorization": f"Bearer {self.client.api_key}"}
+
+        async def ping():
+            try:
+                if self.asynchronous:
+                    await self._http.get(url, headers=headers)
+                else:
+                    await asyncio.to_thread(self._http.get, url, headers=headers)
+                return True
+            except httpx.HTTPError:
+                return False
+
+        return sum(await asyncio.gather(*(ping() for _ in range(n))))
+
+    async def aclose(self) -> None:
+        if self._http is None:
+            return
+        if self.asynchronous:
+            await self._http.aclose()
+        else:
+            self._http.close()
+        self._http = None
+        self._transport = None
+        self.client = None
+
+    @asynccontextmanager
+    async def lifespan(self, api_key: Optional[str] = None, **client_kwargs):
+        """Open + warm up on enter, close on exit; use inside a FastAPI lifespan."""
+        self.open(api_key, **client_kwargs)
+        await self.warm_up()
+        try:
+            yield self.client
+        finally:
+            await self.aclose()
+
+    # ----------------------------
+    # Timeouts and statistics
+    # ----------------------------
+
+    def timeout(self, endpoint: Optional[str] = None) -> httpx.Timeout:
+        """Timeout for a named endpoint (falls back to the default)."""
+        read = self.settings.timeouts.get(endpoint, self.settings.default_timeout)
+        return httpx.Timeout(read, connect=self.settings.connect_timeout)
+
+    def _started(self) -> None:
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+
+    def _finished(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _failed(self) -> None:
+        with self._lock:
+            self._errors += 1
+
+    def stats(self) -> Dict:
+        """Request counters plus a best-effort view of the connection pool."""
+        s = self.settings
+        stats = {
+            "open": self.client is not None,
+            "http2": s.http2 and HAS_HTTP2,
+            "max_connections": s.max_connections,
+            "max_keepalive": s.max_keepalive,
+            "requests_total": self._requests,
+            # Counted until response headers arrive (streamed bodies excluded)
+            "requests_in_flight": self._in_flight,
+            "transport_errors": self._errors,
+        }
+        # httpx does not expose pool state publicly; read httpcore's if present
+        pool = getattr(self._transport, "_pool", None) if self._http is not None else None
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            stats["connections"] = len(connections)
+            stats["connections_idle"] = sum(1 for c in connections if c.is_idle())
+            stats["connections_available"] = sum(1 for c in connections if c.is_available())
+        return stats
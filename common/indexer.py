@@ -0,0 +1,202 @@
+"""
+Incremental re-indexing of a document folder into a vector collection.
+
+Dropping the collection and re-embedding every chunk on each run costs time
+proportional to the corpus. `IncrementalIndexer.sync(paths)` instead costs
+time proportional to the change:
+
+- a JSON manifest records, per source file, its size / mtime / SHA-256 and
+  the ids and content hashes of its chunks
+- files whose size and mtime (or, failing that, hash) are unchanged are not
+  even split again
+- chunk ids are derived from content (source path + chunk text + occurrence),
+  so an edit changes only the ids of the chunks it touched
+- new or changed chunks are upserted (through `common.embeddings.ingest`, so
+  their vectors are batched and cached); chunks that disappeared, including
+  all chunks of deleted files, are deleted by id
+- the manifest is written atomically after the collection was updated, so an
+  interrupted run is simply repeated (upserts are idempotent)
+
+    indexer = IncrementalIndexer(milvus_client, "my_rag_collection", embedder,
+                                 manifest_path="milvus_index_manifest.json")
+    stats = indexer.sync(glob("data/milvus_docs/*.md"))
+
+Ids are 63-bit integers, valid for Milvus' default INT64 primary key.
+"""
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from common.embeddings import Embedder, ingest
+
+MANIFEST_VERSION = 1
+
+
+def split_markdown(text: str, separator: str = "# ") -> List[str]:
+    """The notebooks' chunking: split on "# " (roughly one FAQ entry per chunk)."""
+    return text.split(separator)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, text: str, occurrence: int = 0) -> int:
+    """Stable 63-bit id of a chunk: same source, text and occurrence -> same id."""
+    digest = hashlib.sha256(f"{source}\0{occurrence}\0{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & ((1 << 63) - 1)
+
+
+def file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+@dataclass
+class SyncStats:
+    files_scanned: int = 0
+    files_changed: int = 0
+    files_removed: int = 0
+    chunks_upserted: int = 0
+    chunks_deleted: int = 0
+    chunks_unchanged: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class IncrementalIndexer:
+    def __init__(self, vector_client: Any, collection_name: str, embedder: Embedder,
+                 manifest_path: str = "index_manifest.json",
+                 splitter: Callable[[str], List[str]] = split_markdown,
+                 skip_empty: bool = True, chunk_size: int = 512):
+        self.client = vector_client
+        self.collection_name = collection_name
+        self.embedder = embedder
+        self.manifest_path = manifest_path
+        self.splitter = splitter
+        self.skip_empty = skip_empty
+        self.chunk_size = chunk_size
+        self.manifest = self._load()
+
+    # ----------------------------
+    # Manifest
+    # ----------------------------
+
+    def _empty(self) -> Dict[str, Any]:
+        return {"version": MANIFEST_VERSION, "collection": self.collection_name,
+                "model": self.embedder.cache_model, "files": {}}
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return self._empty()
+        # A different collection or embedding model invalidates every entry
+        if (manifest.get("version") != MANIFEST_VERSION
+                or manifest.get("collection") != self.collection_name
+                or manifest.get("model") != self.embedder.cache_model):
+            return self._empty()
+        return manifest
+
+    def _save(self) -> None:
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def reset(self) -> None:
+        """Forget what was indexed (call after creating an empty collection)."""
+        self.manifest = self._empty()
+        self._save()
+
+    # ----------------------------
+    # Sync
+    # ----------------------------
+
+    def chunks(self, path: str, text: str) -> Dict[int, Tuple[str, str]]:
+        """id -> (content hash, text) for one file."""
+        chunks: Dict[int, Tuple[str, str]] = {}
+        seen: Dict[str, int] = {}
+        for piece in self.splitter(text):
+            if self.skip_empty and not piece.strip():
+                continue
+            digest = content_hash(piece)
+            occurrence = seen.get(digest, 0)
+            seen[digest] = occurrence + 1
+            chunks[chunk_id(path, piece, occurrence)] = (digest, piece)
+        return chunks
+
+    def _unchanged(self, entry: Optional[dict], path: str, stat: os.stat_result) -> Optional[str]:
+        """None if the file is unchanged since the manifest entry, else its current hash."""
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return None
+        digest = file_hash(path)
+        return None if entry and entry["sha256"] == digest else digest
+
+    def sync(self, paths: Iterable[str]) -> SyncStats:
+        """Bring the collection in line with `paths`; returns what changed."""
+        started = time.perf_counter()
+        stats = SyncStats()
+        files = self.manifest["files"]
+        upserts: List[dict] = []
+        deletes: List[int] = []
+        updated: Dict[str, dict] = {}
+
+        current = sorted({os.path.normpath(p) for p in paths})
+        for path in current:
+            stats.files_scanned += 1
+            stat = os.stat(path)
+            entry = files.get(path)
+            digest = self._unchanged(entry, path, stat)
+            if digest is None:
+                stats.chunks_unchanged += len(entry["chunks"])
+                if entry["mtime"] != stat.st_mtime:
+                    updated[path] = {**entry, "mtime": stat.st_mtime}
+                continue
+
+            stats.files_changed += 1
+            with open(path, "r", encoding="utf-8") as f:
+                chunks = self.chunks(path, f.read())
+            old = {int(i): h for i, h in (entry["chunks"].items() if entry else [])}
+            for cid, (_, piece) in chunks.items():
+                if cid not in old:
+                    upserts.append({"id": cid, "text": piece, "source": path})
+            deletes += [cid for cid in old if cid not in chunks]
+            stats.chunks_unchanged += sum(1 for cid in chunks if cid in old)
+            updated[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest,
+                             "chunks": {str(cid): h for cid, (h, _) in chunks.items()}}
+
+        current_set = set(current)
+        removed = [path for path in files if path not in current_set]
+        for path in removed:
+            deletes += [int(i) for i in files[path]["chunks"]]
+        stats.files_removed = len(removed)
+
+        # Add before removing, so searches never see a file with neither version
+        if upserts:
+            result = ingest(self.client, self.collection_name, upserts, self.embedder,
+                            chunk_size=self.chunk_size, skip_empty=False, upsert=True)
+            stats.chunks_upserted = result.inserted
+        if deletes:
+            for start in range(0, len(deletes), 1000):
+                self.client.delete(collection_name=self.collection_name,
+                                   ids=deletes[start:start + 1000])
+            stats.chunks_deleted = len(deletes)
+
+        if updated or removed:
+            files.update(updated)
+            for path in removed:
+                del files[path]
+            self._save()
+        stats.seconds = time.perf_counter() - started
+        return stats
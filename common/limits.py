@@ -0,0 +1,97 @@
+"""
+Concurrency limits for long-running requests (agent turns).
+
+An agent turn holds a worker for several LLM and tool round trips, so a
+service bounds how many run at once:
+
+- per session: by default a session runs one turn at a time, because turns
+  read and append the same history and overlapping turns would interleave it
+- per server: at most `max_concurrent` turns run in this worker; more wait in
+  line for up to `queue_timeout` seconds
+
+    limiter = ConcurrencyLimiter(max_concurrent=32, per_session=1, queue_timeout=10)
+    async with limiter.slot(session_id):
+        ...
+
+A request that cannot get a slot in time raises `LimiterBusy` (scope
+"session" or "server") instead of queueing forever, so clients get a quick
+429 / 503 and can retry. Both limits are per worker process.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List
+
+
+class LimiterBusy(Exception):
+    def __init__(self, scope: str, limit: int):
+        super().__init__(f"{scope} concurrency limit ({limit}) reached, retry later")
+        self.scope = scope
+        self.limit = limit
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent: int = 32, per_session: int = 1,
+                 queue_timeout: float = 10.0, session_timeout: float = 0.0):
+        self.max_concurrent = max_concurrent
+        self.per_session = per_session
+        self.queue_timeout = queue_timeout
+        self.session_timeout = session_timeout
+        self._server = asyncio.Semaphore(max_concurrent)
+        # session_id -> [semaphore, holders + waiters]; dropped when unused
+        self._sessions: Dict[str, List[Any]] = {}
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = {"session": 0, "server": 0}
+
+    @staticmethod
+    async def _acquire(semaphore: asyncio.Semaphore, timeout: float) -> bool:
+        if timeout <= 0:
+            if semaphore.locked():
+                return False
+            await semaphore.acquire()
+            return True
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @asynccontextmanager
+    async def slot(self, session_id: str) -> AsyncIterator[None]:
+        """Hold one session slot and one server slot for the block."""
+        entry = self._sessions.setdefault(session_id, [asyncio.Semaphore(self.per_session), 0])
+        entry[1] += 1
+        try:
+            if not await self._acquire(entry[0], self.session_timeout):
+                self.rejected["session"] += 1
+                raise LimiterBusy("session", self.per_session)
+            try:
+                self.waiting += 1
+                try:
+                    acquired = await self._acquire(self._server, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not acquired:
+                    self.rejected["server"] += 1
+                    raise LimiterBusy("server", self.max_concurrent)
+                self.active += 1
+                try:
+                    yield
+                finally:
+                    self.active -= 1
+                    self.completed += 1
+                    self._server.release()
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_concurrent": self.max_concurrent, "per_session": self.per_session,
+                "active": self.active, "waiting": self.waiting,
+                "sessions_active": len(self._sessions), "completed": self.completed,
+                "rejected": dict(self.rejected)}
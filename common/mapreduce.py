@@ -0,0 +1,323 @@
+"""
+Map-reduce summarization for documents too long for one prompt.
+
+1. Chunk: split on paragraphs and pack them into token-bounded chunks. Chunk
+   boundaries are content-defined (headings, or paragraphs whose hash hits a
+   fixed pattern), so editing one section only changes the chunks around it
+   instead of shifting every boundary after it.
+2. Map: summarize all chunks concurrently on a thread pool.
+3. Reduce: pack the summaries into groups that fit the fan-in budget and
+   summarize each group, level by level, until one summary remains.
+
+Every map/reduce call is cached by content, so re-running an edited document
+only re-summarizes the parts that changed. The `cache` argument follows the
+summarizer API's policy: "auto" reads the cache only at temperature 0,
+"prefer" always reads it, "bypass" neither reads nor writes it. `iter_summarize` yields events as
+chunks and levels finish, with per-stage timings, so callers can stream
+partial results. `iter_summarize_stream` does the same for a document read
+piece by piece (lines of a file, pages of a PDF): each chunk is submitted as
+soon as it is complete, so early sections are summarized while the rest of the
+file is still being read.
+"""
+
+import contextvars
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.cache import cache_key, normalize_text
+from common.history import count_tokens
+
+# (system instruction, text, temperature) -> summary
+ChunkSummarizer = Callable[[str, str, float], str]
+
+_HEADING = re.compile(r"^(#{1,6}\s|[A-Z0-9][A-Z0-9 .:-]{3,}$)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_BLANK_LINE = re.compile(r"\n\s*\n")
+
+
+def split_paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in _BLANK_LINE.split(text) if p.strip()]
+
+
+def iter_paragraphs(pieces: Iterable[str]) -> Iterator[str]:
+    """Paragraphs of text that arrives in pieces; only the open paragraph is buffered."""
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        parts = _BLANK_LINE.split(buffer)
+        buffer = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _split_oversized(paragraph: str, max_tokens: int, model: str) -> List[str]:
+    """Break a paragraph larger than `max_tokens` on sentences, then on words."""
+    pieces: List[str] = []
+    current: List[str] = []
+    used = 0
+    for sentence in _SENTENCE_END.split(paragraph):
+        cost = count_tokens(sentence, model)
+        if cost > max_tokens:
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // cost)
+            sentences = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            sentences = [sentence]
+        for s in sentences:
+            cost = count_tokens(s, model)
+            if current and used + cost > max_tokens:
+                pieces.append(" ".join(current))
+                current, used = [], 0
+            current.append(s)
+            used += cost
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _is_anchor(paragraph: str, period: int) -> bool:
+    """Content-defined boundary: a heading, or ~1 in `period` paragraphs by hash."""
+    if _HEADING.match(paragraph):
+        return True
+    digest = hashlib.md5(paragraph.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % period == 0
+
+
+def chunk_text(text: str, max_tokens: int = 2000, model: str = "gpt-4o-mini",
+               anchor_period: int = 8) -> List[str]:
+    """Split text into chunks of at most `max_tokens` with stable boundaries."""
+    return list(iter_chunks(split_paragraphs(text), max_tokens, model, anchor_period))
+
+
+def iter_chunks(paragraphs: Iterable[str], max_tokens: int = 2000, model: str = "gpt-4o-mini",
+                anchor_period: int = 8) -> Iterator[str]:
+    """`chunk_text` over a stream of paragraphs, yielding each chunk once it is complete."""
+    min_tokens = max_tokens // 2
+    current: List[str] = []
+    used = 0
+    for paragraph in paragraphs:
+        cost = count_tokens(paragraph, model)
+        parts = [paragraph] if cost <= max_tokens else _split_oversized(paragraph, max_tokens, model)
+        for part in parts:
+            cost = count_tokens(part, model)
+            # Start a new chunk at an anchor once the current one is big enough,
+            # or whenever the next part would not fit
+            if current and (used + cost > max_tokens
+                            or (used >= min_tokens and _is_anchor(part, anchor_period))):
+                yield "\n\n".join(current)
+                current, used = [], 0
+            current.append(part)
+            used += cost
+    if current:
+        yield "\n\n".join(current)
+
+
+def map_instruction(section_words: int) -> str:
+    return ("You summarize one section of a longer document. Keep key facts, names, "
+            f"numbers and conclusions. Reply in about {section_words} words.")
+
+
+def reduce_instruction(words: int, final: bool) -> str:
+    if final:
+        return ("You combine section summaries of one document into a single clear, "
+                f"concise summary of about {words} words. Do not mention the sections.")
+    return ("You merge consecutive section summaries of a document into one summary, "
+            f"keeping key facts. Reply in about {words} words.")
+
+
+class MapReduceSummarizer:
+    def __init__(self, summarize_fn: ChunkSummarizer, cache=None, model: str = "gpt-4o-mini",
+                 chunk_tokens: int = 2000, fan_in_tokens: int = 3000,
+                 section_words: int = 150, max_workers: int = 8):
+        self.summarize_fn = summarize_fn
+        self.cache = cache
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.fan_in_tokens = fan_in_tokens
+        self.section_words = section_words
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _summarize_cached(self, instruction: str, text: str, temperature: float,
+                          cache: str) -> Tuple[str, bool]:
+        key = cache_key("mapreduce", self.model, temperature, instruction, normalize_text(text))
+        use_cached = cache == "prefer" or (cache == "auto" and temperature == 0)
+        if self.cache is not None and use_cached:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit, True
+        summary = self.summarize_fn(instruction, text, temperature).strip()
+        if self.cache is not None and cache != "bypass":
+            self.cache.set(key, summary)
+        return summary, False
+
+    def _submit(self, instruction: str, text: str, temperature: float, cache: str):
+        # Run each call in a copy of the caller's context so per-request state
+        # (e.g. upstream time for metrics) follows the work onto the pool
+        return self.pool.submit(contextvars.copy_context().run,
+                                self._summarize_cached, instruction, text, temperature, cache)
+
+    def _group(self, summaries: List[str]) -> List[List[str]]:
+        """Pack summaries into groups under the fan-in budget (at least two, except a trailing one)."""
+        groups: List[List[str]] = []
+        current: List[str] = []
+        used = 0
+        for summary in summaries:
+            cost = count_tokens(summary, self.model)
+            if len(current) >= 2 and used + cost > self.fan_in_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(summary)
+            used += cost
+        if current:
+            # A trailing singleton stays on its own so the last group keeps to the budget
+            groups.append(current)
+        return groups
+
+    def _run_level(self, stage: str, level: int, inputs: List[str], instruction: str,
+                   temperature: float, cache: str) -> Iterator[Dict]:
+        """Summarize `inputs` concurrently; yield one event per item, then a level event."""
+        started = time.perf_counter()
+        results: List[Optional[str]] = [None] * len(inputs)
+        hits = 0
+        futures = {self._submit(instruction, text, temperature, cache): i
+                   for i, text in enumerate(inputs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            summary, cached = future.result()
+            results[i] = summary
+            hits += cached
+            yield {"event": "item", "stage": stage, "level": level, "index": i,
+                   "of": len(inputs), "summary": summary, "cached": cached}
+        yield {"event": "level", "stage": stage, "level": level, "items": len(inputs),
+               "cache_hits": hits, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+               "summaries": results}
+
+    def iter_summarize(self, text: str, max_words: int = 100,
+                       temperature: float = 0.3, cache: str = "prefer") -> Iterator[Dict]:
+        """Yield `item`, `level` and a final `done` event (with timings)."""
+        started = time.perf_counter()
+        t0 = time.perf_counter()
+        chunks = chunk_text(text, self.chunk_tokens, self.model)
+        timings = [{"stage": "chunk", "items": len(chunks),
+                    "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}]
+        if not chunks:
+            yield {"event": "done", "summary": "", "chunks": 0, "levels": 0,
+                   "timings": timings, "elapsed_ms": timings[0]["elapsed_ms"]}
+            return
+
+        instruction = map_instruction(self.section_words)
+        if len(chunks) == 1:
+            instruction = reduce_instruction(max_words, final=True)
+        summaries = yield from self._collect(
+            self._run_level("map", 0, chunks, instruction, temperature, cache), timings)
+        yield from self._iter_reduce(summaries, max_words, temperature, cache, timings,
+                                     len(chunks), started)
+
+    def iter_summarize_stream(self, pieces: Iterable[str], max_words: int = 100,
+                              temperature: float = 0.3, cache: str = "prefer") -> Iterator[Dict]:
+        """
+        `iter_summarize` for a document that arrives in pieces (lines, pages).
+
+        Chunks are submitted as soon as they are complete, and `item` events
+        are yielded as they finish while reading continues (`of` is None until
+        the total is known). `read` events report chunks formed so far.
+        """
+        started = time.perf_counter()
+        instruction = map_instruction(self.section_words)
+        futures: Dict = {}
+        results: Dict[int, str] = {}
+        hits = 0
+        count = 0
+        # One chunk of lookahead: a document that turns out to be a single
+        # chunk gets the final instruction directly, as in `iter_summarize`
+        pending: Optional[str] = None
+
+        def finished(block: bool) -> Iterator[Dict]:
+            nonlocal hits
+            waiting = [f for f, i in futures.items() if i not in results]
+            for future in (as_completed(waiting) if block else [f for f in waiting if f.done()]):
+                i = futures[future]
+                summary, cached = future.result()
+                results[i] = summary
+                hits += cached
+                yield {"event": "item", "stage": "map", "level": 0, "index": i,
+                       "of": count if block else None, "summary": summary, "cached": cached}
+
+        for chunk in iter_chunks(iter_paragraphs(pieces), self.chunk_tokens, self.model):
+            if pending is not None:
+                futures[self._submit(instruction, pending, temperature, cache)] = count - 1
+            pending = chunk
+            count += 1
+            yield {"event": "read", "chunks": count, "finished": False}
+            yield from finished(block=False)
+
+        read_ms = round((time.perf_counter() - started) * 1000, 1)
+        timings = [{"stage": "read", "items": count, "elapsed_ms": read_ms}]
+        yield {"event": "read", "chunks": count, "finished": True, "elapsed_ms": read_ms}
+        if pending is None:
+            yield {"event": "done", "summary": "", "chunks": 0, "levels": 0,
+                   "timings": timings, "elapsed_ms": read_ms}
+            return
+        if count == 1:
+            instruction = reduce_instruction(max_words, final=True)
+        futures[self._submit(instruction, pending, temperature, cache)] = count - 1
+        yield from finished(block=True)
+
+        summaries = [results[i] for i in range(count)]
+        # Map time overlaps reading, so it is measured from the start
+        elapsed = round((time.perf_counter() - started) * 1000, 1)
+        timings.append({"stage": "map", "level": 0, "items": count, "cache_hits": hits,
+                        "elapsed_ms": elapsed})
+        yield {"event": "level", "stage": "map", "level": 0, "items": count,
+               "cache_hits": hits, "elapsed_ms": elapsed, "summaries": summaries}
+        yield from self._iter_reduce(summaries, max_words, temperature, cache, timings,
+                                     count, started)
+
+    @staticmethod
+    def _collect(events: Iterator[Dict], timings: List[Dict]):
+        """Pass level events through, record their timing, return the level's summaries."""
+        summaries: List[str] = []
+        for event in events:
+            if event["event"] == "level":
+                summaries = event["summaries"]
+                timings.append({k: event[k] for k in ("stage", "level", "items",
+                                                      "cache_hits", "elapsed_ms")})
+            yield event
+        return summaries
+
+    def _iter_reduce(self, summaries: List[str], max_words: int, temperature: float,
+                     cache: str, timings: List[Dict], chunks: int,
+                     started: float) -> Iterator[Dict]:
+        """Reduce level by level until a final pass has run, then yield `done`."""
+        level = 0
+        # A single chunk was already summarized with the final instruction
+        final = chunks == 1
+        while not final:
+            level += 1
+            total = sum(count_tokens(s, self.model) for s in summaries)
+            groups = [summaries] if total <= self.fan_in_tokens else self._group(summaries)
+            # Whichever level is down to one input writes the final summary
+            final = len(groups) == 1
+            inputs = ["\n\n".join(group) for group in groups]
+            instruction = reduce_instruction(max_words if final else self.section_words, final)
+            summaries = yield from self._collect(
+                self._run_level("reduce", level, inputs, instruction, temperature, cache),
+                timings)
+
+        yield {"event": "done", "summary": summaries[0], "chunks": chunks,
+               "levels": level + 1, "timings": timings,
+               "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def summarize(self, text: str, max_words: int = 100,
+                  temperature: float = 0.3, cache: str = "prefer") -> Dict:
+        """Run to completion and return the `done` event."""
+        for event in self.iter_summarize(text, max_words, temperature, cache):
+            if event["event"] == "done":
+                return event
+        raise RuntimeError("map-reduce summarization produced no result")
@@ -0,0 +1,328 @@
+"""
+In-process metrics for the FastAPI services, cheap enough to leave on.
+
+- Counter / Gauge / Histogram with fixed label names and fixed buckets
+  (an observation is a bisect plus a few increments under a lock)
+- ServiceMetrics: the standard set for an LLM service plus an ASGI middleware
+  that times every request and tracks in-flight requests
+- Upstream time is accumulated per request through a context variable, so
+  the middleware can split total latency into upstream vs. our own overhead
+
+`GET /metrics` renders Prometheus text; `?format=json` adds p50/p95/p99
+estimated from the buckets.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from common.prompt_layout import usage_summary
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATIO_BUCKETS = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, labels: Tuple[str, ...]) -> str:
+        if not labels:
+            return ""
+        pairs = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labels))
+        return "{" + pairs + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self.values.items())
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._labels(k)} {v}" for k, v in self._items()]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [{"labels": dict(zip(self.labelnames, k)), "value": v} for k, v in self._items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self.series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], List[int], float]]:
+        """Consistent copy of every series, taken under the lock."""
+        with self._lock:
+            return [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+
+    def quantile(self, q: float, labels: Tuple[str, ...]) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside the bucket."""
+        with self._lock:
+            counts = list(self.series[labels][0])
+        return self._quantile(q, counts)
+
+    def _quantile(self, q: float, counts: List[int]) -> Optional[float]:
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, counts, total in self._items():
+            base = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += count
+                pairs = ",".join(f'{k}="{v}"' for k, v in base + [("le", bound)])
+                lines.append(f"{self.name}_bucket{{{pairs}}} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        out = []
+        for labels, counts, total in self._items():
+            n = sum(counts)
+            out.append({
+                "labels": dict(zip(self.labelnames, labels)),
+                "count": n,
+                "mean": round(total / n, 6) if n else None,
+                **{f"p{int(q * 100)}": self._quantile(q, counts) for q in (0.5, 0.95, 0.99)},
+            })
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def _add(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {m.name: m.snapshot() for m in self.metrics}
+
+
+# Upstream seconds spent on behalf of the current request
+_upstream_time: contextvars.ContextVar = contextvars.ContextVar("upstream_time", default=None)
+
+
+class BusyTime:
+    """Wall-clock time with at least one upstream call in flight.
+
+    Overlapping calls (e.g. map-reduce sections on a thread pool) are counted
+    once, so `total - seconds` stays a meaningful overhead figure.
+    """
+    __slots__ = ("seconds", "active", "busy_since", "lock")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.active = 0
+        self.busy_since = 0.0
+        self.lock = threading.Lock()
+
+    def enter(self, now: float) -> None:
+        with self.lock:
+            if self.active == 0:
+                self.busy_since = now
+            self.active += 1
+
+    def exit(self, now: float) -> None:
+        with self.lock:
+            self.active -= 1
+            if self.active == 0:
+                self.seconds += now - self.busy_since
+
+
+class ServiceMetrics:
+    """Standard metrics for one LLM-backed service."""
+
+    def __init__(self, service: str, registry: Optional[MetricsRegistry] = None):
+        self.service = service
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.request_latency = r.histogram(
+            "http_request_duration_seconds", "End-to-end request latency",
+            ("service", "endpoint", "status"))
+        self.overhead = r.histogram(
+            "http_request_overhead_seconds", "Request latency not spent waiting on the model",
+            ("service", "endpoint"))
+        self.upstream_latency = r.histogram(
+            "llm_upstream_duration_seconds", "Time spent in upstream model calls",
+            ("service", "endpoint", "model"))
+        self.ttft = r.histogram(
+            "llm_time_to_first_token_seconds", "Time to first streamed token",
+            ("service", "endpoint", "model"))
+        self.tokens = r.counter(
+            "llm_tokens_total", "Tokens by kind (prompt, completion, cached)",
+            ("service", "model", "kind"))
+        self.cache_hit_ratio = r.histogram(
+            "llm_prompt_cache_hit_ratio", "Per-request share of prompt tokens served from cache",
+            ("service", "model"), buckets=RATIO_BUCKETS)
+        self.in_flight = r.gauge(
+            "http_requests_in_flight", "Requests currently being served", ("service",))
+        self.errors = r.counter(
+            "http_request_errors_total", "Requests that raised or returned a 5xx",
+            ("service", "endpoint", "type"))
+        self.upstream_errors = r.counter(
+            "llm_upstream_errors_total", "Upstream model calls that raised",
+            ("service", "endpoint", "type"))
+
+    # ----------------------------
+    # Hot-path helpers
+    # ----------------------------
+
+    @contextmanager
+    def upstream(self, endpoint: str, model: str) -> Iterator[None]:
+        """Time an upstream call and charge it to the current request."""
+        acc = _upstream_time.get()
+        start = time.perf_counter()
+        if acc is not None:
+            acc.enter(start)
+        try:
+            yield
+        except Exception as e:
+            self.upstream_errors.inc(self.service, endpoint, type(e).__name__)
+            raise
+        finally:
+            end = time.perf_counter()
+            if acc is not None:
+                acc.exit(end)
+            self.upstream_latency.observe(end - start, self.service, endpoint, model)
+
+    def observe_ttft(self, endpoint: str, model: str, seconds: float) -> None:
+        self.ttft.observe(seconds, self.service, endpoint, model)
+
+    def record_usage(self, model: str, usage: Any) -> None:
+        """Count prompt / completion / cached tokens from an OpenAI `usage` object (or dict)."""
+        summary = usage_summary(usage)
+        if summary is None:
+            return
+        prompt, cached = summary["prompt_tokens"], summary["cached_tokens"]
+        self.tokens.inc(self.service, model, "prompt", amount=prompt)
+        self.tokens.inc(self.service, model, "completion", amount=summary["completion_tokens"])
+        if cached:
+            self.tokens.inc(self.service, model, "cached", amount=cached)
+        if prompt:
+            self.cache_hit_ratio.observe(cached / prompt, self.service, model)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request task or body buffering).
+
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    Streaming responses are timed until their last body chunk is sent.
+    """
+
+    def __init__(self, app, metrics: ServiceMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        m = self.metrics
+        start = time.perf_counter()
+        acc = BusyTime()
+        token = _upstream_time.set(acc)
+        status = [500]
+        raised = False
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        m.in_flight.inc(m.service)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            raised = True
+            m.errors.inc(m.service, self._endpoint(scope), type(e).__name__)
+            raise
+        finally:
+            _upstream_time.reset(token)
+            m.in_flight.dec(m.service)
+            elapsed = time.perf_counter() - start
+            endpoint = self._endpoint(scope)
+            m.request_latency.observe(elapsed, m.service, endpoint, str(status[0]))
+            m.overhead.observe(max(0.0, elapsed - acc.seconds), m.service, endpoint)
+            # An exception was already counted by type; only count returned 5xx here
+            if status[0] >= 500 and not raised:
+                m.errors.inc(m.service, endpoint, f"http_{status[0]}")
+
+    @staticmethod
+    def _endpoint(scope) -> str:
+        # Route template (e.g. /sessions/{session_id}) keeps label cardinality bounded
+        route = scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
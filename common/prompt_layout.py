@@ -0,0 +1,116 @@
+"""
+Cache-friendly message assembly.
+
+Provider prompt caching (see prompting_guide/prompt_caching.ipynb) only
+reuses a prefix that is byte-identical to an earlier request and at least
+1024 tokens long. So everything that stays the same across requests must
+come first, and everything that changes must come last:
+
+    1. system prompt + policy               static for the deployment
+    2. tool schemas (canonical JSON)        static for the deployment
+    3. pinned reference documents           static for the conversation
+    4. conversation history                 grows at the end only
+    5. per-request instructions + user turn changes every request
+
+`PromptLayout.build` produces the messages in that order. `usage_summary`
+turns an OpenAI `usage` object into prompt / cached token counts and a
+cache-hit ratio, for responses and UIs.
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+Content = Union[str, List[dict]]
+
+
+def canonical_tools(tools: Optional[Sequence[dict]]) -> Optional[List[dict]]:
+    """Tool schemas sorted by name with sorted keys, so their bytes never change."""
+    if not tools:
+        return None
+    def name(tool: dict) -> str:
+        return tool.get("function", {}).get("name") or tool.get("name", "")
+    return [json.loads(json.dumps(t, sort_keys=True)) for t in sorted(tools, key=name)]
+
+
+@dataclass
+class PromptLayout:
+    system: str
+    policy: str = ""
+    tools: Optional[List[dict]] = None
+    _system_message: Dict[str, str] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.tools = canonical_tools(self.tools)
+        text = self.system.strip()
+        if self.policy.strip():
+            text += "\n\n" + self.policy.strip()
+        # Built once: the same object (and bytes) for every request
+        self._system_message = {"role": "system", "content": text}
+
+    def prefix_fingerprint(self) -> str:
+        """Hash of the static prefix; a change here means a cold provider cache."""
+        payload = json.dumps([self._system_message, self.tools], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def build(self, user: Content, history: Optional[List[dict]] = None,
+              documents: Optional[Sequence[Tuple[str, str]]] = None,
+              instructions: str = "") -> List[dict]:
+        """
+        Messages in cache-friendly order.
+
+        - history: earlier turns (system messages are dropped; the layout owns them)
+        - documents: (title, text) pairs kept for the whole conversation
+        - instructions: per-request settings (length, format, ...), placed after
+          the user content so they never break the cached prefix
+        """
+        messages = [dict(self._system_message)]
+        if documents:
+            blocks = [f"[Document: {title}]\n{text}" for title, text in documents]
+            messages.append({"role": "user", "content": "Reference documents for this "
+                             "conversation:\n\n" + "\n\n".join(blocks)})
+            messages.append({"role": "assistant", "content": "Noted. I will use these documents."})
+        for message in history or []:
+            if message.get("role") != "system":
+                messages.append(message)
+        messages.append({"role": "user", "content": _append_instructions(user, instructions)})
+        return messages
+
+
+def _append_instructions(user: Content, instructions: str) -> Content:
+    if not instructions:
+        return user
+    if isinstance(user, str):
+        return f"{user}\n\n{instructions}"
+    return list(user) + [{"type": "text", "text": instructions}]
+
+
+def usage_summary(usage: Any) -> Optional[Dict[str, Any]]:
+    """Prompt / cached / completion tokens and the prompt-cache hit ratio."""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        details = usage.get("prompt_tokens_details") or {}
+        cached = details.get("cached_tokens") or 0
+    else:
+        prompt = usage.prompt_tokens or 0
+        completion = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    return {
+        "prompt_tokens": prompt,
+        "cached_tokens": cached,
+        "completion_tokens": completion,
+        "cache_hit_ratio": round(cached / prompt, 4) if prompt else 0.0,
+    }
+
+
+def format_usage(summary: Optional[Dict[str, Any]]) -> str:
+    """One-line caption for UIs, e.g. `Prompt cache: 1,792 / 1,884 tokens (95%)`."""
+    if not summary:
+        return "Prompt cache: no usage reported"
+    return (f"Prompt cache: {summary['cached_tokens']:,} / {summary['prompt_tokens']:,} "
+            f"tokens ({summary['cache_hit_ratio']:.0%})")
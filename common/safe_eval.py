@@ -0,0 +1,193 @@
+"""
+Safe, cached arithmetic for calculator tools.
+
+`eval(expression)` runs arbitrary code and can be stalled forever by inputs
+like `9**9**9`. `SafeEvaluator` instead:
+
+- parses the expression and accepts only a whitelist of AST nodes: numbers,
+  + - * / // % **, unary +/-, parentheses, a few math functions and constants
+- compiles the tree once into nested Python closures (no `eval` at run time)
+- memoizes compiled forms and results in LRU caches (whitespace and
+  formatting differences share one entry)
+- enforces size limits so every evaluation is cheap: expression length, AST
+  node count, exponent size, integer size (in bits), factorial argument and
+  `round` digits
+
+With bounded node counts and bounded operand sizes, evaluation time is
+bounded too; the limits take the place of a CPU timer.
+
+    evaluator = SafeEvaluator()
+    evaluator.evaluate("2 * (3 + 4) ** 2")      # "98"
+    evaluator.evaluate_many(["sqrt(16)", "1/0"])  # ["4.0", "Error: division by zero"]
+"""
+
+import ast
+import math
+import operator
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.cache import TTLCache
+
+
+class EvaluationError(ValueError):
+    """Raised for expressions that are invalid, unsupported or over a limit."""
+
+
+@dataclass
+class Limits:
+    max_length: int = 1000          # characters
+    max_nodes: int = 200            # AST nodes
+    max_exponent: int = 10_000
+    max_int_bits: int = 4096        # ~1200 decimal digits
+    max_factorial: int = 500
+    max_round_digits: int = 100     # |ndigits| accepted by round()
+
+
+Number = Any  # int or float
+Compiled = Callable[[], Number]
+
+_BINARY_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+_UNARY_OPS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+_FUNCTIONS = {
+    "abs": abs, "round": round, "min": min, "max": max,
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10, "log2": math.log2,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "asin": math.asin, "acos": math.acos, "atan": math.atan,
+    "floor": math.floor, "ceil": math.ceil, "factorial": math.factorial,
+}
+
+
+class SafeEvaluator:
+    def __init__(self, limits: Optional[Limits] = None, max_compiled: int = 4096, max_results: int = 16384):
+        self.limits = limits or Limits()
+        self.compiled = TTLCache(max_entries=max_compiled)
+        self.results = TTLCache(max_entries=max_results)
+
+    # ----------------------------
+    # Compilation
+    # ----------------------------
+
+    def compile(self, expression: str) -> Tuple[str, Compiled]:
+        """Return (canonical form, compiled closure); cached by the raw expression."""
+        hit = self.compiled.get(expression)
+        if hit is not None:
+            return hit
+        if len(expression) > self.limits.max_length:
+            raise EvaluationError(f"expression longer than {self.limits.max_length} characters")
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except (SyntaxError, ValueError) as e:
+            raise EvaluationError(f"invalid expression: {e.msg if hasattr(e, 'msg') else e}")
+        nodes = sum(1 for _ in ast.walk(tree))
+        if nodes > self.limits.max_nodes:
+            raise EvaluationError(f"expression has more than {self.limits.max_nodes} parts")
+        compiled = (ast.dump(tree), self._compile_node(tree.body))
+        self.compiled.set(expression, compiled)
+        return compiled
+
+    def _compile_node(self, node: ast.AST) -> Compiled:
+        if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+                and node.value.id == "math"):
+            # Models often write math.sqrt(...) / math.pi; treat them as sqrt / pi
+            node = ast.Name(id=node.attr, ctx=ast.Load())
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = node.value
+            self._check_int(value)
+            return lambda: value
+        if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+            value = _CONSTANTS[node.id]
+            return lambda: value
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            op, operand = _UNARY_OPS[type(node.op)], self._compile_node(node.operand)
+            return lambda: op(operand())
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            left, right = self._compile_node(node.left), self._compile_node(node.right)
+            if isinstance(node.op, ast.Pow):
+                return lambda: self._pow(left(), right())
+            op = _BINARY_OPS[type(node.op)]
+            return lambda: self._check_int(op(left(), right()))
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitXor):
+            raise EvaluationError("unsupported operator ^ (use ** for powers)")
+        if isinstance(node, ast.Call) and not node.keywords:
+            func_node = node.func
+            if (isinstance(func_node, ast.Attribute) and isinstance(func_node.value, ast.Name)
+                    and func_node.value.id == "math"):
+                func_node = ast.Name(id=func_node.attr, ctx=ast.Load())
+            if not (isinstance(func_node, ast.Name) and func_node.id in _FUNCTIONS):
+                raise EvaluationError("unsupported function call")
+            name = func_node.id
+            func, args = _FUNCTIONS[name], [self._compile_node(a) for a in node.args]
+            if name == "factorial":
+                return lambda: self._factorial(*[a() for a in args])
+            if name == "round":
+                return lambda: self._round(*[a() for a in args])
+            return lambda: self._check_int(func(*[a() for a in args]))
+        if isinstance(node, ast.Name):
+            raise EvaluationError(f"unknown name {node.id!r}")
+        raise EvaluationError(f"unsupported syntax: {type(node).__name__}")
+
+    # ----------------------------
+    # Limits
+    # ----------------------------
+
+    def _check_int(self, value: Number) -> Number:
+        if isinstance(value, int) and value.bit_length() > self.limits.max_int_bits:
+            raise EvaluationError(f"result larger than {self.limits.max_int_bits} bits")
+        return value
+
+    def _pow(self, base: Number, exponent: Number) -> Number:
+        if abs(exponent) > self.limits.max_exponent:
+            raise EvaluationError(f"exponent larger than {self.limits.max_exponent}")
+        if isinstance(base, int) and isinstance(exponent, int) and exponent > 0:
+            # Size of the result, known before computing it
+            if (abs(base).bit_length() - 1) * exponent > self.limits.max_int_bits:
+                raise EvaluationError(f"result larger than {self.limits.max_int_bits} bits")
+        result = base ** exponent
+        if isinstance(result, complex):
+            raise EvaluationError("result is a complex number")
+        return self._check_int(result)
+
+    def _factorial(self, value: Number) -> int:
+        if value > self.limits.max_factorial:
+            raise EvaluationError(f"factorial argument larger than {self.limits.max_factorial}")
+        return self._check_int(math.factorial(value))
+
+    def _round(self, value: Number, ndigits: Optional[Number] = None) -> Number:
+        # A huge negative ndigits makes int rounding build a huge power of ten
+        if ndigits is not None and abs(ndigits) > self.limits.max_round_digits:
+            raise EvaluationError(f"round() digits larger than {self.limits.max_round_digits}")
+        return self._check_int(round(value, ndigits))
+
+    # ----------------------------
+    # Evaluation
+    # ----------------------------
+
+    def evaluate(self, expression: str) -> str:
+        """Result as text, or `Error: ...`; both are memoized per canonical expression."""
+        try:
+            canonical, compiled = self.compile(expression)
+        except EvaluationError as e:
+            return f"Error: {e}"
+        hit = self.results.get(canonical)
+        if hit is not None:
+            return hit
+        try:
+            result = str(compiled())
+        except (ArithmeticError, ValueError, TypeError) as e:
+            result = f"Error: {e}"
+        self.results.set(canonical, result)
+        return result
+
+    def evaluate_many(self, expressions: Sequence[str]) -> List[str]:
+        """Evaluate a batch; repeated expressions are computed once."""
+        return [self.evaluate(expression) for expression in expressions]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"compiled": self.compiled.stats.as_dict(), "results": self.results.stats.as_dict(),
+                "compiled_entries": len(self.compiled), "result_entries": len(self.results)}
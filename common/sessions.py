@@ -0,0 +1,195 @@
+"""
+Server-side conversation storage.
+
+Clients send only the new turn; the server owns the history. Two stores share
+the same small interface:
+
+- InMemorySessionStore: per-process LRU, the default
+- SQLiteSessionStore: append-only rows on local disk, survives restarts
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class SessionNotFound(KeyError):
+    """Raised when a session id is unknown or has been evicted."""
+
+
+class SessionStore:
+    """Interface shared by the session stores."""
+
+    def create(self, system_prompt: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    def append(self, session_id: str, message: Dict) -> None:
+        raise NotImplementedError
+
+    def history(self, session_id: str, last_n: Optional[int] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def window(self, session_id: str, max_messages: int) -> List[Dict]:
+        """System prompt (if any) plus the last `max_messages` turns."""
+        messages = self.history(session_id)
+        system = [m for m in messages[:1] if m["role"] == "system"]
+        rest = messages[len(system):]
+        return system + rest[-max_messages:]
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU of sessions; the least recently used session is evicted first."""
+
+    def __init__(self, max_sessions: int = 1000, max_messages: int = 200):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._sessions: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, system_prompt: Optional[str] = None) -> str:
+        session_id = uuid.uuid4().hex
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        with self._lock:
+            self._sessions[session_id] = messages
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def _get(self, session_id: str) -> List[Dict]:
+        try:
+            messages = self._sessions[session_id]
+        except KeyError:
+            raise SessionNotFound(session_id) from None
+        self._sessions.move_to_end(session_id)
+        return messages
+
+    def append(self, session_id: str, message: Dict) -> None:
+        with self._lock:
+            messages = self._get(session_id)
+            messages.append(message)
+            # Keep the system prompt, drop the oldest turns past the cap
+            start = 1 if messages[0]["role"] == "system" else 0
+            overflow = len(messages) - start - self.max_messages
+            if overflow > 0:
+                del messages[start:start + overflow]
+
+    def history(self, session_id: str, last_n: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            messages = list(self._get(session_id))
+        return messages if last_n is None else messages[-last_n:]
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions and messages in a local SQLite file (WAL mode)."""
+
+    def __init__(self, path: str = "chat_sessions.db", max_sessions: int = 10000,
+                 max_messages: int = 200):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions(last_used);
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, seq);
+            """
+        )
+
+    def create(self, system_prompt: Optional[str] = None) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT INTO sessions VALUES (?, ?)", (session_id, time.time()))
+            if system_prompt:
+                self._insert(session_id, {"role": "system", "content": system_prompt})
+            self._evict()
+        return session_id
+
+    def _insert(self, session_id: str, message: Dict) -> None:
+        self._conn.execute(
+            "INSERT INTO messages (session_id, role, body) VALUES (?, ?, ?)",
+            (session_id, message["role"], json.dumps(message)),
+        )
+
+    def _touch(self, session_id: str) -> None:
+        cur = self._conn.execute(
+            "UPDATE sessions SET last_used = ? WHERE id = ?", (time.time(), session_id))
+        if cur.rowcount == 0:
+            raise SessionNotFound(session_id)
+
+    def _evict(self) -> None:
+        stale = self._conn.execute(
+            "SELECT id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+            (self.max_sessions,),
+        ).fetchall()
+        for (session_id,) in stale:
+            self._delete(session_id)
+
+    def _delete(self, session_id: str) -> None:
+        self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def append(self, session_id: str, message: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._touch(session_id)
+            self._insert(session_id, message)
+            # Trim the oldest non-system turns past the cap
+            self._conn.execute(
+                """
+                DELETE FROM messages WHERE seq IN (
+                    SELECT seq FROM messages
+                    WHERE session_id = ? AND role != 'system'
+                    ORDER BY seq DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (session_id, self.max_messages),
+            )
+
+    def history(self, session_id: str, last_n: Optional[int] = None) -> List[Dict]:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._touch(session_id)
+            rows = self._conn.execute(
+                "SELECT body FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        messages = [json.loads(body) for (body,) in rows]
+        return messages if last_n is None else messages[-last_n:]
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._delete(session_id)
+
+
+def make_session_store(kind: str = "memory", **kwargs) -> SessionStore:
+    """Build a store by name: "memory" (default) or "sqlite"."""
+    if kind == "sqlite":
+        return SQLiteSessionStore(**kwargs)
+    if kind == "memory":
+        return InMemorySessionStore(**kwargs)
+    raise ValueError(f"Unknown session store: {kind}")
@@ -0,0 +1,183 @@
+"""
+Request coalescing ("single-flight") for identical concurrent upstream calls.
+
+While a call for a key is in flight, later callers with the same key wait for
+that call instead of issuing their own:
+
+- AsyncSingleFlight.do:     share one awaited result
+- AsyncSingleFlight.stream: share one stream of deltas; late joiners replay
+                            what was already produced, then follow live
+- SingleFlight.do:          thread-based variant for synchronous handlers
+
+Keys are usually `common.cache.cache_key(...)` of the canonical request
+payload. Nothing is kept after the call finishes, so this never serves stale
+results; it only collapses duplicates that overlap in time.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class CoalesceStats:
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        saved = self.calls - self.executions
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.executions,
+            "saved_calls": saved,
+            "saved_ratio": round(saved / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """Buffer of items from one upstream iterator, readable by many subscribers."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def produce(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for item in source:
+                async with self.changed:
+                    self.items.append(item)
+                    self.changed.notify_all()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            # Close the upstream now (e.g. cancel the HTTP stream), not at GC time
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.done = True
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: index < len(self.items) or self.done)
+                batch = self.items[index:]
+                finished = self.done
+            for item in batch:
+                yield item
+            index += len(batch)
+            if finished and index >= len(self.items):
+                if self.error is not None and not isinstance(self.error, asyncio.CancelledError):
+                    raise self.error
+                return
+
+
+class AsyncSingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stats = CoalesceStats()
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+
+    @staticmethod
+    def _forget(table: Dict[str, Any], key: str, entry: Any) -> None:
+        if table.get(key) is entry:
+            del table[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `fn()` once per key among overlapping callers."""
+        self.stats.calls += 1
+        if not self.enabled:
+            self.stats.executions += 1
+            return await fn()
+        flight = self._flights.get(key)
+        if flight is None:
+            self.stats.executions += 1
+            task = asyncio.ensure_future(fn())
+            flight = self._flights[key] = _Flight(task)
+            task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+        flight.waiters += 1
+        try:
+            # Shield so one caller going away does not cancel the others' result
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                self._forget(self._flights, key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Iterate `fn()` once per key; every overlapping caller sees every item."""
+        self.stats.calls += 1
+        if not self.enabled:
+            self.stats.executions += 1
+            async for item in fn():
+                yield item
+            return
+        shared = self._streams.get(key)
+        if shared is None:
+            self.stats.executions += 1
+            shared = self._streams[key] = _SharedStream()
+            shared.task = asyncio.ensure_future(shared.produce(fn()))
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+        shared.subscribers += 1
+        try:
+            async for item in shared.subscribe():
+                yield item
+        finally:
+            shared.subscribers -= 1
+            # Last subscriber gone (e.g. client disconnects): stop the upstream
+            if shared.subscribers == 0 and not shared.task.done():
+                self._forget(self._streams, key, shared)
+                shared.task.cancel()
+
+
+class SingleFlight:
+    """Thread-based single-flight for synchronous code paths."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stats = CoalesceStats()
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.stats.calls += 1
+            future = self._flights.get(key) if self.enabled else None
+            leader = future is None
+            if leader:
+                self.stats.executions += 1
+                future = Future()
+                if self.enabled:
+                    self._flights[key] = future
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is future:
+                    del self._flights[key]
@@ -0,0 +1,144 @@
+"""
+Throttled, incremental rendering of streamed LLM text in Streamlit.
+
+Calling `placeholder.markdown(full + "▌")` for every token re-renders the
+whole growing answer each time: quadratic work, and one websocket message per
+token. `StreamRenderer` instead:
+
+- collects deltas in a list and flushes on a time or size budget
+- writes each finished markdown block (text up to a blank line, never inside
+  a code fence) into its own element exactly once
+- re-renders only the unfinished tail, with the cursor
+
+so each flush costs the size of the tail, not of the whole answer.
+
+    renderer = StreamRenderer(st.container())
+    for delta in deltas:
+        renderer.write(delta)
+    text = renderer.close()
+    renderer.stats()  # renders, blocks, frame timings
+
+Set STREAM_RENDER_STATS=1 to show those stats under each streamed answer.
+The target only needs `.empty()` (returning elements with `.markdown()`) and
+`.caption()`, so this module does not import Streamlit.
+"""
+
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+_FENCE = re.compile(r"^\s{0,3}(```|~~~)", re.MULTILINE)
+
+
+def split_finished(text: str) -> int:
+    """
+    Length of the prefix of `text` made of finished markdown blocks.
+
+    A block is finished at a blank line that is not inside a code fence.
+    Returns 0 when no block is finished yet.
+    """
+    end = 0
+    pos = text.find("\n\n")
+    while pos != -1:
+        if len(_FENCE.findall(text, 0, pos)) % 2 == 0:
+            end = pos + 2
+        pos = text.find("\n\n", pos + 2)
+    return end
+
+
+class StreamRenderer:
+    def __init__(self, container, min_interval: float = 0.05, max_buffer_chars: int = 400,
+                 cursor: str = "▌", show_stats: Optional[bool] = None):
+        self.container = container
+        if show_stats is None:
+            show_stats = os.getenv("STREAM_RENDER_STATS", "0") == "1"
+        self.show_stats = show_stats
+        self.min_interval = min_interval
+        self.max_buffer_chars = max_buffer_chars
+        self.cursor = cursor
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._parts: List[str] = []          # every delta, for the final text
+        self._tail = ""                      # unfinished block shown with the cursor
+        self._tail_element = None
+        self._last_flush = 0.0
+        self._started = time.perf_counter()
+        self._first_render: Optional[float] = None
+        self.deltas = 0
+        self.renders = 0
+        self.blocks = 0
+        self.frame_times: List[float] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def write(self, delta: str) -> None:
+        """Buffer one delta; render if the time or size budget is used up."""
+        if not delta:
+            return
+        self.deltas += 1
+        self._parts.append(delta)
+        self._buffer.append(delta)
+        self._buffered += len(delta)
+        if (self._buffered >= self.max_buffer_chars
+                or time.perf_counter() - self._last_flush >= self.min_interval):
+            self.flush()
+
+    def flush(self, final: bool = False) -> None:
+        if not self._buffer and not final:
+            return
+        started = time.perf_counter()
+        self._tail += "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+
+        end = len(self._tail) if final else split_finished(self._tail)
+        if end:
+            # Finished blocks go into the current element for the last time;
+            # a fresh element below takes over the tail
+            self._element().markdown(self._tail[:end])
+            self.blocks += 1
+            self._tail = self._tail[end:]
+            self._tail_element = None
+        if self._tail:
+            self._element().markdown(self._tail + ("" if final else self.cursor))
+
+        self.renders += 1
+        now = time.perf_counter()
+        if self._first_render is None:
+            self._first_render = now
+        self.frame_times.append(now - started)
+        self._last_flush = now
+
+    def _element(self):
+        if self._tail_element is None:
+            self._tail_element = self.container.empty()
+        return self._tail_element
+
+    def close(self) -> str:
+        """Render everything without the cursor and return the full text."""
+        self.flush(final=True)
+        if self.show_stats:
+            s = self.stats()
+            self.container.caption(
+                f"{s['deltas']} deltas · {s['renders']} renders · {s['blocks']} blocks · "
+                f"first render {s['first_render_ms']} ms · frame p95 {s['frame_p95_ms']} ms")
+        return self.text
+
+    def stats(self) -> Dict[str, Any]:
+        frames = sorted(self.frame_times)
+
+        def ms(v: float) -> float:
+            return round(v * 1000, 2)
+        return {
+            "deltas": self.deltas,
+            "renders": self.renders,
+            "blocks": self.blocks,
+            "chars": len(self.text),
+            "first_render_ms": ms(self._first_render - self._started) if self._first_render else None,
+            "frame_mean_ms": ms(sum(frames) / len(frames)) if frames else None,
+            "frame_p95_ms": ms(frames[int(0.95 * (len(frames) - 1))]) if frames else None,
+            "frame_max_ms": ms(frames[-1]) if frames else None,
+        }
@@ -0,0 +1,165 @@
+"""
+Result memoization for agent tools.
+
+Agents repeat identical tool calls, within one run and across runs. Wrap the
+tool function (under `@tool`) to serve repeats from a cache:
+
+    @tool
+    @memoize_tool(ttl=3600, max_entries=512)
+    def get_word_length(word: str) -> int:
+        ...
+
+- Arguments are bound to the function signature (defaults applied) and
+  encoded as canonical JSON, so positional / keyword / reordered calls share
+  one key
+- Each tool has its own memory LRU (size limit) and TTL
+- `disk_path` adds a SQLite tier; point several agent workers at the same
+  file to share results between them
+- Invalidation: `fn.invalidate(*args, **kwargs)` drops one entry,
+  `fn.cache_clear()` empties the memory tier, and a `version` callable (e.g.
+  the mtime of a database file) is part of every key, so changing data makes
+  old entries unreachable in every worker
+- `should_cache(result)` decides what is stored (by default not `Error: ...`
+  strings, so the model's retry after a failure runs the tool again)
+- `on_call(name, input, cached)` lets the agent log each call with its
+  cache status; `tool_cache_stats()` reports hit rates per tool
+- Identical calls that overlap in time run once (single-flight)
+
+Cached values must be JSON-serializable for the disk tier.
+"""
+
+import functools
+import inspect
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from common.cache import cache_key, make_cache
+from common.singleflight import AsyncSingleFlight, SingleFlight
+
+_MISSING = object()
+_registry: Dict[str, "ToolCache"] = {}
+_registry_lock = threading.Lock()
+
+
+def _default_should_cache(result: Any) -> bool:
+    return not (isinstance(result, str) and result.startswith("Error:"))
+
+
+class ToolCache:
+    """Cache and counters for one tool function."""
+
+    def __init__(self, func: Callable, name: str, ttl: Optional[float], max_entries: int,
+                 disk_path: Optional[str], version: Optional[Callable[[], Any]],
+                 should_cache: Callable[[Any], bool]):
+        self.func = func
+        self.name = name
+        self.signature = inspect.signature(func)
+        self.version = version
+        self.should_cache = should_cache
+        self.cache = make_cache(max_entries=max_entries, ttl=ttl, disk_path=disk_path)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def arguments(self, args: tuple, kwargs: dict) -> Dict[str, Any]:
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return dict(bound.arguments)
+
+    def key(self, arguments: Dict[str, Any]) -> str:
+        version = self.version() if self.version is not None else None
+        return cache_key("tool", self.name, version, arguments)
+
+    def lookup(self, key: str) -> Any:
+        value = self.cache.get(key, _MISSING)
+        with self.lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def store(self, key: str, result: Any) -> None:
+        if self.should_cache(result):
+            self.cache.set(key, result)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "tiers": self.cache.stats()}
+
+
+def _log_input(signature: inspect.Signature, arguments: Dict[str, Any]) -> Any:
+    """What the usage log shows: arguments that differ from their defaults (one -> its value)."""
+    given = {k: v for k, v in arguments.items() if v != signature.parameters[k].default}
+    return next(iter(given.values())) if len(given) == 1 else given
+
+
+def memoize_tool(ttl: Optional[float] = None, max_entries: int = 256,
+                 disk_path: Optional[str] = None, name: Optional[str] = None,
+                 version: Optional[Callable[[], Any]] = None,
+                 should_cache: Callable[[Any], bool] = _default_should_cache,
+                 on_call: Optional[Callable[[str, Any, bool], None]] = None):
+    """Decorator adding a result cache to a (sync or async) tool function."""
+    def decorate(func: Callable) -> Callable:
+        state = ToolCache(func, name or func.__name__, ttl, max_entries, disk_path,
+                          version, should_cache)
+        with _registry_lock:
+            _registry[state.name] = state
+
+        def report(arguments: Dict[str, Any], cached: bool) -> None:
+            if on_call is not None:
+                on_call(state.name, _log_input(state.signature, arguments), cached)
+
+        if inspect.iscoroutinefunction(func):
+            flights = AsyncSingleFlight()
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                arguments = state.arguments(args, kwargs)
+                key = state.key(arguments)
+                value = state.lookup(key)
+                report(arguments, value is not _MISSING)
+                if value is not _MISSING:
+                    return value
+
+                async def run():
+                    result = await func(*args, **kwargs)
+                    state.store(key, result)
+                    return result
+                return await flights.do(key, run)
+            wrapper = async_wrapper
+        else:
+            flights = SingleFlight()
+
+            @functools.wraps(func)
+            def sync_wrapper(*args, **kwargs):
+                arguments = state.arguments(args, kwargs)
+                key = state.key(arguments)
+                value = state.lookup(key)
+                report(arguments, value is not _MISSING)
+                if value is not _MISSING:
+                    return value
+
+                def run():
+                    result = func(*args, **kwargs)
+                    state.store(key, result)
+                    return result
+                return flights.do(key, run)
+            wrapper = sync_wrapper
+
+        def invalidate(*args, **kwargs) -> None:
+            state.cache.delete(state.key(state.arguments(args, kwargs)))
+
+        wrapper.invalidate = invalidate
+        wrapper.cache_clear = state.cache.memory.clear
+        wrapper.cache_stats = state.stats
+        return wrapper
+    return decorate
+
+
+def tool_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit / miss counts and hit rate for every memoized tool in this process."""
+    with _registry_lock:
+        return {name: state.stats() for name, state in _registry.items()}
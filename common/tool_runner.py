@@ -0,0 +1,100 @@
+"""
+Concurrent execution of the tool calls of one model turn.
+
+A model turn can request several independent tool calls. Running them one
+after another makes the turn cost the sum of all tool latencies; `ToolRunner`
+runs them together so it costs about as long as the slowest one:
+
+- async tools (LangChain tools with a coroutine, or `async def` callables)
+  are awaited on the event loop
+- sync tools run on a bounded thread pool, so a burst of calls cannot start
+  an unbounded number of threads
+- every call has a timeout (per tool name, or a default)
+- results come back in the order of the calls, whatever order they finish in,
+  so tool messages line up with the model's `tool_calls`
+- under an active trace (`common.tracing`), each call is a `tool` span; sync
+  tools run in a copy of the caller's context so the span follows them
+
+    runner = ToolRunner(tools, max_workers=8, timeout=30)
+    results = await runner.run(response.tool_calls)   # [{"name", "args", "id"}, ...]
+
+A sync tool that times out keeps its worker thread until it returns (Python
+threads cannot be killed); only the agent stops waiting for it.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from common.tracing import child_span
+
+
+@dataclass
+class ToolResult:
+    call_id: Optional[str]
+    name: str
+    content: str
+    status: str                # "ok", "error", "timeout" or "not_found"
+    elapsed: float             # seconds
+
+
+def _tool_name(tool: Any) -> str:
+    return getattr(tool, "name", None) or getattr(tool, "__name__", repr(tool))
+
+
+def is_async_tool(tool: Any) -> bool:
+    """True for LangChain tools built from a coroutine and for `async def` callables."""
+    if getattr(tool, "coroutine", None) is not None:
+        return True
+    return inspect.iscoroutinefunction(getattr(tool, "func", None) or tool)
+
+
+class ToolRunner:
+    def __init__(self, tools: Iterable[Any], max_workers: int = 8, timeout: float = 30.0,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.tools = {_tool_name(t): t for t in tools}
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    async def _call(self, tool: Any, args: dict) -> Any:
+        if is_async_tool(tool):
+            if hasattr(tool, "ainvoke"):
+                return await tool.ainvoke(args)
+            return await tool(**args)
+        call = functools.partial(tool.invoke, args) if hasattr(tool, "invoke") \
+            else functools.partial(tool, **args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.pool, contextvars.copy_context().run, call)
+
+    async def run_one(self, call: dict) -> ToolResult:
+        name = call.get("name", "")
+        call_id = call.get("id")
+        started = time.perf_counter()
+        tool = self.tools.get(name)
+        if tool is None:
+            return ToolResult(call_id, name, f"Tool {name} not found", "not_found", 0.0)
+        timeout = self.timeouts.get(name, self.timeout)
+        with child_span(name, "tool", call_id=call_id) as span:
+            try:
+                output = await asyncio.wait_for(self._call(tool, call.get("args") or {}), timeout)
+                content, status = str(output), "ok"
+            except asyncio.TimeoutError:
+                content, status = f"Error: tool {name} timed out after {timeout:g}s", "timeout"
+            except Exception as e:
+                content, status = f"Error: {e}", "error"
+            if span is not None:
+                span.set(status=status)
+        return ToolResult(call_id, name, content, status, time.perf_counter() - started)
+
+    async def run(self, calls: List[dict]) -> List[ToolResult]:
+        """Run all calls concurrently; results are in the order of `calls`."""
+        return list(await asyncio.gather(*(self.run_one(call) for call in calls)))
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,224 @@
+"""
+Structured tracing for agent runs.
+
+A trace is a tree of spans: one root per question, with children for each
+agent step, LLM call and tool call. Each span records wall-clock start / end,
+duration and attributes (model, token usage, tool input, cache status, errors).
+
+- The current span lives in a ContextVar, so concurrent sessions (asyncio
+  tasks, or threads started with `contextvars.copy_context().run`) never mix
+  their spans
+- Finished spans are appended to a JSONL file as they end (one object per
+  line), so long runs can be tailed or loaded into pandas
+- `summarize_spans` / `format_summary` total the time per span kind and name
+  and point at the slowest step
+
+    tracer = Tracer(path="agent_traces.jsonl")
+    with tracer.span("question", "agent", input=text) as root:
+        with tracer.span("llm", "llm", model="gpt-4o-mini") as span:
+            ...
+            span.set(input_tokens=812, output_tokens=40)
+    print(format_summary(summarize_spans(tracer.spans(root.trace_id))))
+
+Library code that may or may not run under a trace uses `child_span(...)`
+and `annotate(...)`, which do nothing when no span is active.
+"""
+
+import contextlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, kind: str, parent: Optional["Span"],
+                 attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent is not None else _new_id()
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.attributes = dict(attributes)
+        self._started = time.perf_counter()
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "kind": self.kind, "start": self.start, "end": self.end,
+                "duration_ms": self.duration_ms, "attributes": self.attributes}
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, keep_traces: int = 100):
+        self.path = path
+        self.keep_traces = keep_traces
+        self._lock = threading.Lock()
+        self._file = None
+        self._open: Dict[str, List[Dict[str, Any]]] = {}
+        self._finished: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[Span] = None,
+                   **attributes: Any) -> Span:
+        """Start a span under `parent` (default: the current span). Does not make it current."""
+        span = Span(self, name, kind, parent if parent is not None else _current.get(), attributes)
+        if span.parent_id is None:
+            with self._lock:
+                self._open[span.trace_id] = []
+        return span
+
+    def end_span(self, span: Span, **attributes: Any) -> None:
+        span.set(**attributes)
+        span.end = time.time()
+        span.duration_ms = round((time.perf_counter() - span._started) * 1000, 3)
+        record = span.to_dict()
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self.path:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line + "\n")
+                self._file.flush()
+            spans = self._open.get(span.trace_id)
+            if spans is not None:
+                spans.append(record)
+            if span.parent_id is None:
+                # Root finished: keep the whole trace for summaries (bounded)
+                self._finished[span.trace_id] = self._open.pop(span.trace_id, [record])
+                while len(self._finished) > self.keep_traces:
+                    self._finished.popitem(last=False)
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Span]:
+        """Run a block as a span (the current span inside it); errors are recorded and re-raised."""
+        span = self.start_span(name, kind, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(status="error", error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            self.end_span(span)
+
+    def spans(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Finished spans of one trace (completed traces only)."""
+        with self._lock:
+            return list(self._finished.get(trace_id, []))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    """Make an already started span current inside a block (it is not ended on exit).
+
+    For async generators: keep `yield` outside the block, so the span is never
+    current in the consumer's code.
+    """
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+
+
+def attach(span: Optional[Span]) -> Token:
+    """Make `span` current until `detach(token)`; for callback pairs that cannot use a block."""
+    return _current.set(span)
+
+
+def detach(token: Token) -> None:
+    """Undo `attach`. A token from another context (callback run elsewhere) is ignored."""
+    try:
+        _current.reset(token)
+    except ValueError:
+        pass
+
+
+@contextlib.contextmanager
+def child_span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+    """A span under the current one, or nothing (yields None) outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, kind, **attributes) as span:
+        yield span
+
+
+def annotate(**attributes: Any) -> None:
+    """Add attributes to the current span, if any."""
+    span = _current.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+# ----------------------------
+# Summaries
+# ----------------------------
+
+def summarize_spans(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Time per (kind, name), token totals and the slowest step of one trace."""
+    root = next((s for s in spans if s["parent_id"] is None), None)
+    groups: Dict[str, Dict[str, Any]] = {}
+    tokens = {"input_tokens": 0, "output_tokens": 0}
+    for s in spans:
+        if s is root:
+            continue
+        group = groups.setdefault(f"{s['kind']}:{s['name']}", {
+            "kind": s["kind"], "name": s["name"], "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        group["count"] += 1
+        group["total_ms"] += s["duration_ms"] or 0.0
+        group["max_ms"] = max(group["max_ms"], s["duration_ms"] or 0.0)
+        for key in tokens:
+            tokens[key] += s["attributes"].get(key) or 0
+    steps = [s for s in spans if s["kind"] == "step"]
+    slowest = max(steps or [s for s in spans if s is not root] or [None],
+                  key=lambda s: s["duration_ms"] if s else 0)
+    return {
+        "trace_id": root["trace_id"] if root else None,
+        "total_ms": root["duration_ms"] if root else None,
+        "groups": sorted(groups.values(), key=lambda g: -g["total_ms"]),
+        "tokens": tokens,
+        "slowest": slowest and {"name": slowest["name"], "kind": slowest["kind"],
+                                "duration_ms": slowest["duration_ms"]},
+    }
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [f"Trace {summary['trace_id']}: {(summary['total_ms'] or 0) / 1000:.2f}s, "
+             f"{summary['tokens']['input_tokens']} input / "
+             f"{summary['tokens']['output_tokens']} output tokens"]
+    if summary["slowest"]:
+        s = summary["slowest"]
+        lines.append(f"  slowest {s['kind']}: {s['name']} ({s['duration_ms'] / 1000:.2f}s)")
+    lines.append(f"  {'kind':<7}{'name':<28}{'count':>6}{'total s':>10}{'max s':>9}")
+    for g in summary["groups"]:
+        lines.append(f"  {g['kind']:<7}{g['name'][:27]:<28}{g['count']:>6}"
+                     f"{g['total_ms'] / 1000:>10.3f}{g['max_ms'] / 1000:>9.3f}")
+    return "\n".join(lines)
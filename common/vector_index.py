@@ -0,0 +1,398 @@
+"""
+In-process vector store on memory-mapped NumPy arrays.
+
+For a few thousand (or a few hundred thousand) chunks, a vector database
+server is not needed: a float32 matrix and one matrix product per query
+batch answer top-k search exactly. `NumpyVectorClient` offers the
+`MilvusClient` calls the RAG notebooks use, so it can replace
+`MilvusClient(uri="./milvus_demo.db")` with one changed line:
+
+    client = NumpyVectorClient("./vector_store")
+    client.create_collection(collection_name, dimension=1536, metric_type="COSINE")
+    client.insert(collection_name, [{"id": 0, "vector": [...], "text": "..."}])
+    client.search(collection_name, data=[query_vector], limit=3, output_fields=["text"])
+    # -> [[{"id": 0, "distance": 0.83, "entity": {"text": "..."}}, ...]]
+
+- vectors are float32 in a memory-mapped file (L2-normalized for COSINE), so
+  opening a collection reads no vectors and the OS page cache holds them
+- search multiplies the query batch with the matrix in blocks and keeps the
+  top-k per block with `argpartition`; distances are cosine similarity (or
+  inner product for IP), higher is better, as in Milvus
+- other row fields are kept in SQLite and read only for the returned hits
+- `build_ivf(collection, nlist)` adds an IVF-style coarse partition
+  (spherical k-means); searches that pass an `nprobe`
+  (`search_params={"params": {"nprobe": 16}}`) then score only the closest
+  lists, trading a little recall for time on larger corpora. Without one,
+  search stays exact. Rows added later join their nearest list.
+- `insert` replaces rows with an existing id (like `upsert`); deletes are
+  tombstones, compacted once a quarter of the rows are dead
+
+Filter expressions are not supported (a non-empty `filter` raises
+ValueError). One process should write a
+collection at a time.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+METRICS = ("COSINE", "IP")
+BLOCK_ROWS = 65536           # rows scored per matrix product (bounds temporary memory)
+INITIAL_CAPACITY = 1024
+
+
+class CollectionNotFound(KeyError):
+    pass
+
+
+class _Collection:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.dim = self.meta["dimension"]
+        self.metric = self.meta["metric_type"]
+        self._map_arrays()
+        self.fields = sqlite3.connect(os.path.join(path, "fields.db"), check_same_thread=False,
+                                      isolation_level=None)
+        self.fields.execute("PRAGMA journal_mode=WAL")
+        self.fields.execute("CREATE TABLE IF NOT EXISTS fields (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        live = np.flatnonzero(self.alive[:self.count])
+        self.row_of: Dict[int, int] = dict(zip(self.ids[live].tolist(), live.tolist()))
+        centroids = os.path.join(path, "centroids.npy")
+        self.centroids = np.load(centroids) if os.path.exists(centroids) else None
+        self._lists: Optional[tuple] = None
+
+    # ----------------------------
+    # Storage
+    # ----------------------------
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    def _map(self, name: str, dtype: Any, width: Optional[int] = None) -> np.memmap:
+        shape = (self.meta["capacity"], width) if width else (self.meta["capacity"],)
+        path = os.path.join(self.path, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "a+b") as f:
+            if f.seek(0, os.SEEK_END) < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _map_arrays(self) -> None:
+        self.vectors = self._map("vectors.f32", np.float32, self.dim)
+        self.ids = self._map("ids.i64", np.int64)
+        self.alive = self._map("alive.u8", np.uint8)
+        self.lists = self._map("lists.i32", np.int32)
+
+    def _grow(self, needed: int) -> None:
+        if needed <= self.meta["capacity"]:
+            return
+        self.flush()
+        capacity = self.meta["capacity"]
+        while capacity < needed:
+            capacity *= 2
+        self.meta["capacity"] = capacity
+        self._map_arrays()
+
+    def _save_meta(self) -> None:
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def flush(self) -> None:
+        for array in (self.vectors, self.ids, self.alive, self.lists):
+            array.flush()
+        self._save_meta()
+
+    # ----------------------------
+    # Writes
+    # ----------------------------
+
+    def _prepare(self, vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == "COSINE":
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+        return matrix
+
+    def upsert(self, rows: List[dict]) -> List[int]:
+        ids = [int(r["id"]) for r in rows]
+        matrix = self._prepare([r["vector"] for r in rows])
+        with self.lock:
+            new = [i for i in dict.fromkeys(ids) if i not in self.row_of]
+            self._grow(self.count + len(new))
+            for i in new:
+                self.row_of[i] = self.meta["count"]
+                self.meta["count"] += 1
+            targets = np.array([self.row_of[i] for i in ids], dtype=np.int64)
+            self.vectors[targets] = matrix
+            self.ids[targets] = ids
+            self.alive[targets] = 1
+            self.lists[targets] = self._assign(matrix) if self.centroids is not None else -1
+            self._lists = None
+            payload = [(i, json.dumps({k: v for k, v in r.items() if k not in ("id", "vector")}))
+                       for i, r in zip(ids, rows)]
+            self.fields.execute("BEGIN")
+            self.fields.executemany("INSERT OR REPLACE INTO fields VALUES (?, ?)", payload)
+            self.fields.execute("COMMIT")
+            self.flush()
+        return ids
+
+    def delete(self, ids: Iterable[int]) -> int:
+        with self.lock:
+            rows = [self.row_of.pop(int(i)) for i in ids if int(i) in self.row_of]
+            if not rows:
+                return 0
+            self.alive[np.array(rows)] = 0
+            self.meta["deleted"] = self.meta.get("deleted", 0) + len(rows)
+            self.fields.execute("BEGIN")
+            self.fields.executemany("DELETE FROM fields WHERE id = ?",
+                                    [(int(self.ids[r]),) for r in rows])
+            self.fields.execute("COMMIT")
+            self._lists = None
+            if self.meta["deleted"] * 4 > self.count:
+                self.compact()
+            else:
+                self.flush()
+        return len(rows)
+
+    def compact(self) -> None:
+        """Move live rows to the front (in place) and drop the tombstones."""
+        with self.lock:
+            live = np.flatnonzero(self.alive[:self.count])
+            for start in range(0, len(live), BLOCK_ROWS):
+                source = live[start:start + BLOCK_ROWS]
+                target = slice(start, start + len(source))
+                # Targets never pass their sources, so block-wise copies are safe
+                self.vectors[target] = self.vectors[source]
+                self.ids[target] = self.ids[source]
+                self.lists[target] = self.lists[source]
+            self.alive[:len(live)] = 1
+            self.alive[len(live):self.count] = 0
+            self.meta["count"] = len(live)
+            self.meta["deleted"] = 0
+            self.row_of = dict(zip(self.ids[:len(live)].tolist(), range(len(live))))
+            self._lists = None
+            self.flush()
+
+    # ----------------------------
+    # IVF partitioning
+    # ----------------------------
+
+    def _assign(self, matrix: np.ndarray) -> np.ndarray:
+        out = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS]
+            out[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def build_ivf(self, nlist: int, iterations: int = 10, sample: int = 100_000,
+                  seed: int = 0) -> None:
+        """Train `nlist` centroids (spherical k-means on a sample) and assign every row."""
+        with self.lock:
+            live = np.flatnonzero(self.alive[:self.count])
+            if len(live) < nlist:
+                raise ValueError(f"need at least nlist={nlist} rows, have {len(live)}")
+            rng = np.random.default_rng(seed)
+            train = np.asarray(self.vectors[np.sort(rng.choice(live, min(sample, len(live)),
+                                                               replace=False))])
+            centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                self.centroids = centroids
+                labels = self._assign(train)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, train)
+                sizes = np.bincount(labels, minlength=nlist)
+                empty = sizes == 0
+                # Re-seed empty lists from random training rows
+                sums[empty] = train[rng.choice(len(train), int(empty.sum()), replace=False)]
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+            self.centroids = centroids.astype(np.float32)
+            np.save(os.path.join(self.path, "centroids.npy"), self.centroids)
+            for start in range(0, self.count, BLOCK_ROWS):
+                end = min(start + BLOCK_ROWS, self.count)
+                self.lists[start:end] = self._assign(np.asarray(self.vectors[start:end]))
+            self.meta["nlist"] = nlist
+            self._lists = None
+            self.flush()
+
+    def _list_rows(self) -> tuple:
+        """(rows sorted by list, start offset of each list), rebuilt after writes."""
+        if self._lists is None:
+            labels = np.asarray(self.lists[:self.count])
+            order = np.argsort(labels, kind="stable")
+            bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> tuple:
+        """Best k (scores, rows) per query row, unsorted."""
+        if scores.shape[1] > k:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            return np.take_along_axis(scores, part, axis=1), rows[part]
+        return scores, np.broadcast_to(rows, scores.shape)
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int]) -> List[List[tuple]]:
+        with self.lock:
+            if self.centroids is not None and nprobe:
+                return [self._search_ivf(q, k, nprobe) for q in queries]
+            best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+            best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+            for start in range(0, self.count, BLOCK_ROWS):
+                end = min(start + BLOCK_ROWS, self.count)
+                scores = queries @ self.vectors[start:end].T
+                scores[:, self.alive[start:end] == 0] = -np.inf
+                scores, rows = self._top_k(scores, np.arange(start, end), k)
+                best_scores, best_rows = self._top_k(
+                    np.hstack([best_scores, scores]), np.hstack([best_rows, rows]), k)
+            return [self._ranked(s, r) for s, r in zip(best_scores, best_rows)]
+
+    def _search_ivf(self, query: np.ndarray, k: int, nprobe: int) -> List[tuple]:
+        order, bounds = self._list_rows()
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([order[bounds[p]:bounds[p + 1]] for p in probes])
+        candidates = candidates[self.alive[candidates] == 1]
+        if len(candidates) == 0:
+            return []
+        scores = (self.vectors[np.sort(candidates)] @ query)[None, :]
+        scores, rows = self._top_k(scores, np.sort(candidates), k)
+        return self._ranked(scores[0], rows[0])
+
+    @staticmethod
+    def _ranked(scores: np.ndarray, rows: np.ndarray) -> List[tuple]:
+        order = np.argsort(-scores, kind="stable")
+        return [(int(rows[i]), float(scores[i])) for i in order if np.isfinite(scores[i])]
+
+    def fetch(self, ids: List[int]) -> Dict[int, dict]:
+        found: Dict[int, dict] = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            rows = self.fields.execute(
+                f"SELECT id, data FROM fields WHERE id IN ({','.join('?' * len(part))})",
+                part).fetchall()
+            found.update((i, json.loads(data)) for i, data in rows)
+        return found
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self.fields.close()
+
+
+class NumpyVectorClient:
+    """A small `MilvusClient` look-alike backed by `_Collection` directories under `uri`."""
+
+    def __init__(self, uri: str = "./vector_store"):
+        self.root = uri
+        os.makedirs(uri, exist_ok=True)
+        self._collections: Dict[str, _Collection] = {}
+        self._lock = threading.Lock()
+
+    def _dir(self, collection_name: str) -> str:
+        return os.path.join(self.root, collection_name)
+
+    def _get(self, collection_name: str) -> _Collection:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                if not self.has_collection(collection_name):
+                    raise CollectionNotFound(collection_name)
+                collection = self._collections[collection_name] = _Collection(
+                    self._dir(collection_name))
+            return collection
+
+    # ----------------------------
+    # Collections
+    # ----------------------------
+
+    def has_collection(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self._dir(collection_name), "meta.json"))
+
+    def list_collections(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.root) if self.has_collection(name))
+
+    def create_collection(self, collection_name: str, dimension: int,
+                          metric_type: str = "COSINE", **kwargs: Any) -> None:
+        """Create an empty collection (Milvus-only options such as consistency_level are ignored)."""
+        metric_type = metric_type.upper()
+        if metric_type not in METRICS:
+            raise ValueError(f"metric_type must be one of {METRICS}")
+        if self.has_collection(collection_name):
+            raise ValueError(f"collection {collection_name!r} already exists")
+        path = self._dir(collection_name)
+        os.makedirs(path, exist_ok=True)
+        meta = {"dimension": dimension, "metric_type": metric_type, "count": 0,
+                "deleted": 0, "capacity": INITIAL_CAPACITY}
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def drop_collection(self, collection_name: str) -> None:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+        if collection is not None:
+            collection.close()
+        shutil.rmtree(self._dir(collection_name), ignore_errors=True)
+
+    def get_collection_stats(self, collection_name: str) -> Dict[str, int]:
+        return {"row_count": len(self._get(collection_name).row_of)}
+
+    def build_ivf(self, collection_name: str, nlist: int, **kwargs: Any) -> None:
+        self._get(collection_name).build_ivf(nlist, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections.clear()
+
+    # ----------------------------
+    # Rows
+    # ----------------------------
+
+    def insert(self, collection_name: str, data: List[dict], **kwargs: Any) -> Dict[str, Any]:
+        ids = self._get(collection_name).upsert(data)
+        return {"insert_count": len(ids), "ids": ids}
+
+    def upsert(self, collection_name: str, data: List[dict], **kwargs: Any) -> Dict[str, Any]:
+        ids = self._get(collection_name).upsert(data)
+        return {"upsert_count": len(ids), "ids": ids}
+
+    def delete(self, collection_name: str, ids: Iterable[int], **kwargs: Any) -> Dict[str, int]:
+        return {"delete_count": self._get(collection_name).delete(ids)}
+
+    def search(self, collection_name: str, data: Sequence[Sequence[float]], limit: int = 10,
+               output_fields: Optional[List[str]] = None, search_params: Optional[dict] = None,
+               filter: str = "", **kwargs: Any) -> List[List[dict]]:
+        """Top-`limit` hits per query vector, best first, in Milvus' result shape."""
+        if filter:
+            raise ValueError(f"filter expressions are not supported by NumpyVectorClient "
+                             f"(got {filter!r}); filter the returned hits instead")
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1 (got {limit})")
+        collection = self._get(collection_name)
+        # Exact search unless the caller asks for IVF probing
+        nprobe = ((search_params or {}).get("params") or {}).get("nprobe")
+        with collection.lock:
+            hits = [[(int(collection.ids[row]), score) for row, score in query_hits]
+                    for query_hits in collection.search(collection._prepare(data), limit, nprobe)]
+        fields = collection.fetch(sorted({i for q in hits for i, _ in q})) if output_fields else {}
+        return [[{"id": hit_id, "distance": score,
+                  "entity": {f: fields.get(hit_id, {}).get(f) for f in output_fields or []}}
+                 for hit_id, score in query_hits]
+                for query_hits in hits]
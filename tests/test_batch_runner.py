@@ -0,0 +1,21 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.batch_runner import BatchRunner, parse_row  # noqa: E402
+
+
+def test_resume_skips_only_ok_lines_and_drops_a_torn_tail(tmp_path):
+    output = tmp_path / "results.jsonl"
+    rows = [{"line": 1, "status": "ok"}, {"line": 2, "status": "error"},
+            {"line": 3, "status": "error"}, {"line": 3, "status": "ok"}]
+    output.write_text("".join(json.dumps(r) + "\n" for r in rows) + '{"line": 4, "sta')
+    assert BatchRunner.completed_lines(str(output)) == {1, 3}
+    assert output.read_text().endswith('"ok"}\n')
+
+
+def test_parse_row_infers_the_kind():
+    assert parse_row(1, {"custom_id": "a", "url": "/chat", "body": {"messages": []}})[:2] == ("a", "chat")
+    assert parse_row(2, {"text": "hello"}) == ("2", "summarize", {"text": "hello"})
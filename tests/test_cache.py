@@ -0,0 +1,32 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.cache import TTLCache, cache_key, make_cache, normalize_text  # noqa: E402
+
+
+def test_keys_ignore_whitespace_differences_after_normalizing():
+    assert cache_key(normalize_text("a  b\n c"), "m", 0) == cache_key(normalize_text(" a b c "), "m", 0)
+    assert cache_key("a", "m", 0) != cache_key("a", "m", 0.5)
+
+
+def test_memory_tier_evicts_least_recently_used_and_expires():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+    cache.set("d", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None and cache.stats.expirations == 1
+
+
+def test_disk_tier_survives_a_new_process_and_refills_memory(tmp_path):
+    path = str(tmp_path / "cache.db")
+    make_cache(disk_path=path).set("k", {"summary": "s"})
+    fresh = make_cache(disk_path=path)
+    assert fresh.get("k") == {"summary": "s"}
+    assert fresh.memory.get("k") == {"summary": "s"}
@@ -0,0 +1,33 @@
+import io
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.attachments import iter_document_text  # noqa: E402
+from common.mapreduce import MapReduceSummarizer, iter_paragraphs  # noqa: E402
+
+
+def test_paragraphs_split_across_pieces_are_reassembled():
+    pieces = ["first para", "graph\n", "\n", "second\n", "line\n\n", "third"]
+    assert list(iter_paragraphs(pieces)) == ["first paragraph", "second\nline", "third"]
+
+
+def test_text_upload_is_read_line_by_line_and_left_open():
+    stream = io.BytesIO("# Title\n\nbody text\n".encode("utf-8"))
+    assert list(iter_document_text("notes.md", stream)) == ["# Title\n", "\n", "body text\n"]
+    assert not stream.closed
+
+
+def test_streamed_summary_matches_the_whole_text_summary():
+    text = "\n\n".join(f"Section {i} " + "lorem ipsum " * 60 for i in range(6))
+
+    def summarize(instruction, chunk, temperature):
+        return f"{instruction[:20]}|{chunk[:12]}"
+
+    summarizer = MapReduceSummarizer(summarize, chunk_tokens=200)
+    events = list(summarizer.iter_summarize_stream(text.splitlines(keepends=True), max_words=40))
+    done = events[-1]
+    assert done["event"] == "done"
+    assert done["summary"] == summarizer.summarize(text, max_words=40)["summary"]
+    assert any(e["event"] == "read" and e["finished"] for e in events)
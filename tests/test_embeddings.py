@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.embeddings import EmbeddingCache, Embedder, ingest  # noqa: E402
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, input, model, **kwargs):
+        self.calls.append(list(input))
+        # Return out of order: the embedder must sort by `index`
+        data = [SimpleNamespace(index=i, embedding=[float(len(t)), float(i)])
+                for i, t in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+def fake_client():
+    return SimpleNamespace(embeddings=FakeEmbeddings())
+
+
+def test_embed_batches_dedupes_and_keeps_order():
+    client = fake_client()
+    embedder = Embedder(client, batch_size=2)
+    vectors = embedder.embed(["a", "bb", "a", "ccc"])
+    assert [v[0] for v in vectors] == [1.0, 2.0, 1.0, 3.0]
+    assert sorted(map(len, client.embeddings.calls)) == [1, 2]
+    assert embedder.stats.unique == 3 and embedder.stats.requests == 2
+
+
+def test_empty_cache_is_consulted_and_filled(tmp_path):
+    client = fake_client()
+    cache = EmbeddingCache(str(tmp_path / "emb.db"))
+    embedder = Embedder(client, cache=cache)
+    first = embedder.embed(["x", "yy"])
+    assert cache.misses == 2
+    assert embedder.embed(["yy", "x"]) == [first[1], first[0]]
+    assert cache.hits == 2 and len(client.embeddings.calls) == 1
+
+
+def test_ingest_inserts_in_chunks_and_skips_blank_text():
+    inserted = []
+    store = SimpleNamespace(insert=lambda collection_name, data: inserted.append(data) or
+                            {"insert_count": len(data)})
+    records = [{"id": i, "text": "" if i == 2 else f"doc {i}"} for i in range(5)]
+    stats = ingest(store, "c", records, Embedder(fake_client()), chunk_size=2)
+    assert [len(chunk) for chunk in inserted] == [2, 2]
+    assert stats.inserted == 4 and all("vector" in row for chunk in inserted for row in chunk)
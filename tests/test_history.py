@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.history import SUMMARY_PREFIX, CompactionState, HistoryCompactor  # noqa: E402
+
+SYSTEM = {"role": "system", "content": "sys"}
+
+
+def turns(start, stop, words=40):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+            for i in range(start, stop)]
+
+
+def fold(compactor, state):
+    history = [SYSTEM] + turns(0, 12)
+    compacted = compactor.compact(history, state, lambda summary, folded: "SUMMARY")
+    assert compacted[1]["content"] == SUMMARY_PREFIX + "SUMMARY"
+    return history
+
+
+def test_client_history_without_the_marker_drops_the_summary():
+    compactor, state = HistoryCompactor(budget_tokens=300, keep_recent=2), CompactionState()
+    fold(compactor, state)
+    other = [SYSTEM, {"role": "user", "content": "hi"}]
+    assert compactor.compact(other, state) == other
+    assert state.summary == ""
+
+
+def test_trimmed_window_keeps_the_summary():
+    compactor, state = HistoryCompactor(budget_tokens=300, keep_recent=2), CompactionState()
+    history = fold(compactor, state)
+    # The server window has slid past every folded turn
+    window = [SYSTEM] + history[-2:] + turns(12, 14, words=2)
+    compacted = compactor.compact(window, state, trimmed=True)
+    assert compacted[1]["content"] == SUMMARY_PREFIX + "SUMMARY"
+    assert compacted[2:] == window[1:]
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.embeddings import Embedder  # noqa: E402
+from common.indexer import IncrementalIndexer, chunk_id  # noqa: E402
+
+
+class FakeStore:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, collection_name, data):
+        self.rows.update((row["id"], row["text"]) for row in data)
+        return {"upsert_count": len(data)}
+
+    def delete(self, collection_name, ids):
+        for i in ids:
+            self.rows.pop(i, None)
+
+
+def fake_embedder():
+    def create(input, model, **kwargs):
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[1.0])
+                                     for i in range(len(input))])
+    return Embedder(SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+
+
+def make_indexer(tmp_path, store):
+    return IncrementalIndexer(store, "docs", fake_embedder(),
+                              manifest_path=str(tmp_path / "manifest.json"))
+
+
+def test_chunk_ids_depend_only_on_source_text_and_occurrence():
+    assert chunk_id("a.md", "x") == chunk_id("a.md", "x")
+    assert len({chunk_id("a.md", "x"), chunk_id("b.md", "x"), chunk_id("a.md", "x", 1)}) == 3
+
+
+def test_sync_only_touches_changed_chunks_and_removed_files(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.md").write_text("# one\n# two\n")
+    (docs / "b.md").write_text("# three\n")
+    store = FakeStore()
+    paths = lambda: sorted(str(p) for p in docs.glob("*.md"))  # noqa: E731
+
+    first = make_indexer(tmp_path, store).sync(paths())
+    assert (first.files_changed, first.chunks_upserted) == (2, 3)
+    assert make_indexer(tmp_path, store).sync(paths()).chunks_upserted == 0
+
+    (docs / "a.md").write_text("# one\n# two edited\n")
+    (docs / "b.md").unlink()
+    second = make_indexer(tmp_path, store).sync(paths())
+    assert (second.chunks_upserted, second.chunks_deleted, second.files_removed) == (1, 2, 1)
+    assert sorted(store.rows.values()) == ["one\n", "two edited\n"]
@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.cache import TTLCache  # noqa: E402
+from common.history import count_tokens  # noqa: E402
+from common.mapreduce import MapReduceSummarizer, chunk_text  # noqa: E402
+
+
+def document(sections=6, words=60):
+    return "\n\n".join(f"Section {i} " + "lorem ipsum " * words for i in range(sections))
+
+
+class FakeModel:
+    def __init__(self, words=400):
+        self.words = words
+        self.instructions = []
+
+    def __call__(self, instruction, text, temperature):
+        self.instructions.append(instruction)
+        return f"{len(self.instructions)} " + "word " * self.words
+
+
+def test_chunks_fit_the_budget_and_keep_their_boundaries_after_an_edit():
+    text = document(sections=20)
+    chunks = chunk_text(text, max_tokens=300)
+    assert all(count_tokens(c) <= 300 for c in chunks)
+    assert " ".join(chunks).split() == text.split()
+    edited = chunk_text(text.replace("Section 18 ", "Section 18 edited "), max_tokens=300)
+    changed = next(i for i, c in enumerate(chunks) if "Section 18 " in c)
+    assert changed > 0 and edited[:changed] == chunks[:changed]
+
+
+def test_reduce_always_ends_with_a_final_pass():
+    model = FakeModel()
+    summarizer = MapReduceSummarizer(model, chunk_tokens=200, fan_in_tokens=300)
+    done = summarizer.summarize(document(), max_words=50)
+    assert done["chunks"] > 1
+    assert model.instructions[-1].startswith("You combine section summaries")
+    assert "about 50 words" in model.instructions[-1]
+    assert sum(i.startswith("You combine") for i in model.instructions) == 1
+
+
+def test_cache_policy_controls_chunk_cache_reads_and_writes():
+    cache = TTLCache(max_entries=100)
+    model = FakeModel(words=5)
+    summarizer = MapReduceSummarizer(model, cache=cache, chunk_tokens=200)
+    summarizer.summarize(document(), temperature=0.5, cache="bypass")
+    assert len(cache) == 0
+    first = len(model.instructions)
+    summarizer.summarize(document(), temperature=0.5, cache="auto")
+    summarizer.summarize(document(), temperature=0.5, cache="auto")
+    assert len(model.instructions) == 3 * first
+    summarizer.summarize(document(), temperature=0.5, cache="prefer")
+    assert len(model.instructions) == 3 * first
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.safe_eval import Limits, SafeEvaluator  # noqa: E402
+
+
+def test_round_digits_are_bounded():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("round(3.14159, 2)") == "3.14"
+    assert evaluator.evaluate("round(7, -1)") == "10"
+    assert evaluator.evaluate("round(7, -10**8)").startswith("Error: round() digits")
+
+
+def test_factorial_result_respects_int_bits():
+    evaluator = SafeEvaluator(Limits(max_int_bits=1000))
+    assert evaluator.evaluate("factorial(100)").isdigit()
+    assert evaluator.evaluate("factorial(200)") == "Error: result larger than 1000 bits"
+
+
+def test_complex_results_are_rejected():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("(-8)**0.5") == "Error: result is a complex number"
+    assert evaluator.evaluate("8**0.5").startswith("2.828")
+
+
+def test_whitelisted_arithmetic_and_functions():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("2 * (3 + 4) ** 2") == "98"
+    assert evaluator.evaluate("7 // 2 + 7 % 2 - -1") == "5"
+    assert evaluator.evaluate("math.sqrt(16) + max(1, 2)") == "6.0"
+    assert evaluator.evaluate("1/0") == "Error: division by zero"
+    assert evaluator.evaluate_many(["1 + 1", "1+1"]) == ["2", "2"]
+
+
+def test_names_attributes_and_calls_outside_the_whitelist_are_rejected():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("__import__('os').system('true')") == "Error: unsupported function call"
+    assert evaluator.evaluate("x + 1") == "Error: unknown name 'x'"
+    assert evaluator.evaluate("(1).__class__").startswith("Error: unsupported syntax")
+    assert evaluator.evaluate("2 ^ 3").startswith("Error: unsupported operator ^")
+
+
+def test_size_limits_stop_runaway_expressions():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("9**9**9") == "Error: exponent larger than 10000"
+    assert evaluator.evaluate("2**5000") == "Error: result larger than 4096 bits"
+    assert evaluator.evaluate("factorial(501)") == "Error: factorial argument larger than 500"
+    assert evaluator.evaluate("1+" * 300 + "1").startswith("Error: expression has more than")
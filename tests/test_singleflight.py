@@ -0,0 +1,73 @@
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.singleflight import AsyncSingleFlight, SingleFlight  # noqa: E402
+
+
+def test_overlapping_async_calls_share_one_execution():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*[flights.do("k", fetch) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert flights.stats.as_dict()["saved_calls"] == 4
+
+
+def test_shared_stream_delivers_every_item_to_every_subscriber():
+    flights = AsyncSingleFlight()
+    starts = []
+
+    async def tokens():
+        starts.append(1)
+        for token in ("a", "b", "c"):
+            await asyncio.sleep(0)
+            yield token
+
+    async def collect():
+        return [t async for t in flights.stream("k", tokens)]
+
+    async def main():
+        return await asyncio.gather(collect(), collect())
+
+    assert asyncio.run(main()) == [["a", "b", "c"]] * 2
+    assert len(starts) == 1
+
+
+def test_threaded_callers_share_one_execution_and_its_error():
+    flights = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        raise ValueError("upstream down")
+
+    def call():
+        try:
+            flights.do("k", fail)
+        except ValueError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(call)
+        started.wait()
+        rest = [pool.submit(call) for _ in range(3)]
+        results = [first.result()] + [f.result() for f in rest]
+    assert results == ["upstream down"] * 4
+    assert len(calls) == 1
@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from common.tool_cache import memoize_tool  # noqa: E402
+from common.tracing import Tracer, attach, current_span, detach  # noqa: E402
+
+
+def test_repeat_calls_are_served_from_cache_and_reported():
+    calls, reports = [], []
+
+    @memoize_tool(on_call=lambda name, value, cached: reports.append((name, value, cached)))
+    def length(word: str, upper: bool = False) -> int:
+        calls.append(word)
+        return len(word)
+
+    assert length("abc") == 3
+    assert length(word="abc", upper=False) == 3
+    assert calls == ["abc"]
+    assert reports == [("length", "abc", False), ("length", "abc", True)]
+
+
+def test_attached_tool_span_receives_the_cache_status():
+    tracer = Tracer()
+    root = tracer.start_span("turn", "agent")
+
+    @memoize_tool(on_call=lambda name, value, cached: current_span().set(cached=cached))
+    def double(x: int) -> int:
+        return 2 * x
+
+    spans = []
+    for _ in range(2):
+        span = tracer.start_span("double", "tool", parent=root)
+        token = attach(span)
+        double(4)
+        detach(token)
+        spans.append(span)
+    assert [s.attributes["cached"] for s in spans] == [False, True]
+    assert current_span() is None
@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+np = pytest.importorskip("numpy")
+
+from common.vector_index import NumpyVectorClient  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path):
+    rng = np.random.default_rng(0)
+    client = NumpyVectorClient(str(tmp_path / "store"))
+    client.create_collection("docs", dimension=16)
+    client.insert("docs", [{"id": i, "vector": rng.normal(size=16).tolist(), "text": f"doc {i}"}
+                           for i in range(300)])
+    yield client
+    client.close()
+
+
+def brute_force(client, query, k):
+    hits = client.search("docs", [query], limit=300)[0]
+    return [h["id"] for h in hits][:k]
+
+
+def test_search_returns_exact_top_k_best_first_with_fields(client):
+    query = np.random.default_rng(1).normal(size=16).tolist()
+    hits = client.search("docs", [query], limit=5, output_fields=["text"])[0]
+    assert [h["id"] for h in hits] == brute_force(client, query, 5)
+    assert [h["distance"] for h in hits] == sorted((h["distance"] for h in hits), reverse=True)
+    assert hits[0]["entity"]["text"] == f"doc {hits[0]['id']}"
+
+
+def test_ivf_collection_stays_exact_without_nprobe(client):
+    query = np.random.default_rng(2).normal(size=16).tolist()
+    expected = brute_force(client, query, 5)
+    client.build_ivf("docs", nlist=16)
+    assert [h["id"] for h in client.search("docs", [query], limit=5)[0]] == expected
+    probed = client.search("docs", [query], limit=5, search_params={"params": {"nprobe": 16}})
+    assert [h["id"] for h in probed[0]] == expected
+
+
+def test_deleted_rows_are_not_returned_and_bad_arguments_raise(client):
+    query = np.random.default_rng(3).normal(size=16).tolist()
+    top = brute_force(client, query, 1)[0]
+    client.delete("docs", [top])
+    assert top not in [h["id"] for h in client.search("docs", [query], limit=5)[0]]
+    with pytest.raises(ValueError):
+        client.search("docs", [query], limit=0)
+    with pytest.raises(ValueError):
+        client.search("docs", [query], filter="id in [1]")
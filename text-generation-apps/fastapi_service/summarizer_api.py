@@ -1,10 +1,26 @@
 # Import required libraries
 from fastapi import FastAPI          # FastAPI framework for building APIs
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel       # For defining request/response data shapes
-from openai import OpenAI            # OpenAI client
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+import json
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv       # To load API keys from a .env file
 
+# Make the repo-level `common` package importable however the app is launched
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.cache import cache_key, make_cache, normalize_text  # noqa: E402
+from common.history import count_tokens  # noqa: E402
+from common.http_client import OpenAIClientManager  # noqa: E402
+from common.mapreduce import MapReduceSummarizer  # noqa: E402
+from common.metrics import MetricsMiddleware, ServiceMetrics  # noqa: E402
+from common.prompt_layout import PromptLayout, usage_summary  # noqa: E402
+from common.singleflight import SingleFlight  # noqa: E402
+
 # ----------------------------
 # 1. Setup
 # ----------------------------
@@ -12,16 +28,81 @@ from dotenv import load_dotenv       # To load API keys from a .env file
 # Load environment variables from the .env file (must contain OPENAI_API_KEY)
 load_dotenv()
 
-# Initialize OpenAI client using the API key
-client = OpenAI(api_key="")
+# Pooled OpenAI client: created when the app starts, closed when it stops
+# (pool size, keep-alive and timeouts come from OPENAI_* environment variables)
+client_manager = OpenAIClientManager(asynchronous=False)
+client = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    async with client_manager.lifespan(os.getenv("OPENAI_API_KEY")) as opened:
+        client = opened
+        yield
+        client = None
+
+# Model used for every summary (part of the cache key)
+SUMMARY_MODEL = "gpt-4o-mini"       # You can also try "gpt-4o"
+
+# Result cache: in-process LRU (with TTL) in front of a SQLite file on disk
+summary_cache = make_cache(
+    max_entries=int(os.getenv("SUMMARY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600))),
+    disk_path=os.getenv("SUMMARY_CACHE_DB", "summary_cache.db") or None,
+)
+
+# Latency histograms, token counters and in-flight gauges for /metrics
+metrics = ServiceMetrics("summarizer")
+
+# Static system prompt: identical bytes on every request so the provider can
+# reuse its prompt cache; per-request settings go after the text instead
+SUMMARY_LAYOUT = PromptLayout(
+    system="You are a helpful assistant that summarizes text clearly and concisely.")
+
+# Long documents (above this many tokens) switch to map-reduce summarization
+LONG_DOC_TOKENS = int(os.getenv("SUMMARY_LONG_DOC_TOKENS", "6000"))
+
+
+def summarize_section(instruction: str, text: str, temperature: float) -> str:
+    """One map or reduce call for the long-document mode."""
+    with metrics.upstream("summarize_section", SUMMARY_MODEL):
+        response = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": text}
+            ],
+            temperature=temperature,
+            timeout=client_manager.timeout("summarize_section")
+        )
+    metrics.record_usage(SUMMARY_MODEL, response.usage)
+    return response.choices[0].message.content
+
+
+# Chunk-level results share the result cache, so editing one section of a
+# long document only re-summarizes that section
+long_summarizer = MapReduceSummarizer(
+    summarize_section,
+    cache=summary_cache,
+    model=SUMMARY_MODEL,
+    chunk_tokens=int(os.getenv("SUMMARY_CHUNK_TOKENS", "2000")),
+    max_workers=int(os.getenv("SUMMARY_MAP_WORKERS", "8")),
+)
+
+# Identical concurrent /summarize requests share one upstream call
+coalescer = SingleFlight(enabled=os.getenv("SUMMARY_COALESCE", "1") == "1")
 
 # Create the FastAPI app
 app = FastAPI(
     title="Summarizer API",
     version="1.0",
-    description="A simple API that summarizes text using OpenAI models."
+    description="A simple API that summarizes text using OpenAI models.",
+    lifespan=lifespan
 )
 
+# Time every request (upstream vs. overhead split, status, in-flight)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 # ----------------------------
 # 2. Define data models
 # ----------------------------
@@ -31,11 +112,20 @@ class SummarizeRequest(BaseModel):
     text: str                    # The text to summarize
     temperature: float = 0.3     # Controls creativity (0 = focused, 1 = creative)
     max_words: int = 100         # Maximum number of words in the summary
+    # Cache control:
+    #   "auto"   -> serve cached results only when temperature == 0 (deterministic)
+    #   "prefer" -> serve a cached result even for temperature > 0
+    #   "bypass" -> always call the model and do not store the result
+    cache: Literal["auto", "prefer", "bypass"] = "auto"
 
 # Response schema: what the API will return
 class SummarizeResponse(BaseModel):
     summary: str                 # The generated summary text
     word_count: int              # Number of words in the summary
+    cached: bool = False         # True when served from the result cache
+    mode: str = "single"         # "single" prompt or "map_reduce" for long documents
+    stages: Optional[List[dict]] = None  # Per-stage timings in map-reduce mode
+    usage: Optional[dict] = None  # Prompt / cached tokens and cache-hit ratio (single mode)
 
 # ----------------------------
 # 3. Health check endpoint
@@ -49,10 +139,80 @@ def health_check():
     """
     return {"status": "ok"}
 
+@app.get("/pool/stats")
+def pool_stats():
+    """Upstream connection pool usage for this worker."""
+    return client_manager.stats()
+
+@app.get("/coalesce/stats")
+def coalesce_stats():
+    """How many upstream calls were saved by sharing identical in-flight requests."""
+    return coalescer.stats.as_dict()
+
+@app.get("/metrics")
+def metrics_endpoint(format: str = "prometheus"):
+    """
+    Latency, upstream vs. overhead time, tokens per model and error counts.
+    Prometheus text by default; `?format=json` adds p50/p95/p99 estimates.
+    """
+    if format == "json":
+        return metrics.registry.snapshot()
+    return PlainTextResponse(metrics.registry.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit / miss / eviction counters for both cache tiers."""
+    return summary_cache.stats()
+
 # ----------------------------
 # 4. Summarization endpoint
 # ----------------------------
 
+def summary_cache_key(req: SummarizeRequest) -> str:
+    """Content-addressed key: same text + settings -> same key."""
+    return cache_key(normalize_text(req.text), SUMMARY_MODEL, req.temperature, req.max_words)
+
+def use_cached_result(req: SummarizeRequest) -> bool:
+    """Serve from cache when the settings are deterministic (or the caller opted in)."""
+    return req.cache == "prefer" or (req.cache == "auto" and req.temperature == 0)
+
+def map_reduce_result(done: dict) -> dict:
+    """Response body (and cache entry) for a finished map-reduce run."""
+    summary = done["summary"]
+    return {"summary": summary, "word_count": len(summary.split()),
+            "mode": "map_reduce", "stages": done["timings"]}
+
+def generate_summary(req: SummarizeRequest) -> dict:
+    """Call the model (single prompt, or map-reduce for long documents)."""
+
+    # Long documents: chunk, summarize chunks concurrently, then reduce
+    if count_tokens(req.text, SUMMARY_MODEL) > LONG_DOC_TOKENS:
+        return map_reduce_result(
+            long_summarizer.summarize(req.text, req.max_words, req.temperature, req.cache))
+
+    # Build the conversation: static system prompt, then the text, then the
+    # length instruction (last, so it never changes the cached prefix)
+    messages = SUMMARY_LAYOUT.build(
+        req.text, instructions=f"Summarize the text above in about {req.max_words} words.")
+
+    # Call the OpenAI API (timed and token-counted for /metrics)
+    with metrics.upstream("summarize", SUMMARY_MODEL):
+        response = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=messages,
+            temperature=req.temperature,
+            timeout=client_manager.timeout("summarize")
+        )
+    metrics.record_usage(SUMMARY_MODEL, response.usage)
+
+    # Extract the summary text from the response
+    summary = response.choices[0].message.content.strip()
+
+    # Return the summary, its word count and the prompt-cache usage
+    return {"summary": summary, "word_count": len(summary.split()),
+            "usage": usage_summary(response.usage)}
+
 @app.post("/summarize", response_model=SummarizeResponse)
 def summarize(req: SummarizeRequest):
     """
@@ -62,34 +222,74 @@ def summarize(req: SummarizeRequest):
       - text: the text to summarize
       - temperature: how creative the summary should be (0.0 - 1.0)
       - max_words: approximate length of the summary
+      - cache: "auto" | "prefer" | "bypass" (see SummarizeRequest)
 
     Output:
       - summary: the summarized text
       - word_count: number of words in the summary
+      - cached: whether the result came from the cache
+      - mode / stages: "map_reduce" and per-stage timings for long documents
+      - usage: prompt / cached tokens and the prompt-cache hit ratio
     """
 
     # Guard clause: return empty if no text is provided
     if not req.text.strip():
         return {"summary": "", "word_count": 0}
 
-    # Create the system instruction for the AI
-    system_message = f"You are a helpful assistant that summarizes text in about {req.max_words} words."
+    # Serve from cache when the settings are deterministic (or caller opted in)
+    key = summary_cache_key(req)
+    if use_cached_result(req):
+        hit = summary_cache.get(key)
+        if hit is not None:
+            return {**hit, "cached": True}
 
-    # Build the conversation: system + user
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": req.text}
-    ]
+    # Identical requests that arrive while this one runs wait for its result
+    result = coalescer.do(key, lambda: generate_summary(req))
 
-    # Call the OpenAI API
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",       # You can also try "gpt-4o"
-        messages=messages,
-        temperature=req.temperature
-    )
+    # Store every fresh result so later deterministic / opted-in calls can reuse it
+    if req.cache != "bypass":
+        summary_cache.set(key, result)
 
-    # Extract the summary text from the response
-    summary = response.choices[0].message.content.strip()
+    return {**result, "cached": False}
+
+
+# ----------------------------
+# 5. Streaming summarization (long documents)
+# ----------------------------
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/summarize/stream")
+def summarize_stream(req: SummarizeRequest):
+    """
+    Same as /summarize, streamed as Server-Sent Events.
+
+    Long documents report progress as they go:
+      - item:  one chunk (or reduce group) summary finished
+      - level: a whole map/reduce level finished, with its timing and summaries
+      - done:  the final summary and per-stage timings
+    Short documents produce a single `done` event.
+    """
+    def events():
+        try:
+            if req.text.strip() and count_tokens(req.text, SUMMARY_MODEL) > LONG_DOC_TOKENS:
+                key = summary_cache_key(req)
+                hit = summary_cache.get(key) if use_cached_result(req) else None
+                if hit is not None:
+                    yield sse_event("done", {**hit, "cached": True})
+                    return
+                for event in long_summarizer.iter_summarize(
+                        req.text, req.max_words, req.temperature, req.cache):
+                    if event["event"] == "done" and req.cache != "bypass":
+                        # Same entry /summarize stores, so either endpoint reuses it
+                        summary_cache.set(key, map_reduce_result(event))
+                    yield sse_event(event["event"], event)
+            else:
+                yield sse_event("done", summarize(req))
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
 
-    # Return both summary and word count
-    return {"summary": summary, "word_count": len(summary.split())}
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,8 +1,20 @@
 import streamlit as st
 from openai import OpenAI
 import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 
+# Make the repo-level `common` package importable
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from common.attachments import DOCUMENT_TYPES, iter_document_text  # noqa: E402
+from common.cache import make_cache  # noqa: E402
+from common.history import count_tokens  # noqa: E402
+from common.mapreduce import MapReduceSummarizer  # noqa: E402
+from common.prompt_layout import PromptLayout, format_usage, usage_summary  # noqa: E402
+from common.stream_render import StreamRenderer  # noqa: E402
+
 # Load environment variables
 load_dotenv()
 
@@ -18,7 +30,7 @@ st.set_page_config(
 
 @st.cache_resource
 def init_openai_client():
-    api_key = ""
+    api_key = os.getenv("OPENAI_API_KEY", "")
     if not api_key:
         st.error("Please set your OPENAI_API_KEY in a .env file")
         st.stop()
@@ -27,6 +39,87 @@ def init_openai_client():
 
 client = init_openai_client()
 
+# Above this many tokens the document is summarized with map-reduce
+LONG_DOC_TOKENS = 6000
+
+# The system prompt never changes, so repeated requests share a cached prefix;
+# the chosen length is appended after the text
+SUMMARY_LAYOUT = PromptLayout(
+    system="You are a helpful assistant that summarizes text clearly and concisely.")
+
+
+@st.cache_resource
+def init_long_summarizer(model: str):
+    """Map-reduce summarizer with a chunk cache that persists across reruns."""
+    def summarize_section(instruction, text, temperature):
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": text}
+            ],
+            temperature=temperature
+        )
+        return response.choices[0].message.content
+
+    cache = make_cache(max_entries=2048, disk_path="summary_chunks.db")
+    return MapReduceSummarizer(summarize_section, cache=cache, model=model)
+
+
+def text_stats(text: str):
+    """Character and word counts of the pasted text."""
+    return len(text), len(text.split())
+
+
+def show_map_reduce(events) -> str:
+    """Render map-reduce progress as sections finish and return the final summary."""
+    st.markdown("### Summary")
+    progress = st.progress(0.0, text="Summarizing sections...")
+    partials = st.expander("Partial summaries", expanded=False)
+    summary_container = st.empty()
+    read = finished = reused = 0
+    summary, done = "", None
+    for event in events:
+        if event["event"] == "read":
+            read = event["chunks"]
+        elif event["event"] == "item" and event["stage"] == "map":
+            finished += 1
+            reused += event["cached"]
+            # While a file is still being read the total is unknown (`of` is None)
+            total = event["of"] or max(read, finished)
+            progress.progress(finished / total,
+                              text=f"Section {finished} of {total}"
+                                   + ("" if event["of"] else " (still reading)"))
+            with partials:
+                st.markdown(f"**Section {event['index'] + 1}**"
+                            + (" (cached)" if event["cached"] else ""))
+                st.caption(event["summary"])
+            # Latest section summary as a preview until the final one arrives
+            summary_container.info(f"Section {event['index'] + 1}: {event['summary']}")
+        elif event["event"] == "level":
+            with partials:
+                st.markdown(f"**{event['stage'].title()} level {event['level']}** "
+                            f"— {event['items']} parts, {event['cache_hits']} cached, "
+                            f"{event['elapsed_ms']:.0f} ms")
+                if event["stage"] == "reduce":
+                    for part in event["summaries"]:
+                        st.caption(part)
+        elif event["event"] == "done":
+            summary, done = event["summary"], event
+    progress.empty()
+    summary_container.markdown(summary)
+    if done is not None:
+        st.caption(f"Map-reduce: {done['chunks']} sections ({reused} reused from cache), "
+                   f"{done['levels']} levels, {done['elapsed_ms'] / 1000:.1f}s")
+    return summary
+
+
+def counting_words(pieces, counter: dict):
+    """Pass document pieces through while counting their words."""
+    for piece in pieces:
+        counter["words"] += len(piece.split())
+        yield piece
+
 # App title and description
 st.title("📝 Text Generation App")
 st.markdown("Summarize any text with customizable length using AI")
@@ -66,24 +159,38 @@ with st.sidebar:
     )
 
 # Main content area
-st.markdown("### Enter Text to Summarize")
+input_mode = st.radio("Input", ["Paste text", "Upload file"], horizontal=True)
 
-# Text input area
-text_input = st.text_area(
-    "Paste your text here:",
-    height=200,
-    placeholder="Enter the text you want to summarize..."
-)
+text_input = ""
+uploaded_file = None
+word_count = 0
+if input_mode == "Paste text":
+    st.markdown("### Enter Text to Summarize")
+
+    # Text input area
+    text_input = st.text_area(
+        "Paste your text here:",
+        height=200,
+        placeholder="Enter the text you want to summarize..."
+    )
 
-# Character and word count
-if text_input:
-    char_count = len(text_input)
-    word_count = len(text_input.split())
-    st.caption(f"Characters: {char_count:,} | Words: {word_count:,}")
+    # Character and word count
+    if text_input:
+        char_count, word_count = text_stats(text_input)
+        st.caption(f"Characters: {char_count:,} | Words: {word_count:,}")
+else:
+    st.markdown("### Upload a File to Summarize")
+    uploaded_file = st.file_uploader("TXT, Markdown or PDF", type=list(DOCUMENT_TYPES))
+    st.caption("The file is read and summarized section by section. Sections summarized "
+               "before (e.g. in an earlier version of the file) come from the cache.")
+    if uploaded_file is not None:
+        st.caption(f"{uploaded_file.name} | {uploaded_file.size / 1024:,.0f} KB")
 
 # Summarize button
 if st.button("🔄 Summarize", type="primary", use_container_width=True):
-    if not text_input.strip():
+    if input_mode == "Upload file" and uploaded_file is None:
+        st.warning("Please upload a file to summarize.")
+    elif input_mode == "Paste text" and not text_input.strip():
         st.warning("Please enter some text to summarize.")
     else:
         with st.spinner("Generating summary..."):
@@ -98,32 +205,51 @@ if st.button("🔄 Summarize", type="primary", use_container_width=True):
                 else:  # Custom
                     length_instruction = f"in approximately {max_words} words"
 
-                system_message = f"You are a helpful assistant that summarizes text clearly and concisely. Summarize the given text {length_instruction}."
+                # Target length for map-reduce (long pasted text or uploaded files)
+                target_words = {"Short (1-2 sentences)": 40, "Medium (1 paragraph)": 120,
+                                "Long (2-3 paragraphs)": 300}.get(summary_length)
+                target_words = target_words or max_words
 
-                messages = [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": f"Please summarize the following text:\n\n{text_input}"}
-                ]
+                if uploaded_file is not None:
+                    # Uploaded file: read it in pieces and summarize each section
+                    # as soon as it is complete, while the rest is still being read
+                    counter = {"words": 0}
+                    pieces = counting_words(
+                        iter_document_text(uploaded_file.name, uploaded_file), counter)
+                    full_summary = show_map_reduce(init_long_summarizer(model).iter_summarize_stream(
+                        pieces, target_words, temperature))
+                    word_count = counter["words"]
+                elif count_tokens(text_input, model) > LONG_DOC_TOKENS:
+                    # Long document: stream partial summaries level by level
+                    full_summary = show_map_reduce(init_long_summarizer(model).iter_summarize(
+                        text_input, target_words, temperature))
+                else:
+                    messages = SUMMARY_LAYOUT.build(
+                        f"Please summarize the following text:\n\n{text_input}",
+                        instructions=f"Summarize the text above {length_instruction}.")
 
-                # Call OpenAI API
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,  # type: ignore
-                    temperature=temperature,
-                    stream=True
-                )
+                    # Call OpenAI API (the last chunk carries token usage)
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,  # type: ignore
+                        temperature=temperature,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
 
-                # Display summary with streaming
-                st.markdown("### Summary")
-                summary_container = st.empty()
-                full_summary = ""
+                    # Display summary with streaming (throttled, finished blocks rendered once)
+                    st.markdown("### Summary")
+                    renderer = StreamRenderer(st.container())
 
-                for chunk in response:
-                    if chunk.choices[0].delta.content is not None:
-                        full_summary += chunk.choices[0].delta.content
-                        summary_container.markdown(full_summary + "▌")
+                    usage = None
+                    for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content is not None:
+                            renderer.write(chunk.choices[0].delta.content)
+                        if chunk.usage is not None:
+                            usage = usage_summary(chunk.usage)
 
-                summary_container.markdown(full_summary)
+                    full_summary = renderer.close()
+                    st.caption(format_usage(usage))
 
                 # Summary statistics
                 summary_word_count = len(full_summary.split())
@@ -136,7 +262,7 @@ if st.button("🔄 Summarize", type="primary", use_container_width=True):
                     st.metric("Summary Words", f"{summary_word_count:,}")
                 with col3:
                     compression_ratio = round(
-                        (1 - summary_word_count / word_count) * 100, 1)
+                        (1 - summary_word_count / word_count) * 100, 1) if word_count else 0.0
                     st.metric("Compression", f"{compression_ratio}%")
 
                 # Copy button
@@ -156,7 +282,8 @@ st.markdown("Built with Streamlit and OpenAI API")
 # Help section
 with st.expander("ℹ️ How to use"):
     st.markdown("""
-    1. **Paste your text** in the text area above
+    1. **Paste your text** in the text area above, or **upload a file**
+       (TXT, Markdown or PDF; large files are summarized section by section)
     2. **Choose settings** in the sidebar:
        - Select an AI model
        - Choose summary length or set custom word count